@@ -1,28 +1,22 @@
 # pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
 # pylint: disable=missing-function-docstring,missing-class-docstring,import-error
-# pylint: disable=duplicate-code
+# pylint: disable=duplicate-code,wrong-import-order
 import os
 import sys
 import traceback
-import xmlrpc.client
-from xmlrpc.client import ServerProxy
 
+from discovery import ServerDirectory
+from rpc_client import ConnectionPool
 from dotenv import find_dotenv, load_dotenv
 from flask import Flask, Response, jsonify, make_response, request, send_file
 
 load_dotenv(find_dotenv() or None)
 
+# how long (in seconds) /api/wait asks the game server to hold a request
+LONG_POLL_TIMEOUT = 20
 
-class TimeoutTransport(xmlrpc.client.Transport):
-    def __init__(self, timeout=5, use_datetime=False):
-        super().__init__(use_datetime=use_datetime)
-        self.timeout = timeout
-
-    def make_connection(self, host):
-        conn = super().make_connection(host)
-        if hasattr(conn, 'timeout'):
-            conn.timeout = self.timeout
-        return conn
+# kept-alive connections to the game servers, shared by all request threads
+proxy_pool = ConnectionPool(max_idle=16, codec=os.getenv("RPC_CODEC", "json"))
 
 
 def handle_error(error, message: str, error_code: int = 500) -> Response:
@@ -33,9 +27,23 @@ def handle_error(error, message: str, error_code: int = 500) -> Response:
 
 
 def _new_proxy(timeout=5):
-    return ServerProxy(request.cookies.get("server_url"),
-                       allow_none=True,
-                       transport=TimeoutTransport(timeout=timeout))
+    return proxy_pool.proxy(request.cookies.get("server_url"), timeout=timeout)
+
+
+def _game_proxy(timeout=5):
+    """Proxy for the game RPCs. Games may be hosted by another server than the one the
+    player joined on, the game_server cookie holds its address once it is known."""
+    return proxy_pool.proxy(request.cookies.get("game_server")
+                            or request.cookies.get("server_url"), timeout=timeout)
+
+
+def _game_response(res) -> Response:
+    """Returns res as json. If the joined server forwarded the call to the server hosting
+    the game, remembers that server so the next calls go there directly."""
+    response = make_response(jsonify(res))
+    if isinstance(res, dict) and res.get("owner"):
+        response.set_cookie("game_server", res["owner"])
+    return response
 
 
 app = Flask(__name__, static_folder=None)
@@ -58,6 +66,8 @@ def api_join():
             response = make_response(jsonify(res))
             response.set_cookie("player_id", str(res[0]))
             response.set_cookie("game_id", str(res[1]))
+            if len(res) > 2:
+                response.set_cookie("game_server", res[2])
             return response
         return handle_error(res, "Error in /api/join", 400)
     except Exception as error:
@@ -68,9 +78,9 @@ def api_join():
 def api_start():
     """Called once the user presses the Srart New Game button."""
     try:
-        proxy = _new_proxy()
-        # server exposes `new_game`; call that RPC
-        res = proxy.new_game()
+        proxy = _game_proxy()
+        # games are created once two players are matched, this checks that ours exists
+        res = proxy.new_game(request.cookies.get("game_id"))
     except Exception as error:
         return handle_error(error, "Error in /api/start")
     return jsonify(res)
@@ -78,92 +88,99 @@ def api_start():
 
 @app.route('/api/fire', methods=['POST'])
 def api_fire():
-    """Called when the user clicks a coordinate on their opponent's grid."""
+    """Called when the user clicks a coordinate on their opponent's grid.
+    If the browser passes the last seq it has seen ("since"), the reply also contains
+    the changes after it under "state", so no separate /api/state call is needed."""
     data = request.get_json(force=True)
     row = data.get('row')
     col = data.get('col')
+    since = data.get('since')
     try:
-        proxy = _new_proxy()
+        proxy = _game_proxy()
         game_id = request.cookies.get("game_id")
         player_id = int(request.cookies.get("player_id")
                         ) if request.cookies.get("player_id") else None
-        res = proxy.fire(game_id, player_id, row, col)
+        if since is None:
+            res = proxy.fire(game_id, player_id, row, col)
+        else:
+            res = proxy.fire_and_get_state_since(game_id, player_id, row, col, int(since))
     except Exception as error:
         return handle_error(error, "Error in /api/fire")
-    return jsonify(res)
+    return _game_response(res)
 
 
 @app.route('/api/state', methods=['GET'])
 def api_state():
-    """Called automatically every 2 seconds once the game has started."""
+    """Called automatically every 2 seconds once the game has started.
+    If the browser passes the last seq it has seen (?since=N), only the changes after it
+    are returned."""
     try:
-        proxy = _new_proxy()
+        proxy = _game_proxy()
         game_id = request.cookies.get("game_id")
-        res = proxy.get_state(game_id)
+        since = request.args.get("since", type=int)
+        if since is None:
+            res = proxy.get_state(game_id)
+        else:
+            res = proxy.get_state_since(game_id, since)
     except Exception as error:
         return handle_error(error, "Error in /api/state")
-    return jsonify(res)
+    return _game_response(res)
+
+
+@app.route('/api/wait', methods=['GET'])
+def api_wait():
+    """Long-poll version of /api/state. Blocks until the game changes after ?since=N
+    or LONG_POLL_TIMEOUT seconds pass, then returns the same reply as /api/state?since=N."""
+    try:
+        since = request.args.get("since", type=int)
+        if since is None:
+            return handle_error("missing since", "Error in /api/wait", 400)
+        proxy = _game_proxy(timeout=LONG_POLL_TIMEOUT + 5)
+        game_id = request.cookies.get("game_id")
+        res = proxy.wait_for_change(game_id, since, LONG_POLL_TIMEOUT)
+    except Exception as error:
+        return handle_error(error, "Error in /api/wait")
+    return _game_response(res)
 
 
 def _proxy_for(server_url: str, timeout=2):
-    """Create a ServerProxy for a given server URL (adds http:// if missing)."""
+    """Create a proxy for a given server URL (adds http:// if missing)."""
     if not server_url:
         raise ValueError("server_url required")
     s = server_url.strip()
     if not s.startswith("http://") and not s.startswith("https://"):
         s = "http://" + s
-    return ServerProxy(s, allow_none=True, transport=TimeoutTransport(timeout=timeout))
+    return proxy_pool.proxy(s, timeout=timeout)
 
 
-def fetch_servers() -> dict:
-    """Called internally by the client to fetch a server list.
-    Loops through servers in SERVERLIST env variable and tries to fetch the server dict from them.
-    Remember to call this in a try-except block!"""
-    servers = []
-    for env_server in (os.getenv("SERVERLIST")).split(","):
-        try:
-            proxy = _proxy_for(env_server)
-            servers = list(proxy.send_server_dict().keys())
-            break
-        except Exception as _:
-            continue
+# known game servers and their ping latency, refreshed every DISCOVERY_TTL seconds
+server_directory = ServerDirectory(os.getenv("SERVERLIST", "").split(","), _proxy_for,
+                                   ttl=float(os.getenv("DISCOVERY_TTL", "30")))
 
-    if not servers:
-        raise RuntimeError(
-            "Could not get the server dict from any known server")
 
-    return servers
+def fetch_servers(refresh: bool = False) -> list[str]:
+    """Called internally by the client to fetch a server list, ranked by ping latency.
+    Served from server_directory's cache, refresh=True waits for a fresh list.
+    Remember to call this in a try-except block!"""
+    return server_directory.servers(refresh)
 
 
 @app.route('/api/ping_all', methods=['GET'])
 def api_ping_all():
-    """Ping every server from fetch_servers() and return success/error for each."""
-    servers = []
+    """Returns the latest ping result (success/error and latency) of every server.
+    ?refresh=1 pings them again before answering."""
     try:
-        try:
-            servers = fetch_servers()
-        except Exception as fetch_servers_error:
-            return handle_error(fetch_servers_error, "Error in fetch_servers()")
-
-        results = []
-        for s in servers:
-            try:
-                proxy = _proxy_for(s, timeout=2)
-                # call a lightweight RPC (ping). If you want full state, call get_state()
-                pong = proxy.ping()
-                results.append({"server": s, "ok": True, "pong": pong})
-            except Exception as e:
-                results.append({"server": s, "ok": False, "error": str(e)})
-        return jsonify(results)
+        return jsonify(server_directory.status(request.args.get("refresh") == "1"))
     except Exception as e:
         return handle_error(e, "Error in /api/ping_all")
 
 
 @app.route('/api/config', methods=['GET'])
 def api_config() -> Response:
-    """Returns server configuration such as available servers."""
+    """Returns server configuration such as available servers, fastest first.
+    ?refresh=1 fetches the server list again before answering."""
     try:
-        servers = fetch_servers()
+        servers = fetch_servers(request.args.get("refresh") == "1")
         config = {'servers': servers, 'default': servers[0]}
         return jsonify(config)
     except Exception as e:
@@ -172,14 +189,30 @@ def api_config() -> Response:
 
 @app.route('/api/statistics', methods=['GET'])
 def api_statistics():
+    """Returns one page of the leaderboard. Optional query parameters: order_by
+    (wins, win_rate or games_played), limit, and the cursor returned by the previous page."""
     try:
         proxy = _new_proxy()
-        res = proxy.get_statistics()
+        res = proxy.get_leaderboard(request.args.get("order_by", "wins"),
+                                    request.args.get("limit", 20, type=int),
+                                    request.args.get("cursor", ""))
     except Exception as error:
         return handle_error(error, "Error in /api/statistics")
     return jsonify(res)
 
 
+@app.route('/api/rank', methods=['GET'])
+def api_rank():
+    """Returns the leaderboard position of ?player_name=, or null if they have no statistics."""
+    try:
+        proxy = _new_proxy()
+        res = proxy.get_player_rank(request.args.get("player_name", ""),
+                                    request.args.get("order_by", "wins"))
+    except Exception as error:
+        return handle_error(error, "Error in /api/rank")
+    return jsonify({"rank": res})
+
+
 @app.route('/api/quit', methods=['POST'])
 def api_quit():
     """Resets cookies and sends player back to server select screen. 
@@ -188,11 +221,12 @@ def api_quit():
     try:
         game_id = request.cookies.get("game_id")
         player_id = request.cookies.get("player_id")
-        proxy = _new_proxy()
+        proxy = _game_proxy()
         res = proxy.quit(game_id, player_id)
         response = make_response(jsonify(res))
         response.set_cookie("player_id", "", expires=0)
         response.set_cookie("game_id", "", expires=0)
+        response.set_cookie("game_server", "", expires=0)
     except Exception as e:
         return handle_error(e, "Error in /api/quit")
     return response
@@ -0,0 +1,94 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-many-instance-attributes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable
+
+
+class ServerDirectory:
+    """Caches the list of game servers and how fast each one answers a ping.
+    The SERVERLIST entries and the servers they list are all queried at once, so
+    a dead server costs at most one timeout instead of one timeout per server.
+    Once the cache is older than ttl seconds, callers still get the cached list
+    while it is refreshed in the background."""
+
+    def __init__(self, serverlist: list[str], new_proxy: Callable, ttl: float = 30,
+                 timeout: float = 2):
+        self.serverlist = serverlist
+        self.new_proxy = new_proxy
+        self.ttl = ttl
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="discovery")
+        # ping results of every known server, fastest first
+        # Example:
+        # [{"server": "http://localhost:8000", "ok": True, "pong": "pong", "latency_ms": 3.1}]
+        self.results: list[dict] = []
+        self.refreshed_at = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def servers(self, refresh: bool = False) -> list[str]:
+        """Returns the known servers ranked by latency, servers that didn't answer last."""
+        return [result["server"] for result in self.status(refresh)]
+
+    def status(self, refresh: bool = False) -> list[dict]:
+        """Returns the latest ping result of every known server. The first call and
+        refresh=True wait for a refresh, otherwise a stale cache is refreshed in the background."""
+        if refresh or not self.results:
+            self.refresh()
+        elif time.monotonic() - self.refreshed_at > self.ttl:
+            with self.lock:
+                start = not self.refreshing
+                self.refreshing = True
+            if start:
+                self.pool.submit(self._refresh_in_background)
+        if not self.results:
+            raise RuntimeError("Could not get the server dict from any known server")
+        return self.results
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            print("Failed to refresh the server list:", e)
+        finally:
+            self.refreshing = False
+
+    def refresh(self) -> None:
+        servers = self._discover()
+        if not servers:
+            return
+        futures = {server: self.pool.submit(self._ping, server) for server in servers}
+        wait(futures.values(), timeout=self.timeout + 1)
+        results = []
+        for server, future in futures.items():
+            try:
+                results.append(future.result(timeout=0))
+            except Exception as e:
+                results.append({"server": server, "ok": False, "error": str(e) or "timed out"})
+        results.sort(key=lambda result: (not result["ok"], result.get("latency_ms", 0)))
+        self.results = results
+        self.refreshed_at = time.monotonic()
+
+    def _discover(self) -> list[str]:
+        """Asks every SERVERLIST entry for its server dict and merges the replies,
+        keeping the order in which the servers are first seen."""
+        futures = [self.pool.submit(self._server_dict, entry) for entry in self.serverlist]
+        wait(futures, timeout=self.timeout + 1)
+        servers = {}
+        for future in futures:
+            try:
+                servers.update(dict.fromkeys(future.result(timeout=0)))
+            except Exception:
+                continue
+        return list(servers)
+
+    def _server_dict(self, entry: str) -> list[str]:
+        return list(self.new_proxy(entry, timeout=self.timeout).send_server_dict())
+
+    def _ping(self, server: str) -> dict:
+        started = time.perf_counter()
+        pong = self.new_proxy(server, timeout=self.timeout).ping()
+        return {"server": server, "ok": True, "pong": pong,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
@@ -0,0 +1,150 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-few-public-methods
+import http.client
+import json
+import threading
+import xmlrpc.client
+
+# requests with this Content-Type are answered in JSON, see server/wire.py
+JSON_CONTENT_TYPE = "application/x-battleship-json"
+
+
+def _unpack_grid(obj: dict):
+    # grids are sent as one string per row: {"$grid": ["~S", "XO"]}
+    if len(obj) == 1 and "$grid" in obj:
+        return [list(row) for row in obj["$grid"]]
+    return obj
+
+
+def _json_result(data: bytes):
+    """Returns the result of a JSON reply, or raises its fault like XML-RPC would."""
+    reply = json.loads(data, object_hook=_unpack_grid)
+    if "fault" in reply:
+        raise xmlrpc.client.Fault(reply["fault"]["faultCode"], reply["fault"]["faultString"])
+    return reply["result"]
+
+
+class Connection(xmlrpc.client.Transport):
+    """One kept-alive HTTP/1.1 connection to a game server, used by one thread at a time."""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self.timeout
+        if conn.sock is not None:
+            # reused, the open socket needs the timeout of this call
+            conn.sock.settimeout(self.timeout)
+        return conn
+
+    def call_json(self, host: str, handler: str, method: str, params) -> tuple[bool, object]:
+        """Returns (True, result), or (False, None) if the server replied 200 in XML-RPC.
+        Any other reply that isn't JSON raises ProtocolError."""
+        body = json.dumps({"method": method, "params": list(params)},
+                          separators=(",", ":")).encode()
+        headers = {"Content-Type": JSON_CONTENT_TYPE, "Content-Length": str(len(body))}
+        try:
+            response = self._post(host, handler, body, headers)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # the server closed the idle connection, try once more on a new one
+            self.close()
+            response = self._post(host, handler, body, headers)
+        data = response.read()
+        content_type = response.getheader("Content-Type", "")
+        if response.status == 200 and content_type.startswith("text/xml"):
+            return False, None
+        # e.g. an error page from a proxy, which says nothing about the server's codecs
+        if response.status != 200 or content_type != JSON_CONTENT_TYPE:
+            raise xmlrpc.client.ProtocolError(host + handler, response.status,
+                                              response.reason, dict(response.getheaders()))
+        return True, _json_result(data)
+
+    def _post(self, host: str, handler: str, body: bytes, headers: dict):
+        conn = self.make_connection(host)
+        conn.request("POST", handler, body, headers)
+        return conn.getresponse()
+
+
+class SafeConnection(Connection, xmlrpc.client.SafeTransport):
+    pass
+
+
+class ServerProxy:
+    """Calls methods on one game server like xmlrpc.client.ServerProxy, on a connection
+    borrowed from the pool for each call, so it can be shared between threads."""
+
+    def __init__(self, pool: "ConnectionPool", address: str, timeout: float):
+        self._pool = pool
+        self._address = address
+        self._timeout = timeout
+
+    def __getattr__(self, method):
+        return lambda *params: self._pool.call(self._address, self._timeout, method, params)
+
+
+class ConnectionPool:
+    """Kept-alive connections from the client to the game servers, up to max_idle idle
+    ones per address. Calls use the servers' compact JSON encoding (see server/wire.py)
+    and fall back to XML-RPC for servers that don't know it. The servers call each other
+    with server/rpc_pool.py, this only has to send calls and read their replies."""
+
+    def __init__(self, max_idle: int = 4, codec: str = "json"):
+        self.max_idle = max_idle
+        # "json" for the compact codec, "xml" for plain XML-RPC
+        self.codec = codec
+        # servers that replied in XML-RPC to a JSON call
+        self.xml_only: set[str] = set()
+        self.idle: dict[str, list[Connection]] = {}
+        self.lock = threading.Lock()
+
+    def proxy(self, address: str, timeout: float = 5) -> ServerProxy:
+        return ServerProxy(self, address, timeout)
+
+    def call(self, address: str, timeout: float, method: str, params: tuple):
+        with self.lock:
+            idle = self.idle.setdefault(address, [])
+            connection = idle.pop() if idle else None
+        if connection is None:
+            connection = (SafeConnection if address.startswith("https://")
+                          else Connection)(timeout)
+        connection.timeout = timeout
+        try:
+            result = self._call(connection, address, method, params)
+        except xmlrpc.client.Fault:
+            # an error reply, the connection can still be used
+            self._release(address, connection)
+            raise
+        except Exception:
+            connection.close()
+            self._close_idle(address)
+            raise
+        self._release(address, connection)
+        return result
+
+    def _call(self, connection: Connection, address: str, method: str, params: tuple):
+        if self.codec == "json" and address not in self.xml_only:
+            host, _, path = address.split("://", 1)[-1].partition("/")
+            understood, result = connection.call_json(host, "/" + (path or "RPC2"),
+                                                      method, params)
+            if understood:
+                return result
+            self.xml_only.add(address)
+        proxy = xmlrpc.client.ServerProxy(address, allow_none=True, transport=connection)
+        return getattr(proxy, method)(*params)
+
+    def _release(self, address: str, connection: Connection) -> None:
+        with self.lock:
+            idle = self.idle.setdefault(address, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _close_idle(self, address: str) -> None:
+        """After a failed call the server's other connections are most likely dead too."""
+        with self.lock:
+            idle, self.idle[address] = self.idle.get(address, []), []
+        for connection in idle:
+            connection.close()
@@ -0,0 +1,306 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,protected-access
+# pylint: disable=too-few-public-methods,too-many-locals
+import asyncio
+import functools
+import socket
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+import metrics
+import wire
+
+# RPCs that only touch memory, answered on the event loop without a thread hop.
+# Not get_game_counts, which asks the other worker processes with blocking calls
+INLINE_METHODS = {
+    "ping", "heartbeat", "get_state", "get_state_since", "new_game", "get_server_config",
+    "send_server_dict", "receive_server_dict", "get_load",
+    "handle_bully_election_msg", "handle_bully_coordinator_msg", "get_metrics",
+}
+
+# RPCs whose first parameter is a game_id, forwarded if the game is hosted elsewhere
+GAME_METHODS = {
+    "get_state", "get_state_since", "wait_for_change", "fire", "fire_and_get_state_since",
+    "quit",
+}
+
+# seconds a kept-alive connection may stay idle, like KeepAliveRequestHandler.timeout
+IDLE_TIMEOUT = 30
+
+RPC_PATHS = ("/", "/RPC2")
+
+
+async def _read_message(reader: asyncio.StreamReader) -> tuple[str, dict, bytes] | None:
+    """Reads one HTTP/1.1 request or response with a Content-Length body.
+    Returns (start line, lowercased headers, body), or None if the connection was closed."""
+    start = await reader.readline()
+    if not start:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return start.decode("latin-1").rstrip("\r\n"), headers, body
+
+
+class AsyncPeerClient:
+    """Calls other servers from the event loop over kept-alive connections, using the
+    compact JSON codec. Servers that answer in XML-RPC are called through fallback
+    (a blocking call) on the executor instead."""
+
+    def __init__(self, fallback, executor: ThreadPoolExecutor, max_idle: int = 16):
+        self.fallback = fallback
+        self.executor = executor
+        self.max_idle = max_idle
+        self.idle: dict[str, list] = {}
+        self.xml_only: set[str] = set()
+
+    async def call(self, address: str, method: str, params, timeout: float = 5):
+        if address in self.xml_only:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.fallback, address, method, params, timeout)
+        url = urlsplit(address)
+        body = wire.encode_request(method, params)
+        request = (f"POST {url.path or '/RPC2'} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                   f"Content-Type: {wire.CONTENT_TYPE}\r\n"
+                   f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        # like Transport.request, retry once if the kept-alive connection was closed
+        for attempt in (0, 1):
+            reader, writer, reused = await self._connect(address, url, timeout)
+            try:
+                writer.write(request)
+                message = await asyncio.wait_for(_read_message(reader), timeout)
+                if message is None:
+                    raise ConnectionError(f"{address} closed the connection")
+                break
+            except ConnectionError:
+                writer.close()
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+        start, headers, data = message
+        idle = self.idle.setdefault(address, [])
+        if len(idle) < self.max_idle:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+        # the start line of a response, "HTTP/1.1 200 OK"
+        fields = start.split(" ", 2)
+        status = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 0
+        content_type = headers.get("content-type", "")
+        if status == 200 and content_type.startswith("text/xml"):
+            # an older server that only knows XML-RPC
+            self.xml_only.add(address)
+            return await self.call(address, method, params, timeout)
+        if status != 200 or content_type != wire.CONTENT_TYPE:
+            # e.g. an error page from a proxy in front of the peer
+            raise xmlrpc.client.ProtocolError(address, status, start, headers)
+        return wire.decode_response(data)
+
+    async def _connect(self, address: str, url, timeout: float) -> tuple:
+        """Returns (reader, writer, True) for an idle connection to address,
+        or (reader, writer, False) for a new one."""
+        idle = self.idle.setdefault(address, [])
+        while idle:
+            reader, writer, idle_since = idle.pop()
+            # the peer closes connections that were idle for IDLE_TIMEOUT seconds
+            if time.monotonic() - idle_since < IDLE_TIMEOUT - 1 and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            url.hostname, url.port or (443 if url.scheme == "https" else 80),
+            ssl=url.scheme == "https"), timeout)
+        return reader, writer, False
+
+
+class AsyncRPCServer:
+    """Serves the registered GameServer from one asyncio event loop instead of one thread
+    per connection. Answers XML-RPC and the compact JSON codec (wire.py) on the same
+    kept-alive connections as the threaded server. Long polls wait on the game's watchers
+    without a thread, calls for games hosted elsewhere are forwarded without blocking,
+    and RPCs that may block (database, other servers) run on a small executor.
+    A worker process passes in its already bound public sockets (socks) and the private
+    socket the other workers call it on (internal_sock), see workers.py."""
+
+    def __init__(self, address: tuple[str, int], workers: int = 32,
+                 long_poll_timeout: float = 25, socks: list[socket.socket] | None = None,
+                 internal_sock: socket.socket | None = None):
+        # bound right away like the threaded server, so peers that call while the
+        # GameServer is starting up wait in the backlog instead of being refused
+        self.sockets = socks or [socket.create_server(address, backlog=4096)]
+        self.internal_socket = internal_sock
+        self.long_poll_timeout = long_poll_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc")
+        self.instance = None
+        self.peers = None
+        self.connections = 0
+
+    def register_instance(self, instance) -> None:
+        self.instance = instance
+        self.peers = AsyncPeerClient(self._blocking_call, self.executor)
+        instance.metrics.gauge("open_connections", lambda: self.connections,
+                               "Client connections open on the event loop.")
+
+    def _blocking_call(self, address: str, method: str, params, timeout: float):
+        return getattr(self.instance._new_proxy(address, timeout=timeout), method)(*params)
+
+    def serve_forever(self) -> None:
+        asyncio.run(self._serve_forever())
+
+    async def _serve_forever(self) -> None:
+        server = await asyncio.start_server(self._handle_connection, sock=self.sockets[0],
+                                            backlog=4096)
+        for sock in self.sockets[1:]:
+            await asyncio.start_server(self._handle_connection, sock=sock, backlog=4096)
+        if self.internal_socket:
+            await asyncio.start_server(
+                functools.partial(self._handle_connection, internal=True),
+                sock=self.internal_socket, backlog=4096)
+        async with server:
+            await server.serve_forever()
+
+    def server_close(self) -> None:
+        for sock in self.sockets:
+            sock.close()
+        if self.internal_socket:
+            self.internal_socket.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter, internal: bool = False) -> None:
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(_read_message(reader), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError,
+                        ValueError):
+                    return
+                if message is None:
+                    return
+                start, headers, body = message
+                if start.count(" ") != 2:
+                    return
+                request_method, path, version = start.split(" ")
+                if request_method == "GET" and path == "/metrics" and not internal:
+                    status, content_type, response = (
+                        200, metrics.CONTENT_TYPE, self.instance.metrics_text().encode())
+                elif request_method != "POST":
+                    status, content_type, response = 501, "text/plain", b""
+                elif path not in RPC_PATHS:
+                    status, content_type, response = 404, "text/plain", b""
+                else:
+                    status, content_type, response = await self._respond(
+                        headers.get("content-type", ""), body, internal)
+                keep_alive = (version == "HTTP/1.1"
+                              and headers.get("connection", "").lower() != "close")
+                connection = "" if keep_alive else "Connection: close\r\n"
+                writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                             f"Content-Type: {content_type}\r\n"
+                             f"Content-Length: {len(response)}\r\n"
+                             f"{connection}\r\n".encode() + response)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            # the client went away, or the server is shutting down
+            return
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _respond(self, content_type: str, body: bytes,
+                       internal: bool = False) -> tuple[int, str, bytes]:
+        """Decodes a request in the codec given by its Content-Type, calls it and
+        encodes the reply (or fault) in the same codec."""
+        use_json = content_type == wire.CONTENT_TYPE
+        try:
+            if use_json:
+                method, params = wire.decode_request(body)
+            else:
+                params, method = xmlrpc.client.loads(body)
+        except Exception:
+            return 500, "text/plain", b""
+        # calls from the other worker processes are counted by the worker they came to
+        started = time.perf_counter()
+        error = True
+        try:
+            result = await self._call(method, list(params), internal)
+            if self.instance.workers and not internal:
+                result = self.instance.workers.tag_owner(method, params, result)
+            if use_json:
+                response = 200, wire.CONTENT_TYPE, wire.encode_response(result)
+            else:
+                response = 200, "text/xml", xmlrpc.client.dumps(
+                    (result,), methodresponse=True, allow_none=True).encode()
+            error = False
+            return response
+        except Exception as e:
+            fault = e if isinstance(e, xmlrpc.client.Fault) else xmlrpc.client.Fault(
+                1, f"{type(e)}:{e}")
+            if use_json:
+                return 200, wire.CONTENT_TYPE, wire.encode_fault(fault.faultCode,
+                                                                 fault.faultString)
+            return 200, "text/xml", xmlrpc.client.dumps(fault, allow_none=True).encode()
+        finally:
+            if not internal:
+                self.instance.metrics.observe_rpc(method, time.perf_counter() - started, error)
+
+    async def _call(self, method: str, params: list, internal: bool = False):
+        instance = self.instance
+        timeout = self.long_poll_timeout + 5 if method == "wait_for_change" else 5
+        if instance.workers and (worker := instance._worker_for(method, params, internal)):
+            # handled by another worker process of this server
+            if not internal:
+                instance.request_rate.tick()
+            return await self.peers.call(worker, method, params, timeout)
+        if method in GAME_METHODS and params:
+            owner = instance._owner_of(params[0])
+            if owner:
+                instance.request_rate.tick()
+                result = await self.peers.call(owner, method, params, timeout)
+                if isinstance(result, dict):
+                    result["owner"] = owner
+                return result
+        if method == "wait_for_change":
+            if not internal:
+                instance.request_rate.tick()
+            return await self._wait_for_change(*params)
+        if method in INLINE_METHODS:
+            return instance._dispatch(method, params, internal)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, instance._dispatch, method, params, internal)
+
+    async def _wait_for_change(self, game_id, seq: int, timeout: float = 25):
+        """Same reply as GameServer.wait_for_change, but waits on the event loop.
+        Only called for games this process hosts, see _call()."""
+        reply = self.instance.get_state_since(game_id, seq)
+        if not reply.get("not_modified"):
+            return reply
+        loop = asyncio.get_running_loop()
+        changed = loop.create_future()
+
+        def on_change():
+            loop.call_soon_threadsafe(lambda: changed.done() or changed.set_result(None))
+
+        game = self.instance.games.get(game_id)
+        game.watch(on_change)
+        try:
+            # the game may have changed between the first check and watch()
+            if game.seq == int(seq):
+                timeout = min(max(float(timeout), 0), self.long_poll_timeout)
+                await asyncio.wait_for(changed, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            game.unwatch(on_change)
+        return self.instance.get_state_since(game_id, seq)
@@ -2,72 +2,326 @@
 # pylint: disable=missing-function-docstring,missing-class-docstring
 # pylint: disable=too-many-instance-attributes,too-many-arguments,too-many-positional-arguments,too-many-return-statements
 import random
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+
+# name: (rows, cols, ship_sizes)
+GAME_MODES = {
+    "standard": (5, 5, [3, 2]),
+    "classic": (10, 10, [5, 4, 3, 3, 2]),
+    "large": (20, 20, [5, 5, 4, 4, 3, 3, 3, 2, 2, 2]),
+    "tournament": (50, 50, [6, 6, 5, 5, 5, 4, 4, 4, 4, 3, 3, 3, 3, 3, 2, 2, 2, 2, 2, 2]),
+}
+
+
+@lru_cache(maxsize=None)
+def ship_slots(rows: int, cols: int, size: int) -> tuple[int, ...]:
+    """Returns the bitmask of every horizontal and vertical position
+    a ship of the given size can occupy on an empty rows x cols board."""
+    slots = []
+    horizontal = (1 << size) - 1
+    vertical = sum(1 << (i * cols) for i in range(size))
+    for r in range(rows):
+        for c in range(cols):
+            if c + size <= cols:
+                slots.append(horizontal << (r * cols + c))
+            if size > 1 and r + size <= rows:
+                slots.append(vertical << (r * cols + c))
+    return tuple(slots)
+
+
+class Board:
+    """One player's board stored as integer bitmasks.
+    Cell (r, c) maps to bit r * cols + c in the ships, hits and misses layers,
+    and ships_left counts the ship cells that have not been hit yet."""
+    __slots__ = ("rows", "cols", "ships", "hits", "misses", "ships_left")
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.ships = 0
+        self.hits = 0
+        self.misses = 0
+        self.ships_left = 0
+
+    def bit(self, r: int, c: int) -> int:
+        return 1 << (r * self.cols + c)
+
+    def in_bounds(self, r: int, c: int) -> bool:
+        return 0 <= r < self.rows and 0 <= c < self.cols
+
+    def place_mask(self, mask: int, size: int) -> None:
+        self.ships |= mask
+        self.ships_left += size
+
+    def already_fired(self, r: int, c: int) -> bool:
+        return bool((self.hits | self.misses) & self.bit(r, c))
+
+    def receive_shot(self, r: int, c: int) -> bool:
+        """Marks a shot at (r, c) and returns True if it hit a ship."""
+        b = self.bit(r, c)
+        if self.ships & b:
+            self.hits |= b
+            self.ships_left -= 1
+            return True
+        self.misses |= b
+        return False
+
+    def all_sunk(self) -> bool:
+        return self.ships_left == 0
+
+    def to_grid(self, show_ships: bool = True) -> list[list[str]]:
+        """Renders the board as the list-of-lists view used by get_state().
+        With show_ships=False only shots are shown (the opponent's tracking view)."""
+        grid = []
+        b = 1
+        for _ in range(self.rows):
+            row = []
+            for _ in range(self.cols):
+                if self.hits & b:
+                    row.append("X")
+                elif self.misses & b:
+                    row.append("O")
+                elif show_ships and self.ships & b:
+                    row.append("S")
+                else:
+                    row.append("~")
+                b <<= 1
+            grid.append(row)
+        return grid
+
+
+# nodes _search_fleet may visit before giving up on a fleet, about a second of work
+SEARCH_BUDGET = 200_000
+
+
+def place_fleet(board: Board, ship_sizes: list[int], attempts: int = 20) -> None:
+    """Places every ship on an empty board by sampling from the slots that are still free.
+    Random greedy placement is retried a few times, after which a bounded exhaustive search
+    decides the crowded cases. Raises ValueError if the fleet cannot fit on the board."""
+    sizes = sorted(ship_sizes, reverse=True)
+    if sum(sizes) > board.rows * board.cols or (
+            sizes and sizes[0] > max(board.rows, board.cols)):
+        raise ValueError(f"ships {ship_sizes} do not fit on a "
+                         f"{board.rows}x{board.cols} board")
+
+    for _ in range(attempts):
+        occupied = 0
+        chosen = []
+        for size in sizes:
+            free = [m for m in ship_slots(board.rows, board.cols, size) if not m & occupied]
+            if not free:
+                break
+            mask = random.choice(free)
+            occupied |= mask
+            chosen.append((mask, size))
+        else:
+            break
+    else:
+        chosen = _search_fleet(board.rows, board.cols, sizes)
+
+    for mask, size in chosen:
+        board.place_mask(mask, size)
+
+
+def _search_fleet(rows: int, cols: int, sizes: list[int],
+                  budget: int = SEARCH_BUDGET) -> list[tuple[int, int]]:
+    """Decides the cells in row-major order: the first undecided cell is either left empty
+    or is the top-left cell of one of the remaining ships. Ships of the same size are
+    interchangeable, so every placement is found only once, and a branch is cut as soon as
+    the remaining ships need more cells than are left. Returns (mask, size) per ship, or
+    raises ValueError if there is no placement or none was found within budget nodes."""
+    if not sizes:
+        return []
+    cells = rows * cols
+    counts = {size: sizes.count(size) for size in set(sizes)}
+    # decided cells (covered or left empty), cells still needed, chosen (mask, size)
+    decided, needed, chosen = 0, sum(sizes), []
+    # options not tried yet at every depth, each an (added mask, ship size or 0) pair
+    stack = [None]
+    visited = 0
+    while stack:
+        if stack[-1] is None:
+            visited += 1
+            if visited > budget:
+                raise ValueError(f"no placement of ships {sizes} found on a "
+                                 f"{rows}x{cols} board within {budget} steps")
+            stack[-1] = _search_options(rows, cols, counts, decided, needed, cells)
+        options = stack[-1]
+        if not options:
+            stack.pop()
+            if chosen and len(stack) <= len(chosen):
+                mask, size = chosen.pop()
+                decided &= ~mask
+                if size:
+                    counts[size] += 1
+                    needed += size
+            continue
+        mask, size = options.pop()
+        decided |= mask
+        chosen.append((mask, size))
+        if size:
+            counts[size] -= 1
+            needed -= size
+            if not needed:
+                return [choice for choice in chosen if choice[1]]
+        stack.append(None)
+    raise ValueError(f"ships {sizes} do not fit on a {rows}x{cols} board")
+
+
+def _search_options(rows: int, cols: int, counts: dict[int, int], decided: int,
+                    needed: int, cells: int) -> list[tuple[int, int]]:
+    free = cells - decided.bit_count()
+    if needed > free:
+        return []
+    # lowest undecided cell
+    cell = (~decided & (decided + 1)).bit_length() - 1
+    r, c = divmod(cell, cols)
+    options = [(1 << cell, 0)] if needed < free else []
+    for size, count in counts.items():
+        if not count:
+            continue
+        if c + size <= cols:
+            mask = ((1 << size) - 1) << cell
+            if not mask & decided:
+                options.append((mask, size))
+        if size > 1 and r + size <= rows:
+            mask = sum(1 << (cell + i * cols) for i in range(size))
+            if not mask & decided:
+                options.append((mask, size))
+    random.shuffle(options)
+    return options
 
 
 class BattleshipGame:
-    def __init__(self):
-        self.grid_size = 5
-        self.ship_sizes = [3, 2]
+    def __init__(self, rows: int = 5, cols: int | None = None,
+                 ship_sizes: list[int] | None = None):
+        self.rows = rows
+        self.cols = rows if cols is None else cols
+        self.ship_sizes = [3, 2] if ship_sizes is None else list(ship_sizes)
+        # move sequence number, increased on every change visible to clients
+        self.seq = 0
+        # held while a move is applied or the state is read, so concurrent fire/quit
+        # calls on the same game are serialized while other games are unaffected
+        self.lock = threading.RLock()
+        # notified whenever seq changes, see wait_for_change()
+        self.changed = threading.Condition(self.lock)
+        # callbacks run whenever seq changes, for waiters that can't block on changed
+        self.watchers = set()
         self.reset()
         self.current_player = 1
         self.winner = None
         self.game_canceled = False
 
     def reset(self):
-        self.p1_grid = self.create_grid()
-        self.p2_grid = self.create_grid()
-        self.p1_tracking = self.create_grid()
-        self.p2_tracking = self.create_grid()
+        self.p1_board = self.create_board()
+        self.p2_board = self.create_board()
         self.current_player = 1
         self.winner = None
         self.game_canceled = False
+        # shots fired since the last reset, in seq order
+        # Example:
+        # {"seq": 4, "player": 1, "row": 2, "col": 3, "result": "hit"}
+        self.moves = []
+        # deltas can only be computed from this seq onwards
+        self.base_seq = self.seq + 1
+        self._advance()
 
-    def create_grid(self):
-        return [["~" for _ in range(self.grid_size)] for _ in range(self.grid_size)]
-
-    def _place_ship_coords(self, grid, size, r, c, direction):
-        coords = []
-        for i in range(size):
-            rr = r + (i if direction == "V" else 0)
-            cc = c + (i if direction == "H" else 0)
-            if rr < 0 or rr >= self.grid_size or cc < 0 or cc >= self.grid_size:
-                return False
-            if grid[rr][cc] == "S":
-                return False
-            coords.append((rr, cc))
-        for rr, cc in coords:
-            grid[rr][cc] = "S"
-        return True
+    def create_board(self) -> Board:
+        return Board(self.rows, self.cols)
 
-    def _auto_place_for(self, grid):
-        for size in self.ship_sizes:
-            placed = False
-            attempts = 0
-            while not placed and attempts < 200:
-                r = random.randrange(self.grid_size)
-                c = random.randrange(self.grid_size)
-                direction = random.choice(["H", "V"])
-                if self._place_ship_coords(grid, size, r, c, direction):
-                    placed = True
-                attempts += 1
-            if not placed:
-                for _ in range(10):
-                    pass
-        return True
+    @classmethod
+    def from_mode(cls, mode: str) -> "BattleshipGame":
+        """Creates a game using one of the board presets in GAME_MODES."""
+        if mode not in GAME_MODES:
+            raise ValueError(f"unknown game mode: {mode}")
+        rows, cols, ship_sizes = GAME_MODES[mode]
+        return cls(rows, cols, ship_sizes)
+
+    def to_snapshot(self) -> dict:
+        """Returns the whole game as a compact JSON-friendly dict, see from_snapshot()."""
+        with self.lock:
+            return {
+                "rows": self.rows,
+                "cols": self.cols,
+                "ship_sizes": self.ship_sizes,
+                "seq": self.seq,
+                "base_seq": self.base_seq,
+                "current_player": self.current_player,
+                "winner": self.winner,
+                "canceled": self.game_canceled,
+                # ships, hits and misses bitmasks in hex, then ships_left
+                "boards": [[f"{board.ships:x}", f"{board.hits:x}", f"{board.misses:x}",
+                            board.ships_left] for board in (self.p1_board, self.p2_board)],
+                "moves": [[move["seq"], move["player"], move["row"], move["col"],
+                           move["result"] == "hit"] for move in self.moves],
+            }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "BattleshipGame":
+        """Rebuilds a game saved with to_snapshot(), including its seq and move history.
+        Skips __init__, which would set up empty boards only to overwrite them."""
+        game = cls.__new__(cls)
+        game.rows = data["rows"]
+        game.cols = data["cols"]
+        game.ship_sizes = data["ship_sizes"]
+        game.lock = threading.RLock()
+        game.changed = threading.Condition(game.lock)
+        game.watchers = set()
+        boards = []
+        for ships, hits, misses, ships_left in data["boards"]:
+            board = Board(game.rows, game.cols)
+            board.ships = int(ships, 16)
+            board.hits = int(hits, 16)
+            board.misses = int(misses, 16)
+            board.ships_left = ships_left
+            boards.append(board)
+        game.p1_board, game.p2_board = boards[0], boards[1]
+        game.moves = [{"seq": seq, "player": player, "row": row, "col": col,
+                       "result": "hit" if hit else "miss"}
+                      for seq, player, row, col, hit in data["moves"]]
+        game.seq = data["seq"]
+        game.base_seq = data["base_seq"]
+        game.current_player = data["current_player"]
+        game.winner = data["winner"]
+        game.game_canceled = data["canceled"]
+        return game
+
+    @property
+    def grid_size(self) -> int | None:
+        """Side length of the board, kept in get_state() for clients from before rows and
+        cols. Only square boards have one, it is None for the others."""
+        return self.rows if self.rows == self.cols else None
+
+    # list-of-lists views of the boards, kept for callers that expect the old grids
+    @property
+    def p1_grid(self):
+        return self.p1_board.to_grid()
+
+    @property
+    def p2_grid(self):
+        return self.p2_board.to_grid()
+
+    @property
+    def p1_tracking(self):
+        return self.p2_board.to_grid(show_ships=False)
+
+    @property
+    def p2_tracking(self):
+        return self.p1_board.to_grid(show_ships=False)
 
     def start_game(self):
         self.reset()
-        self._auto_place_for(self.p1_grid)
-        self._auto_place_for(self.p2_grid)
-        return True
-
-    def _all_ships_sunk(self, grid):
-        for row in grid:
-            if "S" in row:
-                return False
+        place_fleet(self.p1_board, self.ship_sizes)
+        place_fleet(self.p2_board, self.ship_sizes)
         return True
 
     def fire(self, player_id: int, row, col):
+        with self.lock:
+            return self._fire(player_id, row, col)
+
+    def _fire(self, player_id: int, row, col):
         if self.current_player != player_id:
             return {"error": f"It is currently player {self.current_player}'s turn."}
         if self.winner is not None:
@@ -79,41 +333,39 @@ class BattleshipGame:
         except (ValueError, TypeError):
             return {"error": "invalid coordinates"}
 
-        if not (0 <= row < self.grid_size and 0 <= col < self.grid_size):
-            return {"error": "out of bounds"}
+        opponent_board = self.p2_board if player_id == 1 else self.p1_board
 
-        if player_id == 1:
-            opponent_grid = self.p2_grid
-            tracking = self.p1_tracking
-        else:
-            opponent_grid = self.p1_grid
-            tracking = self.p2_tracking
+        if not opponent_board.in_bounds(row, col):
+            return {"error": "out of bounds"}
 
-        if tracking[row][col] in ["X", "O"]:
+        if opponent_board.already_fired(row, col):
             return {"error": "already fired"}
 
-        if opponent_grid[row][col] == "S":
-            tracking[row][col] = "X"
-            opponent_grid[row][col] = "X"
-            result = "hit"
-        else:
-            tracking[row][col] = "O"
-            opponent_grid[row][col] = "O"
-            result = "miss"
+        result = "hit" if opponent_board.receive_shot(row, col) else "miss"
+        self.moves.append({"seq": self.seq + 1, "player": player_id,
+                           "row": row, "col": col, "result": result})
 
-        if self._all_ships_sunk(opponent_grid):
+        if opponent_board.all_sunk():
             self.winner = player_id
+            self._advance()
             return {"result": result, "winner": self.winner, "next_player": None}
 
         self.current_player = 1 if self.current_player == 2 else 2
+        self._advance()
         return {"result": result, "winner": None, "next_player": self.current_player}
 
     def cancel_game(self, player_id: int):
         """Called when a player leaves the game."""
-        self.game_canceled = True
+        with self.lock:
+            self.game_canceled = True
+            self._advance()
         return f"Player {player_id} has left the game."
 
     def get_state(self):
+        with self.lock:
+            return self._get_state()
+
+    def _get_state(self):
         return {
             "p1_grid": self.p1_grid,
             "p2_grid": self.p2_grid,
@@ -123,5 +375,53 @@ class BattleshipGame:
             "winner": self.winner,
             "game_canceled": self.game_canceled,
             "grid_size": self.grid_size,
+            "rows": self.rows,
+            "cols": self.cols,
             "ship_sizes": self.ship_sizes,
+            "seq": self.seq,
+        }
+
+    def _advance(self):
+        with self.changed:
+            self.seq += 1
+            self.changed.notify_all()
+            for callback in list(self.watchers):
+                callback()
+
+    def watch(self, callback) -> None:
+        """Calls callback (without arguments, with the game locked) on every change
+        until unwatch(callback). Used by the asyncio runtime instead of wait_for_change()."""
+        with self.lock:
+            self.watchers.add(callback)
+
+    def unwatch(self, callback) -> None:
+        with self.lock:
+            self.watchers.discard(callback)
+
+    def wait_for_change(self, seq: int, timeout: float):
+        """Blocks until seq moves past the client's seq or the timeout passes,
+        then returns the same reply as get_state_since()."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.seq != seq, timeout)
+        return self.get_state_since(seq)
+
+    def get_state_since(self, seq: int):
+        """Returns only what changed after the client's last seen seq: a not_modified reply
+        if nothing did, the shots fired since then, or the full state if seq is unknown
+        (e.g. from before the last reset)."""
+        with self.lock:
+            return self._get_state_since(seq)
+
+    def _get_state_since(self, seq: int):
+        if seq == self.seq:
+            return {"seq": self.seq, "not_modified": True}
+        if not self.base_seq <= seq < self.seq:
+            return self.get_state()
+        start = bisect_right(self.moves, seq, key=lambda move: move["seq"])
+        return {
+            "seq": self.seq,
+            "shots": self.moves[start:],
+            "current_player": self.current_player,
+            "winner": self.winner,
+            "game_canceled": self.game_canceled,
         }
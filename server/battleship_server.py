@@ -3,53 +3,142 @@
 # pylint: disable=too-many-instance-attributes,too-many-public-methods,wrong-import-order
 # pylint: disable=duplicate-code
 import os
+import signal
 import sys
 import threading
-import xmlrpc
+import time
+from concurrent.futures import ThreadPoolExecutor
 from socketserver import ThreadingMixIn
-from uuid import uuid4
-from xmlrpc.client import ServerProxy
-from xmlrpc.server import SimpleXMLRPCServer
+from xmlrpc.server import SimpleXMLRPCServer, resolve_dotted_attribute
 
 import database as DB
+from async_server import AsyncRPCServer
 from battleship_game import BattleshipGame
+from cluster import HashRing, LoadTable, RequestRate
+from election import FailureDetector, any_replied_ok
+from game_store import GameStore
+from journal import GameJournal
+from logs import get_logger, setup_logging, stop_logging
+from matchmaking import Lobby
+from metrics import Metrics
+from replication import ReplicationDispatcher
+from rpc_handler import KeepAliveRequestHandler
+from rpc_pool import ProxyPool
+from scheduler import Scheduler
+from workers import InternalCalls, WorkerGroup, run_workers
 from dotenv import find_dotenv, load_dotenv
 
 load_dotenv(find_dotenv() or None)
 
+log = get_logger("server")
+games_log = get_logger("games")
+lobby_log = get_logger("lobby")
+statistics_log = get_logger("statistics")
+cluster_log = get_logger("cluster")
+election_log = get_logger("election")
 
-class ThreadedXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
-    pass
+# longest time (in seconds) a wait_for_change call is held open
+LONG_POLL_TIMEOUT = 25
+
+# seconds between heartbeats to the main server, how long each may take, and how many
+# have to fail in a row before the main server is considered down
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "0.5"))
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "1"))
+SUSPICION_THRESHOLD = int(os.getenv("SUSPICION_THRESHOLD", "2"))
+
+# how long (in seconds) an election waits for an OK from a lower-numbered server,
+# and then for that server's coordinator announcement
+ELECTION_TIMEOUT = 1
+COORDINATOR_TIMEOUT = 3
+
+# how often (in seconds) non-main servers pull statistics changes from the main server
+STATISTICS_CATCH_UP_INTERVAL = 60
+
+# how new games are spread over the cluster: least_loaded, hash or local
+GAME_PLACEMENT = os.getenv("GAME_PLACEMENT", "least_loaded")
 
+# directory of the on-disk journal of live games ("" turns it off), how often (in seconds)
+# buffered journal records are written and how often a snapshot of all games is taken
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "game_journal")
+JOURNAL_FLUSH_INTERVAL = 0.05
+JOURNAL_SNAPSHOT_INTERVAL = 60
 
-class TimeoutTransport(xmlrpc.client.Transport):
-    def __init__(self, timeout=5, use_datetime=False):
-        super().__init__(use_datetime=use_datetime)
-        self.timeout = timeout
+# seconds a matched game is reported as waiting if it hasn't reached its owner yet
+PLACING_GRACE = 5
+
+# returned by the state RPCs while player 1 is still in the lobby
+WAITING_FOR_OPPONENT = {"error": "Waiting for an opponent to join."}
+
+
+class ThreadedXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    def _dispatch(self, method, params):
+        """Records every call in the metrics of the registered GameServer. Calls from
+        the other worker processes (InternalCalls) are counted by the worker they came to."""
+        metrics = getattr(self.instance, "metrics", None)
+        if metrics is None:
+            return super()._dispatch(method, params)
+        started = time.perf_counter()
+        error = True
+        try:
+            result = super()._dispatch(method, params)
+            error = False
+            return result
+        finally:
+            metrics.observe_rpc(method, time.perf_counter() - started, error)
 
-    def make_connection(self, host):
-        conn = super().make_connection(host)
-        if hasattr(conn, "timeout"):
-            conn.timeout = self.timeout
-        return conn
+
+def rpc_methods(cls) -> set[str]:
+    """Names of the methods the RPC servers can call on an instance of cls: the public
+    ones, like SimpleXMLRPCServer.register_instance resolves them."""
+    return {name for name in dir(cls)
+            if not name.startswith("_") and callable(getattr(cls, name))}
 
 
 class GameServer:
-    def __init__(self):
-        self.games = {}
-        # matches game_id to a dictionary containing both players' name and player number
-        # Example:
-        # 9f2a0d11-2efd: {1: "Juhani", 2: "VP"}
-        self.game_to_player_name = {}
+    def __init__(self, workers: WorkerGroup | None = None):
+        # the worker processes of this server if there are several, see workers.py
+        self.workers = workers
+        primary = workers is None or workers.is_primary
+
+        # records every game, shot and cancel on disk so live games survive a restart,
+        # each worker process journals the games it owns in its own directory
+        journal_dir = (os.path.join(JOURNAL_DIR, f"worker-{workers.index}")
+                       if JOURNAL_DIR and workers else JOURNAL_DIR)
+        self.journal = (GameJournal(journal_dir, fsync=os.getenv("JOURNAL_FSYNC", "") == "1")
+                        if journal_dir else None)
+
+        # live games and their players, evicted once finished, canceled or abandoned
+        self.games = GameStore(
+            finished_ttl=float(os.getenv("FINISHED_GAME_TTL", "300")),
+            idle_ttl=float(os.getenv("IDLE_GAME_TTL", "1800")),
+            on_remove=self.journal.record_drop if self.journal else None,
+        )
+        self._recover_games()
 
-        self.wait_for_second = False
-        self.new_game_id = 0
+        # players waiting for an opponent, optionally matched by their win rate
+        self.lobby = Lobby(skill_matching=os.getenv("SKILL_MATCHING", "") == "1")
+        # games matched in the lobby and the time.monotonic() they were matched. A call for
+        # one can get here before its owner (another server or worker process) has created
+        # it, so for PLACING_GRACE seconds they are still reported as waiting
+        self.placing: dict[str, float] = {}
 
-        self.first_player_name = ""
-        self.second_player_name = ""
+        # board size and fleet used for new games, one of battleship_game.GAME_MODES
+        self.game_mode = os.getenv("GAME_MODE", "standard")
 
-        if not DB.scores_exist():
-            DB.init_database(insert_test_data=False)
+        # games this server matched but placed on another server
+        # Example:
+        # 9f2a0d11-2efd: ["http://localhost:8001", <time.monotonic() of the last forwarded call>]
+        self.remote_games: dict[str, list] = {}
+        # RPCs per second handled by this server, reported in heartbeats
+        self.request_rate = RequestRate()
+        # latency, calls and errors of every RPC, database time and the gauges registered
+        # in _register_gauges(), served at /metrics and by get_metrics()
+        self.metrics = Metrics(methods=rpc_methods(GameServer))
+        DB.set_query_observer(self.metrics.observe_database)
+        # latest load report of every server, used to place new games
+        self.load_table = LoadTable(max_age=max(6 * HEARTBEAT_INTERVAL, 3))
+
+        DB.prepare_database()
 
         # matches every known server's address to their Bully Algorithm number
         # Example:
@@ -65,125 +154,449 @@ class GameServer:
         )
         self.server_address_to_server_ba_number[self.address] = self.ba_number
 
-        self.connection_created = False
-        self.election_underway = False
-        self.main_server_address = ""
-        # ask servers in SERVERLIST for the main server's address (if not found, starts an election)
-        self.find_main_server()
+        # kept-alive connections to other servers, see _new_proxy()
+        self.proxy_pool = ProxyPool(codec=os.getenv("RPC_CODEC", "json"))
 
-        # fetch server dict from main server on startup
-        self._sync_server_dict_from_main()
+        # runs heartbeats, statistics catch-up, game eviction, election timeouts
+        # and replication retries
+        self.scheduler = Scheduler()
 
-        # polls main server every 10 seconds
-        self.poll_main_server()
+        # sends broadcasts to other servers from background workers. The other worker
+        # processes send their statistics changes to the primary, which replicates them
+        self.dispatcher = ReplicationDispatcher(
+            self._new_proxy, workers=16,
+            statistics_method="receive_statistics_update" if primary else "sync_statistics",
+            call_later=self.scheduler.call_later)
 
-        # replaces local statistics table with the main server's statistics table every 15 minutes
-        threading.Timer(900, self.get_all_statistics_from_main).start()
+        self.connection_created = False
+        self.election_underway = False
 
-    def new_game(self):
-        create_game = BattleshipGame()
+        # held while checking and setting election_underway
+        self.election_lock = threading.Lock()
+        # sends election messages to all lower-numbered servers at once
+        self.election_pool = ThreadPoolExecutor(max_workers=16,
+                                                thread_name_prefix="election")
+        # suspects the main server once SUSPICION_THRESHOLD heartbeats in a row fail
+        self.failure_detector = FailureDetector(SUSPICION_THRESHOLD)
+        self.main_server_address = ""
+        if primary:
+            # ask servers in SERVERLIST for the main server's address
+            # (if not found, starts an election)
+            self.find_main_server()
+
+            # fetch server dict from main server on startup
+            self._sync_server_dict_from_main()
+
+        # measures this server's load, which the heartbeats carry to the main server
+        self._report_load()
+        self.scheduler.every(HEARTBEAT_INTERVAL, self._report_load, "load report")
+
+        if primary:
+            # sends a heartbeat to the main server every HEARTBEAT_INTERVAL seconds
+            self.scheduler.every(HEARTBEAT_INTERVAL, self.poll_main_server, "heartbeat")
+
+            # applies the main server's statistics changes now and then every minute
+            self.scheduler.every(STATISTICS_CATCH_UP_INTERVAL, self.catch_up_statistics,
+                                 "statistics catch-up")
+        if workers:
+            # stops this worker if the process that started it is gone
+            self.scheduler.every(1, workers.check_parent, "parent check")
+
+        # evicts finished, canceled and idle games every minute
+        self.scheduler.every(60, self.evict_games, "game eviction", first_delay=60)
+
+        if self.journal:
+            # writes buffered journal records in batches, and compacts the journal into
+            # a snapshot now (after recovery) and then every JOURNAL_SNAPSHOT_INTERVAL seconds
+            self.scheduler.every(JOURNAL_FLUSH_INTERVAL, self.journal.flush, "journal flush")
+            self.scheduler.every(JOURNAL_SNAPSHOT_INTERVAL, self._snapshot_games,
+                                 "journal snapshot")
+
+        self._register_gauges()
+
+    def _dispatch(self, method: str, params: tuple, internal: bool = False):
+        """Called by the XML-RPC server for every request, counts it for the load report.
+        With several worker processes, calls that belong to another worker are passed on
+        to it. internal is True for calls from the other workers."""
+        if not internal:
+            self.request_rate.tick()
+        if self.workers and (worker := self._worker_for(method, params, internal)):
+            timeout = LONG_POLL_TIMEOUT + 5 if method == "wait_for_change" else 5
+            result = getattr(self._new_proxy(worker, timeout=timeout), method)(*params)
+        else:
+            result = resolve_dotted_attribute(self, method, False)(*params)
+        if self.workers and not internal:
+            return self.workers.tag_owner(method, params, result)
+        return result
+
+    def _register_gauges(self) -> None:
+        gauge = self.metrics.gauge
+        gauge("games", lambda: len(self.games), "Games held in memory by this server.")
+        gauge("remote_games", lambda: len(self.remote_games),
+              "Games this server matched that are hosted on another server.")
+        gauge("lobby_depth", self.lobby.depth, "Players waiting for an opponent.")
+        gauge("is_main_server", self.is_main_server, "1 if this server is the main server.")
+        gauge("known_servers", lambda: len(self.server_address_to_server_ba_number),
+              "Servers in this server's server dict.")
+        gauge("heartbeat_misses", lambda: self.failure_detector.misses,
+              "Heartbeats to the main server that failed in a row.")
+        gauge("server_report_age_seconds",
+              lambda: {address: report["age"]
+                       for address, report in self.load_table.snapshot().items()},
+              "Age of the latest load report of every live server.", label="server")
+        gauge("replication_queue_length", self.dispatcher.queue_length,
+              "Messages waiting to be sent to other servers.")
+        gauge("scheduler_task_runs",
+              lambda: {name: task["runs"] for name, task in self.scheduler.stats().items()},
+              "Runs of every periodic task.", label="task")
+        gauge("scheduler_task_skipped",
+              lambda: {name: task["skipped"] for name, task in self.scheduler.stats().items()},
+              "Runs of every periodic task skipped because the previous one was still running.",
+              label="task")
+
+    def get_metrics(self) -> dict:
+        """Returns the RPC latencies, call and error counts and the gauges of this server
+        (of this worker process, with several)."""
+        return self.metrics.snapshot()
+
+    def metrics_text(self) -> str:
+        """The same metrics in Prometheus' text format, served at GET /metrics."""
+        return self.metrics.render()
+
+    def _worker_for(self, method: str, params, internal: bool) -> str | None:
+        """Returns the address of the worker process that has to handle the call,
+        or None if this one does."""
+        return self.workers.route(method, params, internal,
+                                  lambda game_id: game_id in self.games
+                                  or game_id in self.remote_games)
+
+    def _create_game(self, game_id: str, first_player_name: str, second_player_name: str):
+        create_game = BattleshipGame.from_mode(self.game_mode)
         create_game.start_game()
-        self.games[self.new_game_id] = create_game
-        self.game_to_player_name[self.new_game_id] = {
-            1: self.first_player_name,
-            2: self.second_player_name,
+        player_names = {
+            1: first_player_name,
+            2: second_player_name,
         }
-        return True
+        # added before it is recorded, so a snapshot taken in between still has it, and
+        # recorded with the game locked, so no shot can be recorded before it
+        with create_game.lock:
+            self.games.add(game_id, create_game, player_names)
+            if self.journal:
+                self.journal.record_new(game_id, create_game, player_names)
+
+    def _recover_games(self) -> None:
+        """Restores the games that were live when the server last stopped from the journal."""
+        if not self.journal:
+            return
+        started = time.monotonic()
+        recovered = self.journal.recover()
+        for game_id, (game, player_names) in recovered.items():
+            self.games.add(game_id, game, player_names)
+        if recovered:
+            games_log.info("Recovered %d games from the journal in %.2f s.",
+                           len(recovered), time.monotonic() - started)
+
+    def _snapshot_games(self) -> None:
+        self.journal.snapshot(self.games.items)
+
+    def host_game(self, game_id: str, first_player_name: str, second_player_name: str) -> str:
+        """Called by the server that matched the players when it places their game here."""
+        self._create_game(game_id, first_player_name, second_player_name)
+        return "OK"
+
+    def _host_game_here(self, game_id: str, first_player_name: str,
+                        second_player_name: str) -> None:
+        """Creates the game on this server, in the worker process that owns it."""
+        owner = self.workers.owner_of(game_id) if self.workers else None
+        if owner and owner != self.workers.address:
+            self._new_proxy(owner, timeout=3).host_game(
+                game_id, first_player_name, second_player_name)
+        else:
+            self._create_game(game_id, first_player_name, second_player_name)
+
+    def _place_game(self, game_id: str, first_player_name: str, second_player_name: str) -> str:
+        """Creates the game on the server chosen by GAME_PLACEMENT and returns its address.
+        Falls back to this server if the chosen one can't be reached."""
+        if GAME_PLACEMENT == "hash":
+            owner = HashRing(self.load_table.live()).owner(game_id) or self.address
+        elif GAME_PLACEMENT == "least_loaded":
+            owner = self.load_table.least_loaded(prefer=self.address)
+        else:
+            owner = self.address
+        if owner != self.address:
+            try:
+                self._new_proxy(owner, timeout=3).host_game(
+                    game_id, first_player_name, second_player_name)
+                self.remote_games[game_id] = [owner, time.monotonic()]
+                self.load_table.added_game(owner)
+                return owner
+            except Exception as e:
+                games_log.warning("Failed to place game %s on %s: %s", game_id, owner, e)
+        self._host_game_here(game_id, first_player_name, second_player_name)
+        self.load_table.added_game(self.address)
+        # with WORKER_PORTS, players go straight to the worker that owns the game
+        return (self.workers and self.workers.direct_address_of(game_id)) or self.address
+
+    def _owner_of(self, game_id) -> str | None:
+        """Returns the address of the server hosting game_id if it was placed elsewhere."""
+        if game_id in self.games:
+            return None
+        placement = self.remote_games.get(game_id)
+        if placement is None:
+            return None
+        placement[1] = time.monotonic()
+        return placement[0]
+
+    def _forward(self, owner: str, method: str, *args, timeout: float = 5):
+        """Calls method on the server hosting the game. Replies carry the owner's address
+        so the client can send its next requests there directly."""
+        result = getattr(self._new_proxy(owner, timeout=timeout), method)(*args)
+        if isinstance(result, dict):
+            result["owner"] = owner
+        return result
+
+    def new_game(self, game_id=None):
+        """Called when a player presses Start New Game. Games are created as soon as
+        two players are matched, so this only checks that game_id is known."""
+        return (game_id is None or self.lobby.is_waiting(game_id) or game_id in self.placing
+                or game_id in self.games or game_id in self.remote_games)
+
+    def _report_load(self) -> None:
+        """Updates this server's own entry in the load table."""
+        self.load_table.update(self.address, self._load_report())
+
+    def _load_report(self) -> dict:
+        load = {"games": self.games.counts()["live"], "rpc_rate": self.request_rate.rate()}
+        if self.workers:
+            # the load of the whole server, summed over its worker processes
+            load = self.workers.share_load(load)
+        return load
+
+    def get_load(self) -> dict:
+        """Returns the load reports of all servers this server has heard from recently."""
+        return self.load_table.snapshot()
+
+    def evict_games(self):
+        """Periodically removes finished, canceled and abandoned games from memory."""
+        evicted = self.games.evict_expired()
+        now = time.monotonic()
+        for game_id, matched_at in list(self.placing.items()):
+            if now - matched_at >= PLACING_GRACE:
+                self.placing.pop(game_id, None)
+        for game_id, (_, last_used) in list(self.remote_games.items()):
+            if now - last_used >= self.games.idle_ttl:
+                self.remote_games.pop(game_id, None)
+        if evicted:
+            games_log.info("Evicted %d games, %d in memory.", evicted, len(self.games))
+
+    def get_game_counts(self) -> dict:
+        """Returns the number of live, finished and evicted games on this server.
+        The primary worker adds up the counts of all worker processes."""
+        counts = self.games.counts()
+        if self.workers and self.workers.is_primary:
+            for worker in self.workers.others():
+                other = self._new_proxy(worker, timeout=3).get_game_counts()
+                for key in ("live", "finished", "evicted"):
+                    counts[key] += other[key]
+                for reason, evicted in other["evicted_by_reason"].items():
+                    counts["evicted_by_reason"][reason] += evicted
+        return counts
 
     def register_player(self, player_name: str):
-        if not self.wait_for_second:
-            self.wait_for_second = True
-            self.first_player_name = player_name
-            self.new_game_id = str(uuid4())
-            print(1, self.new_game_id)
-            return (1, self.new_game_id)
-        self.wait_for_second = False
-        self.second_player_name = player_name
-        self.new_game()
-        print(2, self.new_game_id)
-        return (2, self.new_game_id)
+        """Puts the player in the lobby. The first player of a pair gets player_id 1
+        and waits, the game is created when the second player is matched with them.
+        Also returns the address of the server hosting the game, see _place_game."""
+        skill = self._skill_of(player_name) if self.lobby.skill_matching else None
+        player_id, game_id, opponent_name = self.lobby.join(player_name, skill,
+                                                            on_match=self._matched)
+        owner = self.address
+        if player_id == 2:
+            owner = self._place_game(game_id, opponent_name, player_name)
+        lobby_log.debug("Player joined", extra={"player_id": player_id, "game_id": game_id,
+                                                "owner": owner})
+        return (player_id, game_id, owner)
+
+    def _matched(self, game_id: str) -> None:
+        """Called by the lobby while player 1 is still in it, so their game is reported as
+        waiting until it has been created."""
+        self.placing[game_id] = time.monotonic()
+
+    def _skill_of(self, player_name: str) -> float | None:
+        """Returns the player's win rate from the statistics table, or None if unknown."""
+        if not player_name:
+            return None
+        stats = DB.get_player_stats(player_name)
+        if not stats or stats["games_won"] + stats["games_lost"] == 0:
+            return None
+        return stats["games_won"] / (stats["games_won"] + stats["games_lost"])
+
+    def _waiting(self, game_id) -> bool:
+        if game_id in self.games:
+            return False
+        # checked in the order a game moves through them: a matched game is in placing
+        # before it leaves the lobby, and in games before it leaves placing
+        if self.lobby.is_waiting(game_id):
+            return True
+        matched_at = self.placing.get(game_id)
+        if matched_at is not None and game_id not in self.games:
+            return time.monotonic() - matched_at < PLACING_GRACE
+        return False
 
     def get_state(self, game_id):
-        return self.games[game_id].get_state()
+        if owner := self._owner_of(game_id):
+            return self._forward(owner, "get_state", game_id)
+        if self._waiting(game_id):
+            return WAITING_FOR_OPPONENT
+        return self.games.get(game_id).get_state()
+
+    def get_state_since(self, game_id, seq: int):
+        """Returns only the shots fired after seq, or a not_modified reply if nothing changed."""
+        if owner := self._owner_of(game_id):
+            return self._forward(owner, "get_state_since", game_id, seq)
+        if self._waiting(game_id):
+            return WAITING_FOR_OPPONENT
+        return self.games.get(game_id).get_state_since(int(seq))
+
+    def wait_for_change(self, game_id, seq: int, timeout: float = LONG_POLL_TIMEOUT):
+        """Long-poll version of get_state_since: holds the request until the game
+        changes after seq or the timeout (capped at LONG_POLL_TIMEOUT seconds) passes."""
+        timeout = min(max(float(timeout), 0), LONG_POLL_TIMEOUT)
+        if owner := self._owner_of(game_id):
+            return self._forward(owner, "wait_for_change", game_id, seq, timeout,
+                                 timeout=timeout + 5)
+        if self._waiting(game_id):
+            return WAITING_FOR_OPPONENT
+        return self.games.get(game_id).wait_for_change(int(seq), timeout)
 
     def fire(self, game_id, player_id: int, row, col):
-        result = self.games[game_id].fire(player_id, row, col)
+        if owner := self._owner_of(game_id):
+            return self._forward(owner, "fire", game_id, player_id, row, col)
+        game = self.games.get(game_id)
+        with game.lock:
+            result = game.fire(player_id, row, col)
+            # recorded while the game is locked, so the journal keeps the order of the shots
+            if self.journal and "error" not in result:
+                self.journal.record_fire(game_id, player_id, int(row), int(col))
         if ("winner" in result.keys()
             and "error" not in result.keys()
                 and result["winner"] is not None):
             # game is over, record statistics for both players
             winner = result["winner"]
             loser = 1 if winner == 2 else 2
-            winning_player_name = self.game_to_player_name[game_id][winner]
-            losing_player_name = self.game_to_player_name[game_id][loser]
+            winning_player_name = self.games.get_player_name(game_id, winner)
+            losing_player_name = self.games.get_player_name(game_id, loser)
             self.record_statistics(winning_player_name, losing_player_name)
 
         return result
 
+    def fire_and_get_state_since(self, game_id, player_id: int, row, col, seq: int):
+        """fire() followed by get_state_since(seq) in one call, so a client doesn't need
+        a second round trip to see the result of its shot. The changes are under "state"."""
+        if owner := self._owner_of(game_id):
+            return self._forward(owner, "fire_and_get_state_since",
+                                 game_id, player_id, row, col, seq)
+        result = self.fire(game_id, player_id, row, col)
+        result["state"] = self.games.get(game_id).get_state_since(int(seq))
+        return result
+
     def quit(self, game_id, player_id: int):
-        result = self.games[game_id].cancel_game(player_id)
+        if self.lobby.cancel(game_id):
+            return f"Player {player_id} has left the lobby."
+        if owner := self._owner_of(game_id):
+            return self._forward(owner, "quit", game_id, player_id)
+        game = self.games.get(game_id)
+        with game.lock:
+            result = game.cancel_game(player_id)
+            if self.journal:
+                self.journal.record_cancel(game_id, player_id)
         return result
 
     def record_statistics(
         self, winning_player_name: str, losing_player_name: str
     ) -> None:
-        """Checks if players exist in the database and creates 
-        an entry for them if needed, then increases games_lost or games_won."""
-        if len(winning_player_name) > 0:
-            if DB.get_player_stats(winning_player_name) is None:
-                DB.create_database_entry(winning_player_name)
-            DB.record_game_results(winning_player_name, won=True)
-        if len(losing_player_name) > 0:
-            if DB.get_player_stats(losing_player_name) is None:
-                DB.create_database_entry(losing_player_name)
-            DB.record_game_results(losing_player_name, won=False)
-        if len(winning_player_name) > 0 or len(losing_player_name) > 0:
-            self.sync_statistics(winning_player_name, losing_player_name)
-
-    def sync_statistics(
-        self, winning_player_name: str, losing_player_name: str
-    ) -> None:
-        """Fetches updated statistics for both players and
-        sends them to the main server (if not main) or broadcasts them (if main)."""
+        """Records the match for both players in one transaction (creating their entries
+        if needed), then replicates the updated rows."""
+        updated = DB.record_match(winning_player_name, losing_player_name)
+        if updated:
+            self.sync_statistics(updated)
+
+    def sync_statistics(self, updated: list[dict]) -> None:
+        """Sends updated statistics rows to the main server (if not main)
+        or broadcasts them (if main). Other worker processes leave this to the primary."""
         try:
-            updated = []
-            for name in [winning_player_name, losing_player_name]:
-                if not name:
-                    continue
-                s = DB.get_player_stats(name)
-                if s:
-                    updated.append(s)
-            if not updated:
-                return
-            if self.is_main_server():
+            if self.workers and not self.workers.is_primary:
+                self.dispatcher.send_statistics([self.workers.primary], updated)
+            elif self.is_main_server():
                 # If we're main, broadcast the updated stats to all peers
                 self._broadcast_statistics(updated)
             else:
                 # Send to main; main will rebroadcast
-                proxy = self._new_proxy(self.main_server_address, timeout=3)
-                proxy.receive_statistics_update(updated)
+                self.dispatcher.send_statistics([self.main_server_address], updated)
         except Exception as e:
-            print(f"[{self.address}] Failed to sync statistics: {e}")
+            statistics_log.warning("Failed to sync statistics: %s", e)
 
     def get_statistics(self):
         return DB.get_all_stats()
 
-    def get_all_statistics_from_main(self):
-        """Every normal server calls this once in a while to replace their statistics table with 
-        the main server's. This ensures that any server will be back to a relatively up-to-date 
-        state if they lose connection for a while."""
-        if self.is_main_server():
-            # if this is the main server, nothing happens
-            return
+    def get_leaderboard(self, order_by: str = "wins", limit: int = 20, cursor: str = ""):
+        """Returns one page of the leaderboard, see database.get_leaderboard."""
+        return DB.get_leaderboard(order_by, min(max(int(limit), 1), 100), cursor)
+
+    def get_player_rank(self, player_name: str, order_by: str = "wins"):
+        """Returns the player's position on the leaderboard, or None if not found."""
+        return DB.get_player_rank(player_name, order_by)
+
+    def catch_up_statistics(self):
+        """Every normal server calls this once in a while to apply the statistics changes the
+        main server has made since the last call. This ensures that any server will be back to
+        an up-to-date state if they lose connection for a while, at a cost that depends on
+        the number of changes instead of the size of the table."""
+        if not self.is_main_server():
+            try:
+                applied = self._catch_up_statistics_from_main()
+                if applied:
+                    statistics_log.info("Applied %d statistics changes from main.", applied)
+            except Exception as e:
+                statistics_log.warning("Failed to catch up statistics from main: %s", e)
         try:
-            proxy = self._new_proxy(self.main_server_address)
-            statistics = proxy.get_statistics()
-            DB.upsert_stats(statistics)
-            print("Replaced the statistics table with main server's statistics.")
+            DB.prune_changes()
         except Exception as e:
-            print(f"[{self.address}] Failed to get all statistics from main: {e}")
-
-        threading.Timer(900, self.get_all_statistics_from_main).start()
+            statistics_log.warning("Failed to prune the statistics change log: %s", e)
+
+    def _catch_up_statistics_from_main(self) -> int:
+        """Pulls change log pages from the main server until caught up. Falls back to
+        copying the whole table if main's log has been pruned past our version or
+        belongs to a different database (e.g. after a new main server was elected).
+        Returns the number of rows applied."""
+        proxy = self._new_proxy(self.main_server_address)
+        log_id = DB.get_replication_state("main_log_id", "")
+        version = DB.get_replication_state("main_version", 0)
+        applied = 0
+        while True:
+            reply = proxy.get_statistics_changes(version, log_id)
+            if reply["full"]:
+                statistics = proxy.get_statistics() or []
+                DB.upsert_stats(statistics)
+                DB.set_replication_state("main_log_id", reply["log_id"])
+                DB.set_replication_state("main_version", reply["version"])
+                return applied + len(statistics)
+            changes = reply["changes"]
+            if not changes:
+                return applied
+            DB.upsert_stats(changes)
+            version = changes[-1]["version"]
+            DB.set_replication_state("main_version", version)
+            applied += len(changes)
+
+    def get_statistics_changes(self, since_version: int, log_id: str = "") -> dict:
+        """Returns the statistics changes after since_version from this server's change log.
+        full is True if the caller has to copy the whole table instead, because log_id
+        doesn't match this server's log or the changes have been pruned."""
+        if log_id != DB.get_replication_state("log_id"):
+            reply = DB.get_changes_since(0, limit=0)
+            reply["full"] = True
+            return reply
+        return DB.get_changes_since(int(since_version))
 
     def find_main_server(self):
         """Loops through servers in SERVERLIST until it finds the address of the main server.
@@ -198,7 +611,7 @@ class GameServer:
             except Exception:
                 continue
 
-        print("No main server found, starting election...")
+        election_log.info("No main server found, starting election...")
         self.start_bully_algorithm()
 
     def get_server_config(self):
@@ -206,85 +619,87 @@ class GameServer:
 
     def _sync_server_dict_from_main(self) -> None:
         """Fetch the server dictionary from the main server on startup."""
+        if self.is_main_server():
+            return
         try:
             proxy = self._new_proxy(self.main_server_address, timeout=3)
             server_dict = proxy.send_server_dict()
             if server_dict:
                 self.server_address_to_server_ba_number.update(server_dict)
-                print(f"[{self.address}] Synced server dict from main: "
-                      f"{self.server_address_to_server_ba_number}")
+                cluster_log.info("Synced server dict from main: %s",
+                                 self.server_address_to_server_ba_number)
             else:
-                print(f"[{self.address}] Main server returned empty dict.")
+                cluster_log.warning("Main server returned empty dict.")
         except Exception as e:
-            print(f"[{self.address}] Failed to sync server dict from main: {e}")
-            print(f"[{self.address}] Using local dict only: "
-                  f"{self.server_address_to_server_ba_number}")
+            cluster_log.warning("Failed to sync server dict from main, using local dict "
+                                "only: %s: %s", e, self.server_address_to_server_ba_number)
 
     def update_server_dict(self, address: str, ba_number: int) -> None:
         """Adds address and ba_number to this game server's dictionary 
         and propagates to all other servers."""
         self.server_address_to_server_ba_number[address] = ba_number
-        print("Updated server_address_to_server_ba_number:",
-              self.server_address_to_server_ba_number)
+        cluster_log.info("Updated server dict: %s", self.server_address_to_server_ba_number)
         # Broadcast updated dict to all other servers
         self._broadcast_server_dict()
 
     def _broadcast_server_dict(self) -> None:
-        """Send the current server_address_to_server_ba_number to all other servers."""
-        for other_addr in self.server_address_to_server_ba_number:
-            if other_addr == self.address:
-                continue
-            try:
-                proxy = self._new_proxy(other_addr, timeout=2)
-                proxy.receive_server_dict(
-                    self.server_address_to_server_ba_number)
-            except Exception as e:
-                print(
-                    f"[{self.address}] Failed to broadcast dict to {other_addr}: {e}")
+        """Queue the current server_address_to_server_ba_number for all other servers."""
+        self.dispatcher.send_server_dict(
+            self._peers(), self.server_address_to_server_ba_number)
+
+    def _peers(self) -> list[str]:
+        """Returns the addresses of all known servers except this one."""
+        return [addr for addr in list(self.server_address_to_server_ba_number)
+                if addr != self.address]
 
     def receive_server_dict(self, server_dict: dict) -> str:
         """Receive server_address_to_server_ba_number from another server."""
         self.server_address_to_server_ba_number.update(server_dict)
-        print(f"[{self.address}] Updated server dict from peer: "
-              f"{self.server_address_to_server_ba_number}")
+        cluster_log.debug("Updated server dict from peer: %s",
+                          self.server_address_to_server_ba_number)
         return "OK"
 
     def ping(self, address: str = "", ba_number: int = 0):
         """Receive a ping from another server. Register if new."""
         if (address not in self.server_address_to_server_ba_number) and (address != ""):
-            print("Ping received from", address, "with ba_number", ba_number)
+            cluster_log.info("Ping received from new server %s with ba_number %s",
+                             address, ba_number)
             self.update_server_dict(address, ba_number)
         return "pong"
 
+    def heartbeat(self, address: str, ba_number: int, load: dict) -> dict:
+        """Heartbeat from another server to the main server. Registers the sender like ping,
+        records its load and returns the load table of the whole cluster."""
+        self.ping(address, ba_number)
+        self.load_table.update(address, load)
+        return self.load_table.snapshot()
+
     def _new_proxy(self, address: str, timeout=5):
-        """Used for server-to-server communication."""
-        return ServerProxy(
-            address, allow_none=True, transport=TimeoutTransport(timeout=timeout)
-        )
+        """Used for server-to-server communication. Calls reuse pooled
+        keep-alive connections to the peer."""
+        return self.proxy_pool.proxy(address, timeout=timeout)
 
     def is_main_server(self) -> bool:
         """Return True if this server is the current main server, or False otherwise."""
         return self.main_server_address == self.address
 
     def poll_main_server(self):
-        """Periodically requests addresses and statistics data from the main server."""
-        if self.address == self.main_server_address:
-            print("Tried to poll main server, but this server is the main server.")
-            threading.Timer(10, self.poll_main_server).start()
-            return
-        try:
-            proxy = self._new_proxy(self.main_server_address)
-            result = proxy.ping(self.address, self.ba_number)
-            print("Main server reply:", result)
-            self.connection_created = True
-        except Exception as e:
-            print("Error in poll_main_server:", e)
-            if self.connection_created and self.election_underway is False:
-                print("Lost connection to main server.")
-                print("Starting bully algorithm...")
-                self.start_bully_algorithm()
-
-        threading.Timer(10, self.poll_main_server).start()
+        """Sends a heartbeat to the main server every HEARTBEAT_INTERVAL seconds and starts
+        an election once SUSPICION_THRESHOLD heartbeats in a row have failed."""
+        if not self.is_main_server():
+            try:
+                proxy = self._new_proxy(self.main_server_address, timeout=HEARTBEAT_TIMEOUT)
+                loads = proxy.heartbeat(self.address, self.ba_number, self._load_report())
+                self.load_table.merge({address: report for address, report in loads.items()
+                                       if address != self.address})
+                self.connection_created = True
+                self.failure_detector.heartbeat_ok()
+            except Exception as e:
+                suspected = self.failure_detector.heartbeat_missed()
+                if suspected and self.connection_created and self.election_underway is False:
+                    election_log.warning("Lost connection to main server, starting bully "
+                                         "algorithm: %s", e)
+                    self.start_bully_algorithm()
 
     def send_server_dict(self) -> dict:
         """Returns this game server's dictionary of known servers."""
@@ -300,105 +715,177 @@ class GameServer:
                 self._broadcast_statistics(stats_list)
             return "OK"
         except Exception as e:
-            print(f"[{self.address}] Error in receive_statistics_update: {e}")
+            statistics_log.warning("Error in receive_statistics_update: %s", e)
             return "ERROR"
 
     def _broadcast_statistics(self, stats_list: list[dict]) -> None:
-        """Broadcast statistics updates to all known peers (excluding self)."""
-        for other_addr in self.server_address_to_server_ba_number:
-            if other_addr == self.address:
-                continue
-            try:
-                proxy = self._new_proxy(other_addr)
-                proxy.receive_statistics_update(stats_list)
-            except Exception as e:
-                print(
-                    f"[{self.address}] Failed to broadcast statistics to {other_addr}: {e}")
+        """Queue statistics updates for all known peers (excluding self)."""
+        self.dispatcher.send_statistics(self._peers(), stats_list)
 
     def start_bully_algorithm(self) -> None:
-        """Initiates bully election by sending ELECTION 
-        to all LOWER-numbered servers (reverse bully)."""
-        if self.election_underway:
-            print(
-                f"[{self.address}] Election already underway, not starting another.")
+        """Initiates bully election by sending ELECTION to all
+        LOWER-numbered servers (reverse bully) at the same time."""
+        with self.election_lock:
+            if self.election_underway:
+                election_log.debug("Election already underway, not starting another.")
+                return
+            self.election_underway = True
+
+        lower_nodes = [other_addr for other_addr, other_ba
+                       in list(self.server_address_to_server_ba_number.items())
+                       if other_addr != self.address and int(other_ba) < int(self.ba_number)]
+        if lower_nodes:
+            election_log.info("Sending ELECTION to %s", lower_nodes)
+        if any_replied_ok(self.election_pool, lower_nodes,
+                          self._send_election_msg, ELECTION_TIMEOUT):
+            election_log.info("Received OK, waiting for the new coordinator")
+            # restart the election if the node that answered dies before announcing itself
+            self.scheduler.call_later(COORDINATOR_TIMEOUT, self._check_coordinator_announced)
             return
-        self.election_underway = True
-        lower_nodes_contacted = False
 
-        for other_addr, other_ba in self.server_address_to_server_ba_number.items():
-            if other_addr == self.address:
-                continue
-            if int(other_ba) >= int(self.ba_number):
-                continue
-            try:
-                print(
-                    f"[{self.address}] Sending ELECTION to {other_addr} (ba_number {other_ba})")
-                proxy = self._new_proxy(other_addr, timeout=3)
-                response = proxy.handle_bully_election_msg(int(self.ba_number))
-                if response == "OK":
-                    lower_nodes_contacted = True
-                    print(f"[{self.address}] Received OK from {other_addr}")
-            except Exception as e:
-                print(f"[{self.address}] Failed to reach {other_addr}: {e}")
+        # No lower node responded
+        election_log.info("No lower nodes found. I am the new coordinator!")
+        self.main_server_address = self.address
+        self.election_underway = False
+        self.failure_detector.heartbeat_ok()
+        self._announce_coordinator()
+
+    def _send_election_msg(self, address: str) -> str:
+        proxy = self._new_proxy(address, timeout=ELECTION_TIMEOUT)
+        return proxy.handle_bully_election_msg(int(self.ba_number))
 
-        if not lower_nodes_contacted:
-            # No lower node responded
-            print(
-                f"[{self.address}] No lower nodes found. I am the new coordinator!")
-            self.main_server_address = self.address
+    def _check_coordinator_announced(self) -> None:
+        if self.election_underway:
+            election_log.warning("No coordinator announced, restarting election")
             self.election_underway = False
-            self._announce_coordinator()
+            self.start_bully_algorithm()
 
     def _announce_coordinator(self) -> None:
         """Announce this server as the new coordinator to all other servers."""
-        print(f"[{self.address}] Announcing new coordinator: {self.address}")
-        for other_addr in self.server_address_to_server_ba_number:
-            print(f"[{self.address}] Announcing to {other_addr}")
-            if other_addr == self.address:
-                continue
-            try:
-                proxy = self._new_proxy(other_addr, timeout=3)
-                answer = proxy.handle_bully_coordinator_msg(
-                    self.address, int(self.ba_number))
-                print(f"[{self.address}] {other_addr} replied: {answer}")
-            except Exception as e:
-                print(f"[{self.address}] Failed to announce to {other_addr}: {e}")
+        election_log.info("Announcing new coordinator: %s", self.address)
+        self.dispatcher.announce_coordinator(self._peers(), self.address, int(self.ba_number))
 
     def handle_bully_coordinator_msg(self, new_coordinator_address:
                                      str, new_coordinator_ba: int) -> str:
         """Receive COORDINATOR announcement. Accept only 
         if sender has LOWER BA (higher priority)."""
         if int(new_coordinator_ba) < int(self.ba_number):
-            print(
-                f"[{self.address}] New coordinator announced: {new_coordinator_address}")
+            election_log.info("New coordinator announced: %s", new_coordinator_address)
             self.main_server_address = new_coordinator_address
             self.election_underway = False
+            self.failure_detector.heartbeat_ok()
             return "OK"
-        print(f"[{self.address}] Ignoring higher-priority coordinator "
-              f"{new_coordinator_address} ({new_coordinator_ba})")
+        election_log.info("Ignoring coordinator %s with a higher ba_number (%s)",
+                          new_coordinator_address, new_coordinator_ba)
         return "IGNORED"
 
     def handle_bully_election_msg(self, ba_number: int) -> str:
         """Receive ELECTION from another node. Reply OK immediately, 
         then start our own election in background."""
-        print(
-            f"[{self.address}] Received ELECTION message from ba_number {ba_number}")
+        election_log.info("Received ELECTION message from ba_number %s", ba_number)
         if int(self.ba_number) < int(ba_number):
             # Start election in background thread
-            threading.Thread(target=self.start_bully_algorithm,
-                             daemon=True).start()
+            self.scheduler.call_later(0, self.start_bully_algorithm)
         return "OK"
 
 
+def stop_background_work(instance: GameServer) -> None:
+    """Stops the scheduled tasks and worker pools of a GameServer, called when the server exits.
+    Kept outside GameServer so it isn't exposed as an RPC."""
+    instance.scheduler.shutdown()
+    if instance.journal:
+        instance.journal.close()
+    instance.dispatcher.shutdown()
+    instance.election_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def threaded_server(sock=None) -> ThreadedXMLRPCServer:
+    """Creates the threaded XML-RPC server on port_number, or on sock if one is given."""
+    server = ThreadedXMLRPCServer(("localhost", port_number),
+                                  requestHandler=KeepAliveRequestHandler, allow_none=True,
+                                  bind_and_activate=sock is None)
+    if sock is not None:
+        server.socket.close()
+        server.socket = sock
+        # a worker stops together with the others, so it can't wait for their
+        # kept-alive connections to time out before exiting
+        server.daemon_threads = True
+    server.allow_reuse_address = True
+    return server
+
+
+def serve(workers: WorkerGroup | None = None) -> None:
+    """Serves a GameServer until interrupted, on its own or as one of several workers.
+    Workers also serve their own port (WORKER_PORTS) and the calls of the other workers
+    on their private socket, from threads next to the main server."""
+    if workers:
+        # a forked worker needs a log writer thread of its own
+        setup_logging(server=os.getenv("SERVER_ADDRESS"), worker=workers.index)
+        # the parent process stops its workers with SIGTERM, handled like Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    # "threaded" serves each connection from its own thread, "asyncio" serves all of them
+    # from one event loop (see async_server.py)
+    # (server, registered instance) pairs served from background threads
+    background = []
+    if server_runtime == "asyncio":
+        server = AsyncRPCServer(("localhost", port_number), long_poll_timeout=LONG_POLL_TIMEOUT,
+                                socks=workers and workers.public_sockets,
+                                internal_sock=workers and workers.private_socket)
+    elif workers:
+        server = threaded_server(workers.public_sockets[0])
+        background = [(threaded_server(sock), None) for sock in workers.public_sockets[1:]]
+        background.append((threaded_server(workers.private_socket), InternalCalls))
+    else:
+        server = threaded_server()
+    game_server = GameServer(workers)
+    server.register_instance(game_server)
+    for other, wrapper in background:
+        other.register_instance(wrapper(game_server) if wrapper else game_server)
+        threading.Thread(target=other.serve_forever, daemon=True).start()
+    log.info("Battleship XML-RPC server running on port %d (%s)...",
+             port_number, server_runtime)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Shutting down...")
+    finally:
+        stop_background_work(game_server)
+        server.server_close()
+        for other, _ in background:
+            other.server_close()
+        # worker processes exit without running atexit handlers
+        stop_logging()
+
+
+setup_logging(server=os.getenv("SERVER_ADDRESS"))
+
 try:
     # get the port number from the env
     port_number = int(os.getenv("LOCALHOST_PORT_NUMBER"))
 except Exception as e:
-    print("Invalid or missing LOCALHOST_PORT_NUMBER env variable!")
+    log.error("Invalid or missing LOCALHOST_PORT_NUMBER env variable!")
     sys.exit()
 
-server = ThreadedXMLRPCServer(("localhost", port_number), allow_none=True)
-server.allow_reuse_address = True
-server.register_instance(GameServer())
-print("Battleship XML-RPC server running on port 8000...")
-server.serve_forever()
+try:
+    # fails at startup rather than once the first two players are matched
+    BattleshipGame.from_mode(os.getenv("GAME_MODE", "standard")).start_game()
+except ValueError as e:
+    log.error("Invalid GAME_MODE env variable: %s", e)
+    sys.exit(1)
+
+server_runtime = os.getenv("SERVER_RUNTIME", "threaded")
+# number of worker processes serving the port, see workers.py
+worker_count = int(os.getenv("WORKERS", "1"))
+if worker_count > 1:
+    # done once before the workers start, then the connections are closed
+    # so no worker inherits one
+    DB.prepare_database()
+    DB.close_connections()
+    # optional port of each worker, and the addresses clients reach them at
+    worker_ports = [int(port) for port in os.getenv("WORKER_PORTS", "").split(",") if port]
+    worker_addresses = [address for address in os.getenv("WORKER_ADDRESSES", "").split(",")
+                        if address]
+    run_workers(("localhost", port_number), worker_count, serve, worker_ports,
+                worker_addresses)
+else:
+    serve()
@@ -0,0 +1,105 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,consider-using-with
+"""Measures how long a local cluster takes to agree on a new main server after the main
+server process is killed. Starts N battleship_server.py processes on localhost (BA numbers
+1..N, so node 1 is the main server), waits until every node knows every other node, kills
+node 1 and times how long it takes until every surviving node reports node 2 as main.
+
+Usage: python benchmarks/failover.py [nodes] [base_port]   (default 10 nodes from port 8100)
+"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+from xmlrpc.client import ServerProxy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rpc_pool import TimeoutTransport  # pylint: disable=wrong-import-position
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(__file__), "..", "battleship_server.py")
+
+
+def proxy(port: int) -> ServerProxy:
+    return ServerProxy(f"http://localhost:{port}", allow_none=True,
+                       transport=TimeoutTransport(timeout=0.5))
+
+
+def start_node(port: int, ba_number: int, first_port: int, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ,
+               LOCALHOST_PORT_NUMBER=str(port),
+               SERVER_ADDRESS=f"http://localhost:{port}",
+               SERVERLIST=f"http://localhost:{first_port}",
+               BA_NUMBER=str(ba_number))
+    nodedir = os.path.join(workdir, str(port))
+    os.makedirs(nodedir)
+    return subprocess.Popen([sys.executable, os.path.abspath(SERVER_SCRIPT)], cwd=nodedir,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until(condition, timeout: float, interval: float = 0.05) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return True
+        except Exception:
+            pass
+        time.sleep(interval)
+    return False
+
+
+def knows_every_node(ports: list[int]) -> bool:
+    return all(len(proxy(port).send_server_dict()) == len(ports) for port in ports)
+
+
+@contextlib.contextmanager
+def start_cluster(ports: list[int], ready: Callable[[list[int]], bool] = knows_every_node):
+    """Starts one node per port in a temporary directory, one after the other (BA numbers
+    1..N, node 1 in everyone's SERVERLIST), and waits until each answers ping and then
+    until ready(ports) is true. Yields the node processes and stops them afterwards."""
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            for ba_number, port in enumerate(ports, start=1):
+                processes.append(start_node(port, ba_number, ports[0], workdir))
+                if not wait_until(lambda port=port: proxy(port).ping() == "pong", 30):
+                    raise RuntimeError(f"node on port {port} did not start")
+            if not wait_until(lambda: ready(ports), 30):
+                raise RuntimeError(f"cluster not ready: {ready.__name__}")
+            yield processes
+        finally:
+            for process in processes:
+                stop(process)
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main(nodes: int, base_port: int) -> dict:
+    ports = [base_port + i for i in range(nodes)]
+    with start_cluster(ports) as processes:
+        new_main = f"http://localhost:{ports[1]}"
+        survivors = ports[1:]
+        processes[0].kill()
+        killed_at = time.monotonic()
+        converged = wait_until(
+            lambda: all(proxy(port).get_server_config()["main_server_address"] == new_main
+                        for port in survivors), 60, interval=0.02)
+        return {"nodes": nodes, "converged": converged,
+                "failover_seconds": round(time.monotonic() - killed_at, 3)}
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+                          int(sys.argv[2]) if len(sys.argv) > 2 else 8100)))
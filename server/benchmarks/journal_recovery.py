@@ -0,0 +1,84 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error,too-many-locals
+"""Measures the game journal: how much recording a shot adds to fire(), and how long it
+takes to recover N games from a snapshot plus a segment of shots written after it.
+
+Usage: python benchmarks/journal_recovery.py [games]   (default 100000)
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from battleship_game import BattleshipGame
+from journal import GameJournal
+
+
+def fire_some(game: BattleshipGame, shots: int, journal: GameJournal | None,
+              game_id: str) -> float:
+    """Fires up to shots random shots and returns the seconds spent in fire()."""
+    spent = 0.0
+    cells = [(r, c) for r in range(game.rows) for c in range(game.cols)]
+    random.shuffle(cells)
+    for row, col in cells[:shots]:
+        player = game.current_player
+        started = time.perf_counter()
+        with game.lock:
+            result = game.fire(player, row, col)
+            if journal and "error" not in result:
+                journal.record_fire(game_id, player, row, col)
+        spent += time.perf_counter() - started
+        if game.winner is not None:
+            break
+    return spent
+
+
+def main(count: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        journal = GameJournal(directory)
+        games = []
+        for i in range(count):
+            game = BattleshipGame.from_mode("standard")
+            game.start_game()
+            names = {1: f"a{i}", 2: f"b{i}"}
+            journal.record_new(str(i), game, names)
+            games.append((str(i), game, names))
+
+        plain = BattleshipGame.from_mode("standard")
+        plain.start_game()
+        without_journal = fire_some(plain, 10, None, "")
+        journaled = 0.0
+        shots = 0
+        for game_id, game, _ in games[:count // 2]:
+            journaled += fire_some(game, 4, journal, game_id)
+            shots += 4
+
+        started = time.perf_counter()
+        journal.snapshot(lambda: games)
+        snapshot_seconds = time.perf_counter() - started
+
+        # shots after the snapshot end up in the segment that is replayed on recovery
+        for game_id, game, _ in games[count // 2:]:
+            fire_some(game, 4, journal, game_id)
+        journal.close()
+
+        started = time.perf_counter()
+        recovered = GameJournal(directory).recover()
+        recover_seconds = time.perf_counter() - started
+
+        matches = all(recovered[game_id][0].get_state() == game.get_state()
+                      for game_id, game, _ in games[:1000])
+    return {"games": count, "recovered": len(recovered), "state_matches": matches,
+            "fire_us": round(without_journal / 10 * 1e6, 2),
+            "fire_with_journal_us": round(journaled / shots * 1e6, 2),
+            "snapshot_seconds": round(snapshot_seconds, 3),
+            "recover_seconds": round(recover_seconds, 3)}
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)))
@@ -0,0 +1,570 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+# pylint: disable=consider-using-with,too-many-locals,too-many-arguments,too-many-branches
+# pylint: disable=too-many-statements,too-many-instance-attributes,too-few-public-methods
+# pylint: disable=too-many-positional-arguments
+"""End-to-end load test. Starts a local cluster of battleship_server.py nodes (with --client,
+also the Flask client in front of them) and simulates players that join with
+register_player, poll the game state every --poll seconds, fire after a short think time
+on their turn, now and then quit mid-game, and join again once a game is over.
+
+Reports the throughput, the p50/p99 latency of every RPC as the players saw it (and as
+each node measured it, see get_metrics), the servers' memory per game held in memory,
+and the replication lag: how long after a game ended each node's statistics counted it.
+Runs offline on localhost and prints the results as JSON. With --baseline, compares them
+with the results of an earlier run and exits with 1 if anything got worse by more than
+--tolerance. The nodes take their other settings from the environment (SERVER_RUNTIME,
+WORKERS, GAME_MODE, ...).
+
+Usage: python benchmarks/load_test.py [--nodes 3] [--players 1000] [--seconds 60]
+       [--processes 1] [--client] [--output results.json] [--baseline old.json]
+       (see --help for the rest)
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from failover import proxy, start_cluster, stop, wait_until
+from async_server import AsyncPeerClient
+from metrics import Histogram
+
+CLIENT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "client")
+
+
+class Recorder:
+    """Latency of every call one player process made, by RPC (or client endpoint)."""
+
+    def __init__(self):
+        self.latency: dict[str, Histogram] = {}
+
+    def observe(self, name: str, seconds: float, error: bool = False) -> None:
+        self.latency.setdefault(name, Histogram()).observe(seconds, error)
+
+
+class RpcApi:
+    """Calls the game servers directly like the Flask client does: joins on the player's
+    server and follows the owner of the game once a reply names it."""
+
+    def __init__(self, client: AsyncPeerClient, entry: str, recorder: Recorder):
+        self.client = client
+        self.entry = entry
+        self.recorder = recorder
+        self.game_server = entry
+
+    async def call(self, address: str, method: str, *params):
+        started = time.perf_counter()
+        try:
+            reply = await self.client.call(address, method, list(params), 30)
+        except Exception:
+            self.recorder.observe(method, time.perf_counter() - started, True)
+            raise
+        self.recorder.observe(method, time.perf_counter() - started)
+        if isinstance(reply, dict) and reply.get("owner"):
+            self.game_server = reply["owner"]
+        return reply
+
+    async def join(self, name: str) -> tuple[int, str]:
+        player_id, game_id, owner = await self.call(self.entry, "register_player", name)
+        self.game_server = owner or self.entry
+        return player_id, game_id
+
+    async def state(self, game_id: str, seq: int | None) -> dict:
+        if seq is None:
+            return await self.call(self.game_server, "get_state", game_id)
+        return await self.call(self.game_server, "get_state_since", game_id, seq)
+
+    async def fire(self, game_id: str, player_id: int, row: int, col: int, seq: int) -> dict:
+        return await self.call(self.game_server, "fire_and_get_state_since",
+                               game_id, player_id, row, col, seq)
+
+    async def quit(self, game_id: str, player_id: int) -> None:
+        await self.call(self.game_server, "quit", game_id, player_id)
+
+
+class ClientApi:
+    """Plays through the Flask client's /api endpoints like the browser does,
+    on one connection with its own cookies."""
+
+    def __init__(self, client_address: str, entry: str, recorder: Recorder):
+        url = urlsplit(client_address)
+        self.host, self.port = url.hostname, url.port
+        self.recorder = recorder
+        self.cookies = {"server_url": entry}
+        self.connection = None
+
+    async def request(self, method: str, path: str, body=None):
+        name = path.split("?")[0]
+        started = time.perf_counter()
+        try:
+            status, reply = await self._request(method, path, body)
+        except Exception:
+            self.recorder.observe(name, time.perf_counter() - started, True)
+            raise
+        self.recorder.observe(name, time.perf_counter() - started, status >= 500)
+        return reply
+
+    async def _request(self, method: str, path: str, body) -> tuple[int, object]:
+        data = json.dumps(body).encode() if body is not None else b""
+        cookies = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Cookie: {cookies}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n").encode()
+        for attempt in range(2):
+            reused = self.connection is not None
+            if not reused:
+                self.connection = await asyncio.open_connection(self.host, self.port)
+            reader, writer = self.connection
+            try:
+                writer.write(head + data)
+                await writer.drain()
+                start = await reader.readline()
+                if not start:
+                    raise ConnectionError("the client closed the connection")
+            except ConnectionError:
+                self._close()
+                # a kept-alive connection may have been closed while it was idle
+                if reused and attempt == 0:
+                    continue
+                raise
+            break
+        version, status = start.decode().split(" ", 2)[:2]
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode().partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                cookie, _, _ = value.partition(";")
+                cookie_name, _, cookie_value = cookie.partition("=")
+                if cookie_value:
+                    self.cookies[cookie_name] = cookie_value
+                else:
+                    self.cookies.pop(cookie_name, None)
+            headers[name] = value
+        if "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+        if version != "HTTP/1.1" or headers.get("connection", "").lower() == "close":
+            self._close()
+        return int(status), json.loads(content) if content else None
+
+    def _close(self) -> None:
+        if self.connection:
+            self.connection[1].close()
+        self.connection = None
+
+    async def join(self, name: str) -> tuple[int, str]:
+        reply = await self.request("POST", "/api/join", {"playerName": name})
+        if not isinstance(reply, list):
+            raise RuntimeError(f"join failed: {reply}")
+        return reply[0], reply[1]
+
+    async def state(self, game_id: str, seq: int | None) -> dict:
+        return await self.request("GET", "/api/state" + (f"?since={seq}" if seq is not None
+                                                         else ""))
+
+    async def fire(self, game_id: str, player_id: int, row: int, col: int, seq: int) -> dict:
+        return await self.request("POST", "/api/fire", {"row": row, "col": col, "since": seq})
+
+    async def quit(self, game_id: str, player_id: int) -> None:
+        await self.request("POST", "/api/quit")
+
+
+class PlayerStats:
+    def __init__(self):
+        # time.time() of every game this process's players won, one entry per finished game
+        self.finished: list[float] = []
+        self.joins = 0
+        self.quit = 0
+        self.failed = 0
+
+
+async def play_game(api, name: str, deadline: float, options: dict, stats: PlayerStats,
+                    rng: random.Random) -> None:
+    """Plays one game as one player: waits for an opponent, then fires on every turn."""
+    def pause(seconds: float):
+        return asyncio.sleep(seconds * rng.uniform(0.5, 1.5))
+
+    player_id, game_id = await api.join(name)
+    stats.joins += 1
+    state = await api.state(game_id, None)
+    while "error" in state:
+        if time.time() >= deadline:
+            await api.quit(game_id, player_id)
+            return
+        await pause(options["poll"])
+        state = await api.state(game_id, None)
+    cells = [(row, col) for row in range(state["rows"]) for col in range(state["cols"])]
+    rng.shuffle(cells)
+    seq = state["seq"]
+    current = state["current_player"]
+    while not state.get("winner") and not state.get("game_canceled"):
+        if time.time() >= deadline:
+            await api.quit(game_id, player_id)
+            return
+        if current == player_id:
+            await pause(options["think"])
+            if rng.random() < options["quit_rate"]:
+                await api.quit(game_id, player_id)
+                stats.quit += 1
+                return
+            row, col = cells.pop()
+            reply = await api.fire(game_id, player_id, row, col, seq)
+            if "error" in reply:
+                cells.append((row, col))
+            if reply.get("winner") == player_id:
+                stats.finished.append(time.time())
+            state = reply.get("state") or reply
+        else:
+            await pause(options["poll"])
+            state = await api.state(game_id, seq)
+        if "error" in state:
+            raise RuntimeError(state["error"])
+        if not state.get("not_modified"):
+            seq = state["seq"]
+            current = state.get("current_player", current)
+
+
+async def play(api, name: str, deadline: float, options: dict, stats: PlayerStats) -> None:
+    rng = random.Random(name)
+    # players arrive over the first seconds instead of all at once
+    await asyncio.sleep(rng.uniform(0, options["ramp"]))
+    while time.time() < deadline:
+        try:
+            await play_game(api, name, deadline, options, stats, rng)
+        except Exception:
+            stats.failed += 1
+            await asyncio.sleep(options["poll"])
+        await asyncio.sleep(rng.uniform(0, 1))
+
+
+async def run_players(index: int, count: int, entries: list[str], deadline: float,
+                      options: dict) -> tuple[Recorder, PlayerStats]:
+    recorder = Recorder()
+    stats = PlayerStats()
+    client = AsyncPeerClient(None, None, max_idle=max(count, 16))
+    apis = [ClientApi(options["client_address"], entries[i % len(entries)], recorder)
+            if options["client_address"] else RpcApi(client, entries[i % len(entries)], recorder)
+            for i in range(count)]
+    await asyncio.gather(*(play(api, f"load{index}-{i}", deadline, options, stats)
+                           for i, api in enumerate(apis)))
+    return recorder, stats
+
+
+def player_process(index: int, count: int, entries: list[str], deadline: float,
+                   options: dict, results) -> None:
+    recorder, stats = asyncio.run(run_players(index, count, entries, deadline, options))
+    results.put((recorder.latency, vars(stats)))
+
+
+def process_rss_kb(pid: int) -> int:
+    """Returns the resident memory of pid and its child processes (worker processes)."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+            total += next(int(line.split()[1]) for line in file if line.startswith("VmRSS"))
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as file:
+            total += sum(process_rss_kb(int(child)) for child in file.read().split())
+    except (OSError, StopIteration):
+        pass
+    return total
+
+
+class StatisticsFollower:
+    """Follows one node's statistics change log (get_statistics_changes) and records when
+    its total number of wins, i.e. of finished games, grew."""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.log_id = ""
+        self.version = 0
+        self.wins: dict[str, int] = {}
+        self.total = 0
+        self.initial = None
+        # (time.time(), total) after every change
+        self.timeline: list[tuple[float, int]] = []
+
+    async def poll(self, client: AsyncPeerClient) -> None:
+        reply = await client.call(self.address, "get_statistics_changes",
+                                  [self.version, self.log_id], 10)
+        if reply["full"]:
+            # first call, or the log was pruned: read it from the start
+            self.log_id, self.version = reply["log_id"], 0
+            return
+        for change in reply["changes"]:
+            self.total += change["games_won"] - self.wins.get(change["player_name"], 0)
+            self.wins[change["player_name"]] = change["games_won"]
+        if reply["changes"]:
+            self.version = reply["changes"][-1]["version"]
+        if self.initial is None:
+            # games finished before the load test started
+            self.initial = self.total
+        elif reply["changes"]:
+            self.timeline.append((time.time(), self.total - self.initial))
+
+    def lag(self, finished: list[float]) -> dict:
+        """Seconds between the k-th game ending and this node counting k games."""
+        lags = []
+        index = 0
+        for k, ended in enumerate(finished, start=1):
+            while index < len(self.timeline) and self.timeline[index][1] < k:
+                index += 1
+            if index == len(self.timeline):
+                break
+            lags.append(max(self.timeline[index][0] - ended, 0))
+        lags.sort()
+        return {"p50": lags[len(lags) // 2] if lags else None,
+                "p99": lags[int(len(lags) * 0.99)] if lags else None,
+                "max": lags[-1] if lags else None,
+                "missing": len(finished) - len(lags)}
+
+
+async def follow_cluster(addresses: list[str], pids: list[int], players_done,
+                         finished_count, poll: float = 0.1) -> tuple[list, dict]:
+    """Samples the nodes' statistics and memory until the players are done and every node
+    has counted every finished game (or 20 seconds more have passed)."""
+    client = AsyncPeerClient(None, None)
+    followers = [StatisticsFollower(address) for address in addresses]
+    while any(follower.initial is None for follower in followers):
+        for follower in followers:
+            await follower.poll(client)
+    memory = {"idle_rss_mb": sum(map(process_rss_kb, pids)) / 1024,
+              "peak_games_in_memory": 0, "rss_mb_at_peak": None}
+    last_memory_sample = 0.0
+    done_at = None
+    while True:
+        for follower in followers:
+            try:
+                await follower.poll(client)
+            except Exception:
+                pass
+        if time.monotonic() - last_memory_sample >= 1:
+            last_memory_sample = time.monotonic()
+            try:
+                games = sum([(await client.call(address, "get_metrics", [], 10))
+                             ["gauges"]["games"] for address in addresses])
+                if games > memory["peak_games_in_memory"]:
+                    memory["peak_games_in_memory"] = games
+                    memory["rss_mb_at_peak"] = sum(map(process_rss_kb, pids)) / 1024
+            except Exception:
+                pass
+        if players_done():
+            done_at = done_at or time.monotonic()
+            caught_up = all(follower.total - follower.initial >= finished_count()
+                            for follower in followers)
+            if caught_up or time.monotonic() - done_at > 20:
+                break
+        await asyncio.sleep(poll)
+    if memory["peak_games_in_memory"]:
+        memory["kb_per_game"] = round((memory["rss_mb_at_peak"] - memory["idle_rss_mb"])
+                                      * 1024 / memory["peak_games_in_memory"], 1)
+    return followers, memory
+
+
+@contextlib.contextmanager
+def start_client(port: int, entry: str):
+    """Runs the Flask client on port in front of the node at entry, yields its address."""
+    env = dict(os.environ, LOCALHOST_PORT_NUMBER=str(port), SERVERLIST=entry)
+    process = subprocess.Popen([sys.executable, "-m", "flask", "--app", "battleship_client",
+                                "run", "--port", str(port), "--no-reload", "--with-threads"],
+                               cwd=CLIENT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    address = f"http://localhost:{port}"
+    try:
+        if not wait_until(lambda: urlopen(address, timeout=1).status == 200, 30):
+            raise RuntimeError("the Flask client did not start")
+        yield address
+    finally:
+        stop(process)
+
+
+def revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(__file__)
+                              ).stdout.strip()
+    except Exception:
+        return None
+
+
+def play_and_follow(args, addresses: list[str], node_pids: list[int],
+                    client_address: str | None) -> tuple[list, list, dict, float]:
+    """Runs the player processes while following the nodes. Returns what every player
+    process reported, the statistics followers, the memory samples and the seconds played."""
+    options = {"poll": args.poll, "think": args.think, "quit_rate": args.quit_rate,
+               "ramp": min(args.ramp, args.seconds / 2), "client_address": client_address}
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    started = time.time()
+    deadline = started + args.seconds
+    shares = [args.players // args.processes + (i < args.players % args.processes)
+              for i in range(args.processes)]
+    players = [context.Process(target=player_process,
+                               args=(i, share, addresses, deadline, options, results))
+               for i, share in enumerate(shares)]
+    collected = []
+
+    def players_done() -> bool:
+        while not results.empty():
+            collected.append(results.get())
+        return len(collected) == len(players)
+
+    def finished_count() -> int:
+        return sum(len(stats["finished"]) for _, stats in collected)
+
+    async def follow_and_play():
+        follow = asyncio.create_task(follow_cluster(addresses, node_pids, players_done,
+                                                    finished_count))
+        # the followers must have read the current statistics before the players start
+        await asyncio.sleep(1)
+        for player in players:
+            player.start()
+        return await follow
+
+    followers, memory = asyncio.run(follow_and_play())
+    elapsed = min(time.time(), deadline) - started
+    for player in players:
+        player.join()
+    return collected, followers, memory, elapsed
+
+
+def server_latency(address: str) -> dict:
+    """Returns the count, errors, p50 and p99 of every RPC as the node measured them."""
+    try:
+        return {method: {key: summary[key] for key in ("count", "errors", "p50", "p99")}
+                for method, summary in proxy(urlsplit(address).port).get_metrics()
+                ["rpcs"].items()}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def run(args) -> dict:
+    ports = [args.port + i for i in range(args.nodes)]
+    addresses = [f"http://localhost:{port}" for port in ports]
+    with start_cluster(ports) as processes, (
+            start_client(args.port + args.nodes, addresses[0]) if args.client
+            else contextlib.nullcontext()) as client_address:
+        collected, followers, memory, elapsed = play_and_follow(
+            args, addresses, [process.pid for process in processes], client_address)
+        servers = {address: server_latency(address) for address in addresses}
+
+    latency: dict[str, Histogram] = {}
+    for histograms, _ in collected:
+        for name, histogram in histograms.items():
+            merged = latency.setdefault(name, Histogram())
+            merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+            merged.total += histogram.total
+            merged.errors += histogram.errors
+    finished = sorted(time for _, stats in collected for time in stats["finished"])
+    calls = sum(sum(histogram.counts) for histogram in latency.values())
+    return {
+        "config": {**vars(args), "cores": os.cpu_count(), "revision": revision(),
+                   "server_env": {name: os.getenv(name) for name in (
+                       "SERVER_RUNTIME", "WORKERS", "GAME_MODE", "GAME_PLACEMENT",
+                       "RPC_CODEC") if os.getenv(name)}},
+        "elapsed_seconds": round(elapsed, 1),
+        "calls": calls,
+        "calls_per_second": round(calls / elapsed, 1),
+        "errors": sum(histogram.errors for histogram in latency.values()),
+        "games_finished": len(finished),
+        "games_per_second": round(len(finished) / elapsed, 2),
+        "games_quit": sum(stats["quit"] for _, stats in collected),
+        "games_failed": sum(stats["failed"] for _, stats in collected),
+        "joins": sum(stats["joins"] for _, stats in collected),
+        "latency": {name: histogram.summary() for name, histogram in sorted(latency.items())},
+        "server_latency": servers,
+        "memory": memory,
+        "replication_lag": {follower.address: follower.lag(finished) for follower in followers},
+    }
+
+
+# (value, True if higher is better) of the numbers compared with a baseline run
+def key_numbers(result: dict) -> dict[str, tuple[float, bool]]:
+    numbers = {"calls_per_second": (result["calls_per_second"], True),
+               "games_per_second": (result["games_per_second"], True)}
+    for name, summary in result["latency"].items():
+        if summary["mean"] is not None:
+            numbers[f"latency.{name}.mean"] = (summary["mean"], False)
+    if result["memory"].get("kb_per_game") is not None:
+        numbers["memory.kb_per_game"] = (result["memory"]["kb_per_game"], False)
+    for address, lag in result["replication_lag"].items():
+        if lag["p50"] is not None:
+            numbers[f"replication_lag.{address}.p50"] = (lag["p50"], False)
+    return numbers
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns the numbers that got worse than in baseline by more than tolerance."""
+    found = []
+    old_numbers = key_numbers(baseline)
+    for name, (value, higher_is_better) in key_numbers(result).items():
+        if name not in old_numbers or not old_numbers[name][0]:
+            continue
+        old = old_numbers[name][0]
+        change = (value - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            found.append(f"{name}: {old:g} -> {value:g} ({change:+.0%})")
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="processes the players are spread over")
+    parser.add_argument("--poll", type=float, default=1,
+                        help="seconds between state polls while waiting")
+    parser.add_argument("--think", type=float, default=0.3,
+                        help="seconds a player thinks before firing")
+    parser.add_argument("--quit-rate", type=float, default=0.01,
+                        help="chance of quitting instead of firing")
+    parser.add_argument("--ramp", type=float, default=10,
+                        help="seconds over which the players arrive")
+    parser.add_argument("--client", action="store_true",
+                        help="play through the Flask client instead of calling the servers")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    # every player may hold a connection open
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    result = run(args)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        changed = [name for name, value in baseline["config"].items() if name not in (
+            "output", "baseline", "revision") and result["config"].get(name) != value]
+        if changed:
+            print(f"The baseline was run with other settings: {', '.join(changed)}",
+                  file=sys.stderr)
+        result["regressions"] = regressions(result, baseline, args.tolerance)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    print(output)
+    return 1 if result.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
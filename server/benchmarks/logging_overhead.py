@@ -0,0 +1,50 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+"""Measures what logging costs the thread that logs: a debug call while debug logging is
+off, an info call that is queued for the writer thread (on a single core this includes
+the writer's work), and the print() the server used to call, flushed after every line
+like stdout is on a terminal. Also reports how long the writer takes to catch up.
+
+Usage: python benchmarks/logging_overhead.py [calls]
+       (default 100000)
+"""
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from logs import get_logger, setup_logging, stop_logging
+
+
+def per_call_ns(log_call, calls: int) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        log_call(i)
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def main(calls: int) -> dict:
+    log = get_logger("benchmark")
+    with tempfile.TemporaryFile("w") as output, contextlib.redirect_stdout(output):
+        setup_logging(server="http://localhost:8000")
+        results = {
+            "disabled_debug_ns": per_call_ns(
+                lambda i: log.debug("Player joined", extra={"game_id": i}), calls),
+            "queued_info_ns": per_call_ns(
+                lambda i: log.info("Evicted %d games", i, extra={"game_id": i}), calls),
+        }
+        started = time.perf_counter()
+        stop_logging()
+        results["writer_drain_ms"] = (time.perf_counter() - started) * 1000
+        results["print_flushed_ns"] = per_call_ns(
+            lambda i: print(f"Evicted {i} games", flush=True), calls)
+    return {key: round(value, 1) for key, value in results.items()}
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)))
@@ -0,0 +1,77 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+# pylint: disable=consider-using-with,too-many-locals,wrong-import-order
+"""Measures how many concurrent long-polling connections one server process holds.
+Starts battleship_server.py with the given SERVER_RUNTIME, opens N connections that each
+wait for a change in one of the games, reports the server's memory and thread count while
+they wait, then fires a shot in every game and times until every waiter has its answer.
+
+Usage: python benchmarks/long_poll_connections.py [runtime] [connections] [port]
+       (default asyncio, 10000 connections, port 8600)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from async_server import AsyncPeerClient
+from failover import start_cluster
+
+GAMES = 100
+
+
+def process_status(pid: int) -> dict:
+    with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+        fields = dict(line.split(":", 1) for line in file)
+    return {"rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1),
+            "threads": int(fields["Threads"])}
+
+
+async def run(port: int, connections: int, pid: int) -> dict:
+    address = f"http://localhost:{port}"
+    client = AsyncPeerClient(None, None, max_idle=connections)
+    games = []
+    for i in range(GAMES):
+        await client.call(address, "register_player", [f"a{i}"])
+        _, game_id, _ = await client.call(address, "register_player", [f"b{i}"])
+        games.append((game_id, (await client.call(address, "get_state", [game_id]))["seq"]))
+
+    idle = process_status(pid)
+    started = time.monotonic()
+    waiters = [asyncio.create_task(client.call(
+        address, "wait_for_change", [game_id, seq, 20], timeout=60))
+        for game_id, seq in (games[i % GAMES] for i in range(connections))]
+    # give every waiter time to connect and reach the server
+    await asyncio.sleep(max(5.0, connections / 1000))
+    waiting = process_status(pid)
+    pending = sum(not waiter.done() for waiter in waiters)
+
+    fired = time.monotonic()
+    shooter = AsyncPeerClient(None, None)
+    for game_id, _ in games:
+        await shooter.call(address, "fire", [game_id, 1, 0, 0])
+    replies = await asyncio.gather(*waiters, return_exceptions=True)
+    answered = sum(isinstance(reply, dict) and "shots" in reply for reply in replies)
+    return {"connections": connections, "waiting_when_fired": pending,
+            "answered_with_changes": answered,
+            "all_answered_seconds": round(time.monotonic() - fired, 3),
+            "connect_seconds": round(fired - started, 1),
+            "idle": idle, "while_waiting": waiting}
+
+
+def main(runtime: str, connections: int, port: int) -> dict:
+    os.environ["SERVER_RUNTIME"] = runtime
+    os.environ["JOURNAL_DIR"] = ""
+    with start_cluster([port]) as (process,):
+        result = asyncio.run(run(port, connections, process.pid))
+    return {"runtime": runtime, **result}
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(sys.argv[1] if len(sys.argv) > 1 else "asyncio",
+                          int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+                          int(sys.argv[3]) if len(sys.argv) > 3 else 8600)))
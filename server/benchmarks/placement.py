@@ -0,0 +1,49 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,consider-using-with
+"""Measures how evenly a local cluster spreads new games. Starts N battleship_server.py
+processes, waits until the main server has a load report from every node, then matches
+2 * games players through node 1 only and reports how many games each node ended up hosting.
+The nodes use GAME_PLACEMENT from the environment (least_loaded by default).
+
+Usage: python benchmarks/placement.py [nodes] [games] [base_port]
+       (default 4 nodes, 200 games, from port 8200)
+"""
+import json
+import sys
+
+from failover import proxy, start_cluster
+
+
+def has_every_load_report(ports: list[int]) -> bool:
+    return len(proxy(ports[0]).get_load()) == len(ports)
+
+
+def place_games(port: int, games: int) -> list[str]:
+    """Matches 2 * games players through the node on port, returns the owner of each game."""
+    entry = proxy(port)
+    owners = []
+    for i in range(games):
+        entry.register_player(f"a{i}")
+        _, game_id, owner = entry.register_player(f"b{i}")
+        owners.append(owner)
+        # a forwarded call must reach the game on its owner
+        if "error" in entry.get_state(game_id):
+            raise RuntimeError(f"game {game_id} not found through node 1")
+    return owners
+
+
+def main(nodes: int, games: int, base_port: int) -> dict:
+    ports = [base_port + i for i in range(nodes)]
+    with start_cluster(ports, ready=has_every_load_report):
+        owners = place_games(ports[0], games)
+        hosted = {f"http://localhost:{port}": proxy(port).get_game_counts()["live"]
+                  for port in ports}
+    return {"nodes": nodes, "games": games, "hosted": hosted,
+            "largest_share": round(max(hosted.values()) / games, 3),
+            "placed_remotely": sum(owner != f"http://localhost:{ports[0]}" for owner in owners)}
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+                          int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+                          int(sys.argv[3]) if len(sys.argv) > 3 else 8200)))
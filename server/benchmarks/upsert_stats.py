@@ -0,0 +1,49 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+# pylint: disable=wrong-import-position
+"""Measures how many rows per second database.upsert_stats writes when a replica
+receives the whole leaderboard. Each size is run against a fresh temporary database,
+set up like a server's with the leaderboard indexes and the change log triggers: first
+with only new players (inserts), then with the same players again (updates).
+
+Usage: python benchmarks/upsert_stats.py [size ...]   (default 10000 100000 1000000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import database as DB
+
+
+def make_stats(size: int, offset: int = 0) -> list[dict]:
+    return [{"player_name": f"player{i}", "games_won": i % 50 + offset,
+             "games_lost": i % 30 + offset} for i in range(size)]
+
+
+def timed_upsert(stats: list[dict]) -> float:
+    start = time.perf_counter()
+    DB.upsert_stats(stats)
+    return time.perf_counter() - start
+
+
+def main(sizes: list[int]) -> None:
+    original_path = DB.DATABASE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            DB.set_database_path(os.path.join(tmp, f"bench_{size}.db"))
+            # with the leaderboard indexes and change log triggers every server has
+            DB.prepare_database()
+            inserted = timed_upsert(make_stats(size))
+            updated = timed_upsert(make_stats(size, offset=1))
+            print(f"{size:>9} rows: insert {size / inserted:>10,.0f} rows/s "
+                  f"({inserted:.2f} s), update {size / updated:>10,.0f} rows/s "
+                  f"({updated:.2f} s)")
+        # closes the pooled connections before the directory is removed
+        DB.set_database_path(original_path)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,72 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+"""Compares XML-RPC with the compact JSON codec in wire.py: payload size and encode/decode
+time of a get_state reply (10x10 and 50x50 boards), a fire reply and a
+receive_statistics_update request with 100 rows.
+
+Usage: python benchmarks/wire_codec.py
+"""
+import json
+import os
+import sys
+import timeit
+import xmlrpc.client
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import wire
+from battleship_game import BattleshipGame
+
+
+def game_state(mode: str) -> dict:
+    game = BattleshipGame.from_mode(mode)
+    game.start_game()
+    for i in range(game.cols):
+        game.fire(game.current_player, i, i)
+    return game.get_state()
+
+
+def statistics_rows(count: int) -> list[dict]:
+    return [{"player_name": f"player{i}", "games_won": i, "games_lost": i // 2,
+             "version": i} for i in range(count)]
+
+
+def measure(encode, decode, number: int) -> dict:
+    data = encode()
+    return {"bytes": len(data),
+            "encode_us": round(timeit.timeit(encode, number=number) / number * 1e6, 1),
+            "decode_us": round(timeit.timeit(lambda: decode(data), number=number) / number * 1e6,
+                               1)}
+
+
+def compare_response(result, number: int) -> dict:
+    return {
+        "xml": measure(lambda: xmlrpc.client.dumps((result,), methodresponse=True,
+                                                   allow_none=True).encode(),
+                       xmlrpc.client.loads, number),
+        "json": measure(lambda: wire.encode_response(result), wire.decode_response, number),
+    }
+
+
+def compare_request(method: str, params: tuple, number: int) -> dict:
+    return {
+        "xml": measure(lambda: xmlrpc.client.dumps(params, method, allow_none=True).encode(),
+                       xmlrpc.client.loads, number),
+        "json": measure(lambda: wire.encode_request(method, params), wire.decode_request,
+                        number),
+    }
+
+
+def main() -> dict:
+    return {
+        "get_state classic": compare_response(game_state("classic"), 2000),
+        "get_state tournament": compare_response(game_state("tournament"), 100),
+        "fire": compare_response({"result": "hit", "winner": None, "next_player": 2}, 20000),
+        "receive_statistics_update 100 rows": compare_request(
+            "receive_statistics_update", (statistics_rows(100),), 1000),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
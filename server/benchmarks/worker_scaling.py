@@ -0,0 +1,108 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+# pylint: disable=consider-using-with,too-many-locals
+"""Measures how RPC throughput scales with the number of worker processes (WORKERS) and
+checks that matchmaking and statistics stay correct across them. For each worker count,
+starts battleship_server.py and runs client processes that each play games as one player
+(register, wait for the opponent, fire on their turn) for a fixed time. Players meet
+in the lobby no matter which worker their connection lands on, so every game needs two
+clients. Each worker also gets a port of its own (WORKER_PORTS), and clients send the
+calls for a game to the worker that owns it like the real client does. Afterwards, the
+wins and losses in the statistics table must match the games the clients finished.
+
+Usage: python benchmarks/worker_scaling.py [worker counts] [clients] [seconds] [port]
+       (default 1,2,4 workers, 8 clients, 10 seconds, port 8800, the workers' own
+       ports start at port + 100)
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from failover import proxy, start_cluster
+from rpc_pool import ProxyPool
+
+
+def play(port: int, name: str, deadline: float, results) -> None:
+    """Plays games as one player until deadline. Puts (rpcs, games won, games lost) in results."""
+    pool = ProxyPool(codec="json")
+    lobby = pool.proxy(f"http://localhost:{port}", timeout=30)
+    rpcs = won = lost = 0
+    while time.monotonic() < deadline:
+        player_id, game_id, owner = lobby.register_player(name)
+        server = pool.proxy(owner, timeout=30)
+        rpcs += 1
+        state = server.get_state(game_id)
+        rpcs += 1
+        while "error" in state and time.monotonic() < deadline:
+            time.sleep(0.01)
+            state = server.get_state(game_id)
+            rpcs += 1
+        if "error" in state:
+            server.quit(game_id, player_id)
+            break
+        if state.get("owner"):
+            server = pool.proxy(state["owner"], timeout=30)
+        cells = [(row, col) for row in range(state["rows"]) for col in range(state["cols"])]
+        seq = state["seq"]
+        current = state["current_player"]
+        winner = None
+        while winner is None and not state.get("game_canceled"):
+            if current == player_id:
+                row, col = cells.pop()
+                result = server.fire_and_get_state_since(game_id, player_id, row, col, seq)
+                state = result["state"]
+            else:
+                state = server.wait_for_change(game_id, seq, 5)
+            rpcs += 1
+            seq = state["seq"]
+            current = state.get("current_player", current)
+            winner = state.get("winner")
+        won += winner == player_id
+        lost += winner not in (None, player_id)
+    results.put((rpcs, won, lost))
+
+
+def run(port: int, workers: int, clients: int, seconds: float) -> dict:
+    os.environ["WORKERS"] = str(workers)
+    os.environ["JOURNAL_DIR"] = ""
+    os.environ["WORKER_PORTS"] = ",".join(str(port + 100 + i) for i in range(workers))
+    with start_cluster([port]):
+        results = multiprocessing.Queue()
+        started = time.monotonic()
+        players = [multiprocessing.Process(target=play, args=(
+            port, f"player{i}", started + seconds, results)) for i in range(clients)]
+        for player in players:
+            player.start()
+        totals = [results.get(timeout=seconds + 60) for _ in players]
+        elapsed = time.monotonic() - started
+        for player in players:
+            player.join()
+        # statistics are written by the worker that hosts the game, wait for them
+        time.sleep(1)
+        stats = proxy(port).get_statistics() or []
+    rpcs = sum(total[0] for total in totals)
+    won = sum(total[1] for total in totals)
+    return {"workers": workers, "rpcs_per_second": round(rpcs / elapsed),
+            "games": won, "games_per_second": round(won / elapsed, 1),
+            "statistics_match": (sum(row["games_won"] for row in stats) == won
+                                 == sum(total[2] for total in totals)
+                                 == sum(row["games_lost"] for row in stats))}
+
+
+def main(worker_counts: list[int], clients: int, seconds: float, port: int) -> dict:
+    return {"cores": os.cpu_count(), "clients": clients,
+            "runs": [run(port + i, workers, clients, seconds)
+                     for i, workers in enumerate(worker_counts)]}
+
+
+if __name__ == "__main__":
+    print(json.dumps(main([int(count) for count in (sys.argv[1] if len(sys.argv) > 1
+                                                    else "1,2,4").split(",")],
+                          int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+                          float(sys.argv[3]) if len(sys.argv) > 3 else 10,
+                          int(sys.argv[4]) if len(sys.argv) > 4 else 8800), indent=2))
@@ -0,0 +1,108 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-few-public-methods
+import bisect
+import hashlib
+import threading
+import time
+
+# rough number of RPCs per second one game in progress causes, used to weigh
+# a server's request rate against its number of live games
+RPCS_PER_GAME = 2
+
+
+class RequestRate:
+    """Counts handled RPCs and reports how many arrived per second over the last window."""
+
+    def __init__(self, window: float = 1):
+        self.window = window
+        self.count = 0
+        self.window_start = time.monotonic()
+        self.last_rate = 0.0
+        self.lock = threading.Lock()
+
+    def tick(self) -> None:
+        with self.lock:
+            self.count += 1
+
+    def rate(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.window_start
+            if elapsed >= self.window:
+                self.last_rate = self.count / elapsed
+                self.count = 0
+                self.window_start = now
+            return self.last_rate
+
+
+class HashRing:
+    """Consistent hash ring of server addresses. Each server gets replicas points on the
+    ring, so adding or removing a server only moves the keys next to its points."""
+
+    def __init__(self, nodes, replicas: int = 64):
+        self.points = sorted((_hash(f"{node}#{i}"), node)
+                             for node in nodes for i in range(replicas))
+        self.keys = [point for point, _ in self.points]
+
+    def owner(self, key: str) -> str | None:
+        if not self.points:
+            return None
+        index = bisect.bisect(self.keys, _hash(key)) % len(self.points)
+        return self.points[index][1]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class LoadTable:
+    """Latest load report (live games and RPCs per second) of every server. Reports older
+    than max_age seconds are ignored, so servers that stopped reporting get no new games."""
+
+    def __init__(self, max_age: float = 3):
+        self.max_age = max_age
+        self.reports: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def update(self, address: str, report: dict) -> None:
+        with self.lock:
+            self.reports[address] = {**report, "reported_at": time.monotonic()}
+
+    def merge(self, reports: dict) -> None:
+        """Applies the table another server sent, ages are given in seconds."""
+        now = time.monotonic()
+        with self.lock:
+            for address, report in reports.items():
+                self.reports[address] = {**report, "reported_at": now - report.get("age", 0)}
+
+    def added_game(self, address: str) -> None:
+        """Counts a game placed on address until its next report arrives, so a burst of
+        placements doesn't all go to the same server."""
+        with self.lock:
+            if address in self.reports:
+                self.reports[address]["games"] += 1
+
+    def live(self) -> dict[str, dict]:
+        now = time.monotonic()
+        with self.lock:
+            return {address: report for address, report in self.reports.items()
+                    if now - report["reported_at"] <= self.max_age}
+
+    def snapshot(self) -> dict[str, dict]:
+        """Returns the live reports with their age instead of a local timestamp."""
+        now = time.monotonic()
+        return {address: {"games": report["games"], "rpc_rate": report["rpc_rate"],
+                          "age": round(now - report["reported_at"], 3)}
+                for address, report in self.live().items()}
+
+    def least_loaded(self, prefer: str) -> str:
+        """Returns the live server with the lowest load, prefer wins ties."""
+        candidates = self.live()
+        if not candidates:
+            return prefer
+        return min(candidates, key=lambda address: (score(candidates[address]),
+                                                    address != prefer, address))
+
+
+def score(report: dict) -> float:
+    return report["games"] + report["rpc_rate"] / RPCS_PER_GAME
@@ -1,7 +1,69 @@
 # pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
 # pylint: disable=missing-function-docstring,missing-class-docstring
+import os
+import queue
 import sqlite3
-from typing import TypedDict
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypedDict
+from uuid import uuid4
+
+from logs import get_logger
+
+log = get_logger("database")
+
+
+class ConnectionPool:
+    """Keeps up to size open connections to the database and lends them to one thread
+    at a time, so request threads don't pay for a connect/close on every query.
+    Connections use WAL journaling so readers don't block the writer, and wait for
+    locks instead of failing with "database is locked". The sqlite3 module keeps
+    compiled statements in a per-connection cache, so the fixed SQL strings in this
+    module are only prepared once per pooled connection.
+    observe(seconds), if given, is called with how long each borrowed connection was held."""
+
+    def __init__(self, path: str, size: int = 8,
+                 observe: Callable[[float], None] | None = None):
+        self.path = path
+        self.size = size
+        self.observe = observe
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=10, cached_statements=256,
+                              check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            con = self.idle.get_nowait()
+        except queue.Empty:
+            con = self._connect()
+        started = time.perf_counter()
+        try:
+            yield con
+        finally:
+            if self.observe:
+                self.observe(time.perf_counter() - started)
+            if self.idle.qsize() < self.size:
+                self.idle.put(con)
+            else:
+                con.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# path of the statistics database, can be changed with set_database_path()
+DATABASE_PATH = os.getenv("DATABASE_PATH", "statistics_database.db")
+_pool = ConnectionPool(DATABASE_PATH, int(os.getenv("DATABASE_POOL_SIZE", "8")))
 
 
 class Stats(TypedDict):
@@ -11,6 +73,37 @@ class Stats(TypedDict):
     matches_lost: int
 
 
+def set_database_path(path: str) -> None:
+    """Closes the pooled connections and uses a different database file from now on."""
+    global DATABASE_PATH, _pool  # pylint: disable=global-statement
+    _pool.close()
+    DATABASE_PATH = path
+    _pool = ConnectionPool(path, _pool.size, _pool.observe)
+
+
+def close_connections() -> None:
+    """Closes the pooled connections, e.g. before forking processes that must not share them."""
+    _pool.close()
+
+
+def set_query_observer(observe: Callable[[float], None] | None) -> None:
+    """Has observe(seconds) called every time a borrowed connection is given back."""
+    _pool.observe = observe
+
+
+def connection():
+    """Borrows a connection from the pool. Use as a context manager."""
+    return _pool.connection()
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Borrows a connection and commits when the block ends, or rolls back on error."""
+    with _pool.connection() as con:
+        with con:
+            yield con
+
+
 def database_entry_to_stats(result: tuple) -> Stats:
     """Converts a database entry into a Stats dict."""
     stats: Stats = {
@@ -24,78 +117,214 @@ def database_entry_to_stats(result: tuple) -> Stats:
 
 def upsert_stats(stats_list: list[Stats]) -> None:
     """Upserts a list of Stats rows into the local database by player_name.
-    Creates missing players and updates games_won/games_lost to the provided values."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-    for s in stats_list:
-        # Try update; if no rows affected, insert
-        cur.execute(
-            "UPDATE statistics SET games_won = ?, games_lost = ? WHERE player_name = ?",
-            [s["games_won"], s["games_lost"], s["player_name"]],
+    Creates missing players and updates games_won/games_lost to the provided values.
+    All rows are written with one executemany in a single transaction."""
+    if not stats_list:
+        return
+    with transaction() as con:
+        con.executemany(
+            "INSERT INTO statistics(player_name, games_won, games_lost) VALUES(?, ?, ?) "
+            "ON CONFLICT(player_name) DO UPDATE SET "
+            "games_won = excluded.games_won, games_lost = excluded.games_lost",
+            ((s["player_name"], s["games_won"], s["games_lost"]) for s in stats_list),
         )
-        if cur.rowcount == 0:
-            try:
-                # Make new entry when update affected no rows (i.e. player_name not found)
-                cur.execute(
-                    "INSERT INTO statistics(player_name, games_won, games_lost) VALUES(?, ?, ?)",
-                    [s["player_name"], s["games_won"], s["games_lost"]],
-                )
-            except sqlite3.IntegrityError:
-                # In case of race condition, try update again. This activates only
-                # if new name is added between the first update and the insert.
-                cur.execute(
-                    "UPDATE statistics SET games_won = ?, games_lost = ? WHERE player_name = ?",
-                    [s["games_won"], s["games_lost"], s["player_name"]],
-                )
-    con.commit()
-    con.close()
 
 
 def init_database(insert_test_data: bool = False) -> None:
     """Called when a game server starts to create the database and the statistics table."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-    # this seems to be automatically committed, resulting
-    # in weird behavior if the function fails after this line
-    cur.execute(
-        "CREATE TABLE statistics(player_id INTEGER PRIMARY KEY AUTOINCREMENT, "
-        "player_name UNIQUE, games_won, games_lost)")
-
-    if insert_test_data:
-        cur.execute(
-            "INSERT INTO statistics(player_name, games_won, games_lost) VALUES('Juhani', 0, 0)")
+    with transaction() as con:
+        cur = con.cursor()
+        # this seems to be automatically committed, resulting
+        # in weird behavior if the function fails after this line
         cur.execute(
-            "INSERT INTO statistics(player_name, games_won, games_lost) VALUES('VP', 1, 2)")
+            "CREATE TABLE statistics(player_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "player_name UNIQUE, games_won, games_lost)")
+
+        if insert_test_data:
+            cur.execute(
+                "INSERT INTO statistics(player_name, games_won, games_lost) "
+                "VALUES('Juhani', 0, 0)")
+            cur.execute(
+                "INSERT INTO statistics(player_name, games_won, games_lost) VALUES('VP', 1, 2)")
 
-    con.commit()
-    con.close()
+
+def create_change_log() -> None:
+    """Sets up statistics versioning if it doesn't exist yet. Every insert or update of a
+    statistics row appends the new values to the append-only statistics_changes table
+    (through triggers, so every write path is covered) and stores the log entry's number
+    in the row's version column. Replicas catch up by asking the main server for the
+    changes after the last version they applied, see get_changes_since()."""
+    with transaction() as con:
+        columns = [row[1] for row in con.execute("PRAGMA table_info(statistics)")]
+        if "version" not in columns:
+            con.execute("ALTER TABLE statistics ADD COLUMN version INTEGER DEFAULT 0")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS statistics_changes("
+            "version INTEGER PRIMARY KEY AUTOINCREMENT, player_name, games_won, games_lost)")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS replication_state(key TEXT PRIMARY KEY, value)")
+        # identifies this database's change log, versions from different logs can't be mixed
+        con.execute("INSERT OR IGNORE INTO replication_state(key, value) VALUES('log_id', ?)",
+                    [uuid4().hex])
+        con.execute(
+            "CREATE TRIGGER IF NOT EXISTS statistics_log_insert AFTER INSERT ON statistics "
+            "BEGIN "
+            "INSERT INTO statistics_changes(player_name, games_won, games_lost) "
+            "VALUES(NEW.player_name, NEW.games_won, NEW.games_lost); "
+            "UPDATE statistics SET version = last_insert_rowid() "
+            "WHERE player_id = NEW.player_id; "
+            "END")
+        con.execute(
+            "CREATE TRIGGER IF NOT EXISTS statistics_log_update "
+            "AFTER UPDATE OF games_won, games_lost ON statistics "
+            "WHEN OLD.games_won IS NOT NEW.games_won OR OLD.games_lost IS NOT NEW.games_lost "
+            "BEGIN "
+            "INSERT INTO statistics_changes(player_name, games_won, games_lost) "
+            "VALUES(NEW.player_name, NEW.games_won, NEW.games_lost); "
+            "UPDATE statistics SET version = last_insert_rowid() "
+            "WHERE player_id = NEW.player_id; "
+            "END")
+
+
+def get_replication_state(key: str, default=None):
+    with connection() as con:
+        result = con.execute("SELECT value FROM replication_state WHERE key = ?",
+                             [key]).fetchone()
+    return default if result is None else result[0]
+
+
+def set_replication_state(key: str, value) -> None:
+    with transaction() as con:
+        con.execute("INSERT OR REPLACE INTO replication_state(key, value) VALUES(?, ?)",
+                    [key, value])
+
+
+def get_changes_since(version: int, limit: int = 10_000) -> dict:
+    """Returns up to limit statistics changes newer than version, oldest first.
+    full is True if the changes after version have already been pruned, in which
+    case the caller has to copy the whole table instead."""
+    with connection() as con:
+        log_id = con.execute(
+            "SELECT value FROM replication_state WHERE key = 'log_id'").fetchone()[0]
+        oldest, latest = con.execute(
+            "SELECT MIN(version), MAX(version) FROM statistics_changes").fetchone()
+        latest = latest or con.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence "
+            "WHERE name = 'statistics_changes'").fetchone()[0]
+        # with every change pruned, the next one to be logged is the oldest
+        if version < (latest + 1 if oldest is None else oldest) - 1:
+            return {"log_id": log_id, "version": latest, "full": True, "changes": []}
+        result = con.execute(
+            "SELECT version, player_name, games_won, games_lost FROM statistics_changes "
+            "WHERE version > ? ORDER BY version LIMIT ?", [version, limit]).fetchall()
+    changes = [{"version": entry[0], "player_name": entry[1],
+                "games_won": entry[2], "games_lost": entry[3]} for entry in result]
+    return {"log_id": log_id, "version": latest, "full": False, "changes": changes}
+
+
+def prune_changes(keep: int = 100_000) -> None:
+    """Deletes all but the newest keep entries of the change log."""
+    with transaction() as con:
+        con.execute("DELETE FROM statistics_changes WHERE version <= "
+                    "(SELECT MAX(version) FROM statistics_changes) - ?", [keep])
+
+
+# leaderboard orderings, each backed by an index on (expression, player_id)
+LEADERBOARD_ORDERS = {
+    "wins": "games_won",
+    "win_rate": "games_won * 1.0 / MAX(games_won + games_lost, 1)",
+    "games_played": "games_won + games_lost",
+}
+
+
+def create_indexes() -> None:
+    """Creates the leaderboard indexes if they don't exist yet.
+    Called on every server start so databases created before they existed get them too."""
+    with transaction() as con:
+        for order_by, expression in LEADERBOARD_ORDERS.items():
+            con.execute(f"CREATE INDEX IF NOT EXISTS statistics_by_{order_by} "
+                        f"ON statistics({expression}, player_id)")
+
+
+def get_leaderboard(order_by: str = "wins", limit: int = 20,
+                    cursor: str = "") -> dict:
+    """Returns one page of players sorted by order_by (a key of LEADERBOARD_ORDERS),
+    best first, with ties broken by newest player_id first.
+    Pass the returned next_cursor back to get the following page; it is empty on the last
+    page. Pages are read straight from the index, so the cost depends on limit only."""
+    if order_by not in LEADERBOARD_ORDERS:
+        raise ValueError(f"unknown leaderboard order: {order_by}")
+    expression = LEADERBOARD_ORDERS[order_by]
+    where = ""
+    params: list = []
+    if cursor:
+        sort_key, player_id = cursor.split(",")
+        sort_key = float(sort_key) if order_by == "win_rate" else int(sort_key)
+        # the plain bound on the expression lets SQLite seek into the expression index,
+        # the row value comparison alone would only be applied as a filter
+        where = f"WHERE {expression} <= ? AND ({expression}, player_id) < (?, ?)"
+        params = [sort_key, sort_key, int(player_id)]
+    with connection() as con:
+        result = con.execute(
+            f"SELECT player_id, player_name, games_won, games_lost, {expression} "
+            f"FROM statistics {where} "
+            f"ORDER BY {expression} DESC, player_id DESC LIMIT ?",
+            params + [limit + 1]).fetchall()
+
+    # one row more than asked for tells whether there is a next page
+    next_cursor = ""
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = f"{result[-1][4]!r},{result[-1][0]}"
+    return {"rows": [database_entry_to_stats(entry) for entry in result],
+            "next_cursor": next_cursor}
+
+
+def get_player_rank(player_name: str, order_by: str = "wins") -> int | None:
+    """Returns the 1-based leaderboard position of a player, or None if not found."""
+    if order_by not in LEADERBOARD_ORDERS:
+        raise ValueError(f"unknown leaderboard order: {order_by}")
+    expression = LEADERBOARD_ORDERS[order_by]
+    with connection() as con:
+        player = con.execute(
+            f"SELECT {expression}, player_id FROM statistics WHERE player_name = ?",
+            [player_name]).fetchone()
+        if player is None:
+            return None
+        ahead = con.execute(
+            f"SELECT COUNT(*) FROM statistics "
+            f"WHERE {expression} >= ? AND ({expression}, player_id) > (?, ?)",
+            [player[0], player[0], player[1]]).fetchone()
+    return ahead[0] + 1
 
 
 def scores_exist() -> bool:
     """Returns True if the statistics table exists 
     (init_database() has been called), or False otherwise."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-    cur.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name='statistics'")
-    table_name = cur.fetchone()
-    con.close()
+    with connection() as con:
+        table_name = con.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='statistics'").fetchone()
 
     if table_name is None:
         return False
     return True
 
 
+def prepare_database() -> None:
+    """Creates the statistics database, its indexes and change log if they don't exist.
+    Called when a game server starts."""
+    if not scores_exist():
+        init_database(insert_test_data=False)
+    create_indexes()
+    create_change_log()
+
+
 def get_all_stats() -> list[Stats] | None:
     """Returns a list of Stats dicts for all players in database, 
     or None if the database is empty."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-    cur.execute(
-        "SELECT player_id, player_name, games_won, games_lost FROM statistics")
-    result = cur.fetchall()
-    con.commit()
-    con.close()
+    with connection() as con:
+        result = con.execute(
+            "SELECT player_id, player_name, games_won, games_lost FROM statistics").fetchall()
 
     if result:
         all_statistics = []
@@ -107,14 +336,10 @@ def get_all_stats() -> list[Stats] | None:
 
 def get_player_stats(player_name: str) -> Stats | None:
     """Returns the Stats dict of a player if found, or None otherwise."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-    cur.execute(
-        "SELECT player_id, player_name, games_won, games_lost "
-        "FROM statistics WHERE player_name = ?", [(player_name)])
-    result = cur.fetchone()
-    con.commit()
-    con.close()
+    with connection() as con:
+        result = con.execute(
+            "SELECT player_id, player_name, games_won, games_lost "
+            "FROM statistics WHERE player_name = ?", [(player_name)]).fetchone()
 
     if result:
         return database_entry_to_stats(result)
@@ -124,38 +349,47 @@ def get_player_stats(player_name: str) -> Stats | None:
 def create_database_entry(player_name: str) -> int | bool:
     """Adds a new player into the statistics table, and returns their ID.
     If a player with that name already exists, returns False."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-
     try:
-        cur.execute("INSERT INTO statistics(player_name, games_won, games_lost) VALUES(?, 0, 0)", [
-                    player_name])
+        with transaction() as con:
+            cur = con.execute(
+                "INSERT INTO statistics(player_name, games_won, games_lost) VALUES(?, 0, 0)",
+                [player_name])
     except sqlite3.IntegrityError:
-        con.close()
         return False
 
-    cur.execute("SELECT player_id FROM statistics WHERE player_name = ?", [
-                player_name])
-    result = cur.fetchone()
-    con.commit()
-    con.close()
+    return cur.lastrowid
 
-    return result[0]
+
+def record_match(winning_player_name: str, losing_player_name: str) -> list[Stats]:
+    """Adds a win for the winner and a loss for the loser in a single transaction,
+    creating missing players on the way. Empty names are skipped.
+    Returns the updated Stats of both players."""
+    updated = []
+    with transaction() as con:
+        for player_name, won in ((winning_player_name, 1), (losing_player_name, 0)):
+            if not player_name:
+                continue
+            result = con.execute(
+                "INSERT INTO statistics(player_name, games_won, games_lost) VALUES(?, ?, ?) "
+                "ON CONFLICT(player_name) DO UPDATE SET "
+                "games_won = games_won + excluded.games_won, "
+                "games_lost = games_lost + excluded.games_lost "
+                "RETURNING player_id, player_name, games_won, games_lost",
+                [player_name, won, 1 - won]).fetchone()
+            updated.append(database_entry_to_stats(result))
+    return updated
 
 
 def record_game_results(player_name: str, won: bool) -> None:
     """Increases either games_won or games_lost for the player with player_name."""
-    con = sqlite3.connect("statistics_database.db")
-    cur = con.cursor()
-    if won:
-        cur.execute(
-            "UPDATE statistics SET games_won = games_won + 1 "
-            "WHERE player_name = ?", [(player_name)])
-        print(f"Increased {player_name}'s won games amount by 1")
-    else:
-        cur.execute(
-            "UPDATE statistics SET games_lost = games_lost + 1 "
-            "WHERE player_name = ?", [(player_name)])
-        print(f"Increased {player_name}'s lost games amount by 1")
-    con.commit()
-    con.close()
+    with transaction() as con:
+        if won:
+            con.execute(
+                "UPDATE statistics SET games_won = games_won + 1 "
+                "WHERE player_name = ?", [(player_name)])
+            log.debug("Increased %s's won games amount by 1", player_name)
+        else:
+            con.execute(
+                "UPDATE statistics SET games_lost = games_lost + 1 "
+                "WHERE player_name = ?", [(player_name)])
+            log.debug("Increased %s's lost games amount by 1", player_name)
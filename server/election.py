@@ -0,0 +1,51 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+
+class FailureDetector:
+    """Counts consecutive missed heartbeats to the main server. The main server is
+    suspected to be down once threshold heartbeats in a row have failed, so a single
+    dropped packet doesn't start an election."""
+
+    def __init__(self, threshold: int = 2):
+        self.threshold = threshold
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def heartbeat_ok(self) -> None:
+        with self.lock:
+            self.misses = 0
+
+    def heartbeat_missed(self) -> bool:
+        """Records a missed heartbeat and returns True if the main server is now suspected."""
+        with self.lock:
+            self.misses += 1
+            return self.misses >= self.threshold
+
+    @property
+    def suspected(self) -> bool:
+        return self.misses >= self.threshold
+
+
+def any_replied_ok(pool: ThreadPoolExecutor, peers: list[str],
+                   send: Callable[[str], str], timeout: float) -> bool:
+    """Calls send(peer) for every peer at once and returns True as soon as one of them
+    replies "OK", or False once all have failed or timeout seconds have passed."""
+    deadline = time.monotonic() + timeout
+    pending = {pool.submit(send, peer) for peer in peers}
+    while pending:
+        done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            return False
+        for future in done:
+            try:
+                if future.result() == "OK":
+                    return True
+            except Exception:
+                continue
+    return False
@@ -0,0 +1,101 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-many-instance-attributes
+import threading
+import time
+
+from battleship_game import BattleshipGame
+
+
+class GameStore:
+    """Holds the live games of a server together with their players and last activity time.
+    Finished and canceled games are evicted after finished_ttl seconds,
+    and games nobody has touched for idle_ttl seconds are evicted as abandoned."""
+
+    def __init__(self, finished_ttl: float = 300, idle_ttl: float = 1800, on_remove=None):
+        self.finished_ttl = finished_ttl
+        self.idle_ttl = idle_ttl
+        self.games: dict[str, BattleshipGame] = {}
+        # matches game_id to a dictionary containing both players' name and player number
+        # Example:
+        # 9f2a0d11-2efd: {1: "Juhani", 2: "VP"}
+        self.player_names: dict[str, dict[int, str]] = {}
+        # matches game_id to the time.monotonic() of its last RPC
+        self.last_activity: dict[str, float] = {}
+        # matches game_id to the time.monotonic() it was first seen finished or canceled
+        self.ended_at: dict[str, float] = {}
+        self.evicted = {"finished": 0, "canceled": 0, "idle": 0}
+        self.lock = threading.Lock()
+        # called with the game_id of every removed or evicted game
+        self.on_remove = on_remove
+
+    def __contains__(self, game_id) -> bool:
+        return game_id in self.games
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def add(self, game_id: str, game: BattleshipGame, player_names: dict[int, str]) -> None:
+        with self.lock:
+            self.games[game_id] = game
+            self.player_names[game_id] = player_names
+            self.last_activity[game_id] = time.monotonic()
+
+    def get(self, game_id: str) -> BattleshipGame:
+        """Returns the game and marks it as active. Raises KeyError for unknown
+        or evicted games."""
+        game = self.games[game_id]
+        self.last_activity[game_id] = time.monotonic()
+        return game
+
+    def items(self) -> list[tuple[str, BattleshipGame, dict[int, str]]]:
+        """Returns every game with its players, e.g. for writing a snapshot."""
+        with self.lock:
+            return [(game_id, game, self.player_names[game_id])
+                    for game_id, game in self.games.items()]
+
+    def get_player_name(self, game_id: str, player_id: int) -> str:
+        return self.player_names[game_id][player_id]
+
+    def remove(self, game_id: str) -> None:
+        with self.lock:
+            self._remove(game_id)
+
+    def _remove(self, game_id: str) -> None:
+        if self.games.pop(game_id, None) is not None and self.on_remove:
+            self.on_remove(game_id)
+        self.player_names.pop(game_id, None)
+        self.last_activity.pop(game_id, None)
+        self.ended_at.pop(game_id, None)
+
+    def evict_expired(self, now: float | None = None) -> int:
+        """Removes finished, canceled and idle games whose TTL has passed.
+        Returns the number of games evicted."""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        with self.lock:
+            for game_id, game in list(self.games.items()):
+                if game.winner is not None or game.game_canceled:
+                    ended = self.ended_at.setdefault(game_id, now)
+                    if now - ended < self.finished_ttl:
+                        continue
+                    reason = "canceled" if game.game_canceled else "finished"
+                elif now - self.last_activity.get(game_id, now) >= self.idle_ttl:
+                    reason = "idle"
+                else:
+                    continue
+                self._remove(game_id)
+                self.evicted[reason] += 1
+                evicted += 1
+        return evicted
+
+    def counts(self) -> dict:
+        """Returns the number of live and finished games in memory and of evicted games."""
+        with self.lock:
+            finished = sum(1 for game in self.games.values()
+                           if game.winner is not None or game.game_canceled)
+            return {
+                "live": len(self.games) - finished,
+                "finished": finished,
+                "evicted": sum(self.evicted.values()),
+                "evicted_by_reason": dict(self.evicted),
+            }
@@ -0,0 +1,170 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,consider-using-with
+import gc
+import glob
+import json
+import os
+import threading
+
+from battleship_game import BattleshipGame
+
+
+class GameJournal:
+    """Append-only on-disk log of the live games of a server, so they survive a restart.
+    Records are buffered in memory and written in batches by flush(), so the RPCs that
+    record them only append to a list. snapshot() writes every live game to one file and
+    starts a new log segment, after which the older segments are deleted.
+
+    Files in directory:
+        snapshot.json          {"segment": N, "games": {game_id: {"names": .., "game": ..}}}
+        segment-00000N.log     one JSON record per line, written after the snapshot
+
+    Records:
+        {"t": "new", "id": game_id, "names": {"1": .., "2": ..}, "game": <to_snapshot()>}
+        {"t": "fire", "id": game_id, "p": player_id, "r": row, "c": col}
+        {"t": "cancel", "id": game_id, "p": player_id}
+        {"t": "drop", "id": game_id}
+
+    A record may be both in the snapshot and in the segment after it. Replaying it again
+    changes nothing: new is skipped for known games and a repeated shot is rejected."""
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.buffer: list[str] = []
+        # held while appending to or swapping the buffer
+        self.buffer_lock = threading.Lock()
+        # held while writing to or rotating the segment file
+        self.write_lock = threading.Lock()
+        segments = self._segments()
+        self.segment = segments[-1] + 1 if segments else 1
+        self.file = open(self._segment_path(self.segment), "a", encoding="utf-8")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:08d}.log")
+
+    def _segments(self) -> list[int]:
+        return sorted(int(os.path.basename(path)[8:16])
+                      for path in glob.glob(os.path.join(self.directory, "segment-*.log")))
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":"))
+        with self.buffer_lock:
+            self.buffer.append(line)
+
+    def record_new(self, game_id: str, game: BattleshipGame, names: dict) -> None:
+        self._append({"t": "new", "id": game_id, "names": names, "game": game.to_snapshot()})
+
+    def record_fire(self, game_id: str, player_id: int, row: int, col: int) -> None:
+        self._append({"t": "fire", "id": game_id, "p": player_id, "r": row, "c": col})
+
+    def record_cancel(self, game_id: str, player_id: int) -> None:
+        self._append({"t": "cancel", "id": game_id, "p": player_id})
+
+    def record_drop(self, game_id: str) -> None:
+        self._append({"t": "drop", "id": game_id})
+
+    def flush(self) -> None:
+        """Writes the buffered records to the current segment in one batch."""
+        with self.write_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        with self.buffer_lock:
+            lines, self.buffer = self.buffer, []
+        if not lines:
+            return
+        self.file.write("\n".join(lines) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def snapshot(self, games) -> int:
+        """Writes the games returned by games() ((game_id, game, names) tuples, e.g.
+        GameStore.items) to snapshot.json and deletes the segments it replaces. Records
+        written while the snapshot is taken go to a new segment. games() is called after
+        that segment is started, so a game whose "new" record went to an older segment
+        has to be in the store by then: add it before recording it. Returns the number
+        of games written."""
+        with self.write_lock:
+            self._flush()
+            self.file.close()
+            self.segment += 1
+            self.file = open(self._segment_path(self.segment), "a", encoding="utf-8")
+        data = {"segment": self.segment,
+                "games": {game_id: {"names": names, "game": game.to_snapshot()}
+                          for game_id, game, names in games()}}
+        path = os.path.join(self.directory, "snapshot.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            # dumps() uses the C encoder, dump() would encode piece by piece in Python
+            file.write(json.dumps(data, separators=(",", ":")))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        for segment in self._segments():
+            if segment < self.segment:
+                os.remove(self._segment_path(segment))
+        return len(data["games"])
+
+    def recover(self) -> dict[str, tuple[BattleshipGame, dict[int, str]]]:
+        """Rebuilds the games from the last snapshot and the segments written after it.
+        A line cut short by a crash ends its segment."""
+        # recovery only allocates, pausing the garbage collector saves the repeated full
+        # collections that a growing heap of games would otherwise trigger
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._recover()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _recover(self) -> dict[str, tuple[BattleshipGame, dict[int, str]]]:
+        path = os.path.join(self.directory, "snapshot.json")
+        first_segment = 0
+        games = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            first_segment = data["segment"]
+            for game_id, entry in data["games"].items():
+                games[game_id] = (BattleshipGame.from_snapshot(entry["game"]),
+                                  _player_names(entry["names"]))
+        for segment in self._segments():
+            if segment < first_segment:
+                continue
+            with open(self._segment_path(segment), encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    _replay(games, record)
+        return games
+
+    def close(self) -> None:
+        with self.write_lock:
+            self._flush()
+            self.file.close()
+
+
+def _player_names(names: dict) -> dict[int, str]:
+    # JSON object keys are strings, GameStore uses player numbers
+    return {int(player_id): name for player_id, name in names.items()}
+
+
+def _replay(games: dict, record: dict) -> None:
+    game_id = record["id"]
+    if record["t"] == "new":
+        if game_id not in games:
+            games[game_id] = (BattleshipGame.from_snapshot(record["game"]),
+                              _player_names(record["names"]))
+    elif record["t"] == "drop":
+        games.pop(game_id, None)
+    elif game_id in games:
+        game = games[game_id][0]
+        if record["t"] == "fire":
+            game.fire(record["p"], record["r"], record["c"])
+        elif record["t"] == "cancel" and not game.game_canceled:
+            game.cancel_game(record["p"])
@@ -0,0 +1,150 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler
+
+# level of every component, optionally followed by the levels of single components,
+# for example "INFO,election=DEBUG,database=WARNING"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "text" for readable lines, "json" for one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+ROOT_LOGGER = "battleship"
+
+# attributes every LogRecord has, anything else was passed with extra= and is logged as a field
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def get_logger(component: str) -> logging.Logger:
+    """Returns the logger of one part of the server, e.g. get_logger("election")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{component}")
+
+
+def _fields(record: logging.LogRecord, constant_fields: dict) -> dict:
+    return {**constant_fields, **{key: value for key, value in vars(record).items()
+                                  if key not in RECORD_ATTRIBUTES}}
+
+
+class TextFormatter(logging.Formatter):
+    """Time, level, logger and message, followed by the fields as key=value."""
+
+    def __init__(self, constant_fields: dict):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.constant_fields = constant_fields
+
+    def formatMessage(self, record):
+        fields = " ".join(f"{key}={value}"
+                          for key, value in _fields(record, self.constant_fields).items())
+        line = super().formatMessage(record)
+        return f"{line} {fields}" if fields else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the fields as keys."""
+
+    def __init__(self, constant_fields: dict):
+        super().__init__()
+        self.constant_fields = constant_fields
+
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage(), **_fields(record, self.constant_fields)}
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class InProcessQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # the listener runs in this process, so the message is formatted on its thread
+        # instead of the one that logged it
+        return record
+
+
+class LogWriter:
+    """The thread that writes the queued records, one per process. Records that piled up
+    while it was writing are written together with one flush."""
+
+    def __init__(self):
+        self.records: queue.SimpleQueue | None = None
+        self.thread: threading.Thread | None = None
+        self.pid = 0
+
+    def start(self, records: queue.SimpleQueue, formatter: logging.Formatter,
+              stream) -> None:
+        self.stop()
+        self.records = records
+        self.thread = threading.Thread(target=self._run, args=(records, formatter, stream),
+                                       name="log writer", daemon=True)
+        self.thread.start()
+        self.pid = os.getpid()
+
+    def stop(self) -> None:
+        """Writes the records still in the queue and stops the thread. A forked process
+        doesn't have its parent's thread, and drops it without waiting for it."""
+        if self.thread is not None and self.pid == os.getpid():
+            self.records.put(None)
+            self.thread.join()
+        self.thread = None
+
+    @staticmethod
+    def _run(records: queue.SimpleQueue, formatter: logging.Formatter, stream) -> None:
+        while True:
+            batch = [records.get()]
+            while True:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                try:
+                    lines.append(formatter.format(record) + "\n")
+                except Exception:
+                    lines.append(f"Failed to format log record {record.msg!r}\n")
+            try:
+                stream.write("".join(lines))
+                stream.flush()
+            except Exception:
+                pass
+            if None in batch:
+                return
+
+
+_writer = LogWriter()
+
+
+def setup_logging(**constant_fields) -> None:
+    """Sends the records of every battleship logger through a queue to a background thread
+    that writes them to stdout, so logging never waits for I/O. constant_fields (e.g. the
+    server's address) are added to every record. A forked worker process calls this again
+    to get a writer thread of its own."""
+    root = logging.getLogger(ROOT_LOGGER)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for setting in LOG_LEVEL.split(","):
+        component, _, level = setting.rpartition("=")
+        logger = get_logger(component.strip()) if component else root
+        logger.setLevel(level.strip().upper())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(InProcessQueueHandler(records))
+    _writer.start(records, JsonFormatter(constant_fields) if LOG_FORMAT == "json"
+                  else TextFormatter(constant_fields), sys.stdout)
+
+
+def stop_logging() -> None:
+    """Writes the records still in the queue and stops the writer thread."""
+    _writer.stop()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,129 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from uuid import uuid4
+
+
+@dataclass
+class WaitingPlayer:
+    player_name: str
+    game_id: str
+    joined_at: float = field(default_factory=time.monotonic)
+    # set when another player takes this one out of the lobby
+    matched: bool = False
+
+
+class Lobby:
+    """FIFO matchmaking queue split into stripes, each with its own queue and lock, so
+    joins only contend within a stripe. With skill matching every skill bucket is a
+    stripe. Without it, joins are spread over the stripes in turn and take the first
+    waiting player found in any of them, so the queue is only roughly FIFO.
+
+    With skill matching, a player whose bucket is empty is matched with someone from
+    another bucket (closest skill first) who has waited at least max_wait seconds.
+
+    on_match(game_id) passed to join() is called while the waiting player is still in the
+    lobby, so the game can be registered before the lobby stops reporting it."""
+
+    def __init__(self, skill_matching: bool = False, buckets: int = 5, max_wait: float = 10,
+                 stripes: int = 8):
+        self.skill_matching = skill_matching
+        self.bucket_count = buckets if skill_matching else stripes
+        self.max_wait = max_wait
+        self.queues = [deque() for _ in range(self.bucket_count)]
+        self.locks = [threading.Lock() for _ in range(self.bucket_count)]
+        # stripe of the next join without skill matching
+        self.next_stripe = itertools.count()
+
+    def bucket_for(self, skill: float | None) -> int:
+        """Maps a skill between 0 and 1 (None if unknown) to a bucket index."""
+        if skill is None:
+            return self.bucket_count // 2
+        return min(int(skill * self.bucket_count), self.bucket_count - 1)
+
+    @staticmethod
+    def _take(queue: deque, on_match) -> tuple[int, str, str]:
+        """Matches the first player of queue, whose lock the caller holds."""
+        waiting = queue[0]
+        if on_match:
+            on_match(waiting.game_id)
+        queue.popleft()
+        waiting.matched = True
+        return (2, waiting.game_id, waiting.player_name)
+
+    def join(self, player_name: str, skill: float | None = None,
+             on_match=None) -> tuple[int, str, str | None]:
+        """Returns (player_id, game_id, opponent_name). Player 1 gets a fresh game_id
+        and waits in the lobby, player 2 gets the game_id and name of the player it was
+        matched with."""
+        if not self.skill_matching:
+            return self._join_any(player_name, on_match)
+        bucket = self.bucket_for(skill)
+        with self.locks[bucket]:
+            if self.queues[bucket]:
+                return self._take(self.queues[bucket], on_match)
+
+        # other buckets are only searched after our own lock is released,
+        # so at most one bucket lock is held at a time
+        for other in sorted(range(self.bucket_count), key=lambda b: abs(b - bucket)):
+            if other == bucket:
+                continue
+            with self.locks[other]:
+                queue = self.queues[other]
+                if queue and time.monotonic() - queue[0].joined_at >= self.max_wait:
+                    return self._take(queue, on_match)
+
+        with self.locks[bucket]:
+            if self.queues[bucket]:
+                return self._take(self.queues[bucket], on_match)
+            waiting = WaitingPlayer(player_name, str(uuid4()))
+            self.queues[bucket].append(waiting)
+            return (1, waiting.game_id, None)
+
+    def _join_any(self, player_name: str, on_match) -> tuple[int, str, str | None]:
+        home = next(self.next_stripe) % self.bucket_count
+        order = [(home + i) % self.bucket_count for i in range(self.bucket_count)]
+        for stripe in order:
+            with self.locks[stripe]:
+                if self.queues[stripe]:
+                    return self._take(self.queues[stripe], on_match)
+
+        waiting = WaitingPlayer(player_name, str(uuid4()))
+        with self.locks[home]:
+            self.queues[home].append(waiting)
+        # a player joining another stripe at the same time may have missed this one and
+        # queued too. Whichever of them queued last finds the other here and takes them,
+        # with both locks held (lower stripe first), so no two players are left waiting
+        for stripe in order[1:]:
+            with self.locks[min(home, stripe)], self.locks[max(home, stripe)]:
+                if waiting.matched:
+                    break
+                if self.queues[stripe]:
+                    self.queues[home].remove(waiting)
+                    return self._take(self.queues[stripe], on_match)
+        return (1, waiting.game_id, None)
+
+    def is_waiting(self, game_id: str) -> bool:
+        for queue, lock in zip(self.queues, self.locks):
+            with lock:
+                if any(waiting.game_id == game_id for waiting in queue):
+                    return True
+        return False
+
+    def cancel(self, game_id: str) -> bool:
+        """Removes a waiting player from the lobby. Returns False if game_id was not waiting."""
+        for queue, lock in zip(self.queues, self.locks):
+            with lock:
+                for waiting in queue:
+                    if waiting.game_id == game_id:
+                        queue.remove(waiting)
+                        return True
+        return False
+
+    def depth(self) -> int:
+        """Returns the number of players waiting for an opponent."""
+        return sum(len(queue) for queue in self.queues)
@@ -0,0 +1,171 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import bisect
+import threading
+import time
+from typing import Callable, Collection
+
+from logs import get_logger
+
+log = get_logger("metrics")
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30)
+
+# Content-Type of the text format, Prometheus' text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Counts observations in buckets like a Prometheus histogram, plus their sum
+    and how many of them were errors. Metrics holds the lock that guards it."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # one count per bucket, and the last one for observations above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.errors += error
+
+    def quantile(self, q: float) -> float | None:
+        """Returns the upper bound of the bucket the q-quantile falls in."""
+        count = sum(self.counts)
+        if not count:
+            return None
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= q * count:
+                return bound
+        return float("inf")
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.total = self.total
+        histogram.errors = self.errors
+        return histogram
+
+    def summary(self) -> dict:
+        count = sum(self.counts)
+        return {"count": count, "errors": self.errors, "seconds": self.total,
+                "mean": self.total / count if count else None,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class Metrics:
+    """Call counts, errors and latency histograms of the RPCs a server handles, time spent
+    in the database, and gauges that are read when the metrics are collected. Recording
+    a call only takes a lock and a bisect, so the metrics are always on.
+
+    Calls to a name that isn't in methods (the RPCs the server has) are counted as
+    "other", so clients calling made-up method names can't grow the metrics without
+    bound. Without methods, every name is tracked separately."""
+
+    def __init__(self, prefix: str = "battleship", methods: Collection[str] | None = None):
+        self.prefix = prefix
+        self.methods = None if methods is None else frozenset(methods)
+        self.rpcs: dict[str, Histogram] = {}
+        self.database = Histogram()
+        # name: (help text, label name or "", function returning the value)
+        self.gauges: dict[str, tuple[str, str, Callable]] = {}
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def observe_rpc(self, method: str, seconds: float, error: bool = False) -> None:
+        if self.methods is not None and method not in self.methods:
+            method = "other"
+        with self.lock:
+            histogram = self.rpcs.get(method)
+            if histogram is None:
+                histogram = self.rpcs.setdefault(method, Histogram())
+            histogram.observe(seconds, error)
+
+    def observe_database(self, seconds: float) -> None:
+        with self.lock:
+            self.database.observe(seconds)
+
+    def gauge(self, name: str, read: Callable, help_text: str, label: str = "") -> None:
+        """Registers a gauge. read() returns a number, or with a label,
+        a dict of numbers by label value."""
+        self.gauges[name] = (help_text, label, read)
+
+    def _copy(self) -> tuple[dict[str, Histogram], Histogram]:
+        with self.lock:
+            return ({method: histogram.copy() for method, histogram in self.rpcs.items()},
+                    self.database.copy())
+
+    def _read_gauges(self) -> dict:
+        values = {}
+        for name, (_, _, read) in self.gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                log.warning("Failed to read gauge %s: %s", name, e)
+        return values
+
+    def snapshot(self) -> dict:
+        """Returns the metrics as a dict, with the latency percentiles of every RPC."""
+        rpcs, database = self._copy()
+        return {"uptime": time.monotonic() - self.started,
+                "rpcs": {method: histogram.summary() for method, histogram in rpcs.items()},
+                "database": database.summary(),
+                "gauges": self._read_gauges()}
+
+    def render(self) -> str:
+        """Returns the metrics in Prometheus' text exposition format."""
+        rpcs, database = self._copy()
+        prefix = self.prefix
+        lines = [f"# HELP {prefix}_uptime_seconds Seconds since the server started.",
+                 f"# TYPE {prefix}_uptime_seconds gauge",
+                 f"{prefix}_uptime_seconds {time.monotonic() - self.started:.3f}",
+                 f"# HELP {prefix}_rpc_seconds Time taken to handle RPCs.",
+                 f"# TYPE {prefix}_rpc_seconds histogram"]
+        for method, histogram in sorted(rpcs.items()):
+            lines += _histogram_lines(f"{prefix}_rpc_seconds", histogram,
+                                      f'method="{_label_value(method)}"')
+        lines += [f"# HELP {prefix}_rpc_errors_total RPCs that ended in a fault.",
+                  f"# TYPE {prefix}_rpc_errors_total counter"]
+        lines += [f'{prefix}_rpc_errors_total{{method="{_label_value(method)}"}} '
+                  f'{histogram.errors}'
+                  for method, histogram in sorted(rpcs.items())]
+        lines += [f"# HELP {prefix}_database_seconds Time a database connection was held.",
+                  f"# TYPE {prefix}_database_seconds histogram"]
+        lines += _histogram_lines(f"{prefix}_database_seconds", database, "")
+        values = self._read_gauges()
+        for name, (help_text, label, _) in self.gauges.items():
+            if name not in values:
+                continue
+            lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} gauge"]
+            if label:
+                lines += [f'{prefix}_{name}{{{label}="{_label_value(key)}"}} {float(value):g}'
+                          for key, value in sorted(values[name].items())]
+            else:
+                lines.append(f"{prefix}_{name} {float(values[name]):g}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_value(value) -> str:
+    """Escapes a label value for the text format, where it is written in double quotes."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name: str, histogram: Histogram, labels: str) -> list[str]:
+    separator = "," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+    cumulative += histogram.counts[-1]
+    lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.total:.6f}")
+    lines.append(f"{name}_count{suffix} {cumulative}")
+    return lines
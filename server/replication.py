@@ -0,0 +1,141 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from logs import get_logger
+
+log = get_logger("replication")
+
+
+class PeerQueue:
+    """Messages waiting to be sent to one peer. Statistics rows are merged by player_name
+    so only the newest row of each player is sent, the other messages only keep
+    their latest payload."""
+
+    def __init__(self):
+        self.statistics: dict[str, dict] = {}
+        self.server_dict: dict | None = None
+        self.coordinator: tuple | None = None
+        # True while a worker is flushing this queue, so each peer has one send in flight
+        self.scheduled = False
+        # time.monotonic() before which no new send is started after a failure
+        self.backoff_until = 0.0
+
+    def empty(self) -> bool:
+        return not self.statistics and self.server_dict is None and self.coordinator is None
+
+    def size(self) -> int:
+        return (len(self.statistics) + (self.server_dict is not None)
+                + (self.coordinator is not None))
+
+
+class ReplicationDispatcher:
+    """Sends server-to-server broadcasts from a bounded pool of background workers,
+    so request threads only enqueue and return. Each peer has its own queue and at most
+    one send in flight, so a slow or dead peer only holds up its own messages.
+    Updates that pile up while a send is in flight are merged into the next batch.
+    Statistics rows are sent with the statistics_method RPC. After a failed send, what is
+    left for the peer is sent again retry_delay seconds later, using call_later(delay, func)
+    (e.g. Scheduler.call_later) if given."""
+
+    def __init__(self, new_proxy: Callable, workers: int = 8, timeout: float = 3,
+                 retry_delay: float = 5, statistics_method: str = "receive_statistics_update",
+                 call_later: Callable | None = None):
+        self.new_proxy = new_proxy
+        self.statistics_method = statistics_method
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.call_later = call_later or _call_later
+        self.queues: dict[str, PeerQueue] = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix="replication")
+
+    def send_statistics(self, peers, stats_list: list[dict]) -> None:
+        for peer in peers:
+            self._enqueue(peer, lambda queue: queue.statistics.update(
+                (s["player_name"], s) for s in stats_list))
+
+    def send_server_dict(self, peers, server_dict: dict) -> None:
+        server_dict = dict(server_dict)
+        for peer in peers:
+            self._enqueue(peer, lambda queue: setattr(queue, "server_dict", server_dict))
+
+    def announce_coordinator(self, peers, address: str, ba_number: int) -> None:
+        for peer in peers:
+            self._enqueue(peer, lambda queue: setattr(
+                queue, "coordinator", (address, ba_number)))
+
+    def queue_length(self) -> int:
+        """Returns the number of messages waiting to be sent to all peers."""
+        with self.lock:
+            return sum(queue.size() for queue in self.queues.values())
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _enqueue(self, peer: str, merge: Callable) -> None:
+        with self.lock:
+            queue = self.queues.setdefault(peer, PeerQueue())
+            merge(queue)
+            # coordinator announcements skip the backoff, elections can't wait for it
+            backing_off = time.monotonic() < queue.backoff_until and queue.coordinator is None
+            if queue.scheduled or backing_off:
+                return
+            queue.scheduled = True
+        self.pool.submit(self._flush, peer)
+
+    def _flush(self, peer: str) -> None:
+        """Sends everything queued for peer, then keeps going while new messages arrive."""
+        while True:
+            with self.lock:
+                queue = self.queues[peer]
+                if queue.empty():
+                    queue.scheduled = False
+                    return
+                statistics, queue.statistics = queue.statistics, {}
+                server_dict, queue.server_dict = queue.server_dict, None
+                coordinator, queue.coordinator = queue.coordinator, None
+            try:
+                proxy = self.new_proxy(peer, timeout=self.timeout)
+                if coordinator is not None:
+                    proxy.handle_bully_coordinator_msg(*coordinator)
+                if server_dict is not None:
+                    proxy.receive_server_dict(server_dict)
+                if statistics:
+                    getattr(proxy, self.statistics_method)(list(statistics.values()))
+            except Exception as e:
+                log.warning("Failed to replicate to %s: %s", peer, e)
+                with self.lock:
+                    # keep what wasn't superseded while we were sending and try again after
+                    # the backoff. Coordinator announcements are not retried, they may be
+                    # stale by then.
+                    queue.statistics = {**statistics, **queue.statistics}
+                    if queue.server_dict is None:
+                        queue.server_dict = server_dict
+                    queue.backoff_until = time.monotonic() + self.retry_delay
+                    queue.scheduled = False
+                self.call_later(self.retry_delay, lambda: self._retry(peer))
+                return
+
+    def _retry(self, peer: str) -> None:
+        with self.lock:
+            queue = self.queues[peer]
+            if queue.scheduled or queue.empty():
+                return
+            queue.scheduled = True
+        try:
+            self.pool.submit(self._flush, peer)
+        except RuntimeError:
+            # shut down in the meantime
+            with self.lock:
+                queue.scheduled = False
+
+
+def _call_later(delay: float, func: Callable) -> None:
+    timer = threading.Timer(delay, func)
+    timer.daemon = True
+    timer.start()
@@ -0,0 +1,63 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCRequestHandler
+
+import metrics
+import wire
+from logs import get_logger
+
+log = get_logger("http")
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    """Answers with HTTP/1.1 so clients can send more requests over the same connection.
+    A connection that stays idle for timeout seconds is closed by the server."""
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+
+    def log_message(self, *args):
+        # every request is logged at debug level instead of written to stderr
+        log.debug(*args, extra={"client": self.client_address[0]})
+
+    def do_POST(self):
+        """Answers requests sent with the compact JSON codec (see wire.py) in JSON,
+        and everything else as XML-RPC."""
+        if self.headers.get("Content-Type", "") != wire.CONTENT_TYPE:
+            super().do_POST()
+            return
+        if not self.is_rpc_path_valid():
+            self.report_404()
+            return
+        try:
+            method, params = wire.decode_request(
+                self.rfile.read(int(self.headers["Content-Length"])))
+        except Exception as e:
+            self.send_error(400, f"invalid request: {e}")
+            return
+        try:
+            # the same dispatcher that XML-RPC requests go through
+            response = wire.encode_response(
+                self.server._dispatch(method, params))  # pylint: disable=protected-access
+        except xmlrpc.client.Fault as fault:
+            response = wire.encode_fault(fault.faultCode, fault.faultString)
+        except Exception as e:
+            response = wire.encode_fault(1, f"{type(e)}:{e}")
+        self.send_response(200)
+        self.send_header("Content-Type", wire.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves the metrics of the registered instance at /metrics, see metrics.py."""
+        render = getattr(self.server.instance, "metrics_text", None)
+        if self.path != "/metrics" or render is None:
+            self.report_404()
+            return
+        response = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
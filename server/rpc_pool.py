@@ -0,0 +1,159 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-few-public-methods
+import http.client
+import queue
+import threading
+import xmlrpc.client
+
+import wire
+
+
+class TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout=5, use_datetime=False):
+        super().__init__(use_datetime=use_datetime)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        if hasattr(conn, "timeout"):
+            conn.timeout = self.timeout
+        # a kept-alive connection already has a socket, which needs the new timeout too
+        if getattr(conn, "sock", None) is not None:
+            conn.sock.settimeout(self.timeout)
+        return conn
+
+    def json_request(self, host: str, handler: str, method: str, params) -> tuple[bool, object]:
+        """Calls method with the compact JSON codec over this transport's connection.
+        Returns (True, result), or (False, None) if the server answered 200 in XML-RPC,
+        i.e. it doesn't know the JSON codec. Faults are raised like in XML-RPC calls,
+        any other reply raises ProtocolError."""
+        body = wire.encode_request(method, params)
+        # like Transport.request, retry once if the kept-alive connection was closed
+        for attempt in (0, 1):
+            try:
+                conn = self.make_connection(host)
+                conn.putrequest("POST", handler, skip_accept_encoding=True)
+                conn.putheader("Content-Type", wire.CONTENT_TYPE)
+                conn.putheader("Content-Length", str(len(body)))
+                conn.endheaders(body)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+        content_type = response.getheader("Content-Type", "")
+        if response.status == 200 and content_type.startswith("text/xml"):
+            return False, None
+        if response.status != 200 or content_type != wire.CONTENT_TYPE:
+            # e.g. an error page from a proxy in front of the server, which says nothing
+            # about the codecs the server itself knows
+            raise xmlrpc.client.ProtocolError(host + handler, response.status,
+                                              response.reason, dict(response.getheaders()))
+        return True, wire.decode_response(data)
+
+
+class SafeTimeoutTransport(TimeoutTransport, xmlrpc.client.SafeTransport):
+    pass
+
+
+class PooledServerProxy:
+    """Drop-in replacement for ServerProxy that borrows a kept-alive transport from the
+    pool for every call, so it can be shared between threads."""
+
+    def __init__(self, pool: "ProxyPool", address: str, timeout: float):
+        self._pool = pool
+        self._address = address
+        self._timeout = timeout
+
+    def __getattr__(self, name):
+        def call(*args):
+            transport = self._pool.borrow(self._address, self._timeout)
+            try:
+                result = self._call(transport, name, args)
+            except xmlrpc.client.Fault:
+                # the peer answered with an error, the connection itself is fine
+                self._pool.release(self._address, transport)
+                raise
+            except Exception:
+                # the connection may be half-read or dead, never reuse it
+                transport.close()
+                self._pool.discard(self._address)
+                raise
+            self._pool.release(self._address, transport)
+            return result
+        return call
+
+    def _call(self, transport: TimeoutTransport, name: str, args: tuple):
+        if self._pool.codec == "json" and self._address not in self._pool.xml_only:
+            host, handler = _split_address(self._address)
+            understood, result = transport.json_request(host, handler, name, args)
+            if understood:
+                return result
+            # an older server, use XML-RPC with it from now on
+            self._pool.xml_only.add(self._address)
+        proxy = xmlrpc.client.ServerProxy(self._address, allow_none=True, transport=transport)
+        return getattr(proxy, name)(*args)
+
+
+def _split_address(address: str) -> tuple[str, str]:
+    """Splits "http://host:port/path" into ("host:port", "/path"), "/RPC2" if there is no path."""
+    host = address.split("://", 1)[-1]
+    host, _, path = host.partition("/")
+    return host, "/" + path if path else "/RPC2"
+
+
+class ProxyPool:
+    """Keeps up to max_idle open transports per server address. Each transport holds one
+    HTTP/1.1 keep-alive connection and is used by one thread at a time."""
+
+    def __init__(self, max_idle: int = 4, codec: str = "json"):
+        self.max_idle = max_idle
+        # "json" to call servers with the compact codec in wire.py, "xml" for XML-RPC
+        self.codec = codec
+        # addresses of servers that only answered in XML-RPC
+        self.xml_only: set[str] = set()
+        self.idle: dict[str, queue.LifoQueue] = {}
+        self.lock = threading.Lock()
+        self.created = 0
+        self.discarded = 0
+
+    def proxy(self, address: str, timeout: float = 5) -> PooledServerProxy:
+        return PooledServerProxy(self, address, timeout)
+
+    def _idle_for(self, address: str) -> queue.LifoQueue:
+        with self.lock:
+            return self.idle.setdefault(address, queue.LifoQueue())
+
+    def borrow(self, address: str, timeout: float) -> TimeoutTransport:
+        try:
+            transport = self._idle_for(address).get_nowait()
+        except queue.Empty:
+            with self.lock:
+                self.created += 1
+            if address.startswith("https://"):
+                transport = SafeTimeoutTransport(timeout=timeout)
+            else:
+                transport = TimeoutTransport(timeout=timeout)
+        transport.timeout = timeout
+        return transport
+
+    def release(self, address: str, transport: TimeoutTransport) -> None:
+        idle = self._idle_for(address)
+        if idle.qsize() < self.max_idle:
+            idle.put(transport)
+        else:
+            transport.close()
+
+    def discard(self, address: str) -> None:
+        """Closes the idle transports of address after a failed call, since a dead
+        peer's other connections are most likely broken too."""
+        with self.lock:
+            self.discarded += 1
+        idle = self._idle_for(address)
+        while True:
+            try:
+                idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,109 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from logs import get_logger
+
+log = get_logger("scheduler")
+
+
+@dataclass
+class Task:
+    name: str
+    func: Callable
+    # seconds between runs, or None for a task that runs once
+    interval: float | None
+    running: bool = False
+    runs: int = 0
+    skipped: int = 0
+    canceled: bool = False
+    last_error: str = ""
+
+
+class Scheduler:
+    """Runs all periodic background work of a server from one timer thread.
+    Due tasks are handed to a small worker pool, so a slow task doesn't delay the others,
+    and a periodic task that is still running when it is due again is skipped
+    instead of starting a second copy."""
+
+    def __init__(self, workers: int = 4):
+        self.heap: list[tuple[float, int, Task]] = []
+        self.tasks: dict[str, Task] = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scheduler")
+        self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def every(self, interval: float, func: Callable, name: str = "",
+              first_delay: float = 0) -> Task:
+        """Runs func every interval seconds, the first time after first_delay seconds."""
+        return self._add(Task(name or func.__name__, func, interval), first_delay)
+
+    def call_later(self, delay: float, func: Callable, name: str = "") -> Task:
+        """Runs func once after delay seconds."""
+        return self._add(Task(name or func.__name__, func, None), delay)
+
+    def cancel(self, task: Task) -> None:
+        task.canceled = True
+
+    def _add(self, task: Task, delay: float) -> Task:
+        with self.condition:
+            if task.interval is not None:
+                self.tasks[task.name] = task
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), task))
+            self.condition.notify()
+        return task
+
+    def _run(self) -> None:
+        with self.condition:
+            while not self.stopped:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                due, _, task = self.heap[0]
+                now = time.monotonic()
+                if due > now:
+                    self.condition.wait(due - now)
+                    continue
+                heapq.heappop(self.heap)
+                if task.canceled:
+                    continue
+                if task.interval is not None:
+                    heapq.heappush(self.heap, (now + task.interval, next(self.counter), task))
+                if task.running:
+                    task.skipped += 1
+                    continue
+                task.running = True
+                self.pool.submit(self._execute, task)
+
+    def _execute(self, task: Task) -> None:
+        try:
+            task.func()
+        except Exception as e:
+            task.last_error = str(e)
+            log.warning("Scheduled task %s failed: %s", task.name, e)
+        finally:
+            task.runs += 1
+            task.running = False
+
+    def stats(self) -> dict:
+        """Returns the number of runs and skipped runs of each periodic task."""
+        with self.condition:
+            return {name: {"runs": task.runs, "skipped": task.skipped, "running": task.running}
+                    for name, task in self.tasks.items()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops scheduling new runs and waits for the running tasks to finish."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+        self.pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,107 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import asyncio
+import os
+import sys
+import unittest
+import xmlrpc.client
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import wire
+from async_server import AsyncPeerClient, _read_message
+
+
+class Peer:
+    """Answers every call with its method name. Closes a connection without answering
+    once it has answered answers_per_connection calls on it."""
+
+    def __init__(self, answers_per_connection: int | None = None):
+        self.answers_per_connection = answers_per_connection
+        self.connections = 0
+        self.server = None
+        self.address = ""
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.address = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer) -> None:
+        self.connections += 1
+        answered = 0
+        while (message := await _read_message(reader)) is not None:
+            if answered == self.answers_per_connection:
+                break
+            method, _ = wire.decode_request(message[2])
+            response = wire.encode_response(method)
+            writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {wire.CONTENT_TYPE}\r\n"
+                         f"Content-Length: {len(response)}\r\n\r\n".encode() + response)
+            answered += 1
+        writer.close()
+
+
+class AsyncPeerClientTest(unittest.IsolatedAsyncioTestCase):
+    async def call_twice(self, peer: Peer, client: AsyncPeerClient) -> None:
+        self.assertEqual(await client.call(peer.address, "ping", []), "ping")
+        self.assertEqual(await client.call(peer.address, "get_state", ["game"]), "get_state")
+
+    async def test_reuses_connections(self):
+        peer = Peer()
+        await peer.start()
+        await self.call_twice(peer, AsyncPeerClient(None, None))
+        self.assertEqual(peer.connections, 1)
+        await peer.stop()
+
+    async def test_retries_when_the_peer_closed_the_connection(self):
+        # the peer closes the connection as the next request arrives on it
+        peer = Peer(answers_per_connection=1)
+        await peer.start()
+        client = AsyncPeerClient(None, None)
+        await self.call_twice(peer, client)
+        self.assertEqual(peer.connections, 2)
+        await peer.stop()
+
+    async def test_drops_connections_idle_for_the_peers_timeout(self):
+        peer = Peer()
+        await peer.start()
+        client = AsyncPeerClient(None, None)
+        self.assertEqual(await client.call(peer.address, "ping", []), "ping")
+        reader, writer, idle_since = client.idle[peer.address].pop()
+        client.idle[peer.address].append((reader, writer, idle_since - 60))
+        self.assertEqual(await client.call(peer.address, "ping", []), "ping")
+        self.assertEqual(peer.connections, 2)
+        await peer.stop()
+
+    async def test_error_pages_do_not_switch_to_xml_rpc(self):
+        async def bad_gateway(reader, writer):
+            await _read_message(reader)
+            body = b"<html>502 Bad Gateway</html>"
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Type: text/html\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+            writer.close()
+
+        server = await asyncio.start_server(bad_gateway, "127.0.0.1", 0)
+        address = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        client = AsyncPeerClient(None, None)
+        with self.assertRaises(xmlrpc.client.ProtocolError):
+            await client.call(address, "ping", [])
+        self.assertNotIn(address, client.xml_only)
+        server.close()
+        await server.wait_closed()
+
+    async def test_new_connections_are_not_retried(self):
+        peer = Peer(answers_per_connection=0)
+        await peer.start()
+        with self.assertRaises(ConnectionError):
+            await AsyncPeerClient(None, None).call(peer.address, "ping", [])
+        self.assertEqual(peer.connections, 1)
+        await peer.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
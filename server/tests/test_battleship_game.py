@@ -0,0 +1,153 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from battleship_game import GAME_MODES, BattleshipGame
+
+
+class FleetPlacementTest(unittest.TestCase):
+    def assert_placed(self, game: BattleshipGame) -> None:
+        for board in (game.p1_board, game.p2_board):
+            self.assertEqual(board.ships.bit_count(), sum(game.ship_sizes))
+            self.assertEqual(board.ships_left, sum(game.ship_sizes))
+
+    def test_game_modes(self):
+        for mode in GAME_MODES:
+            game = BattleshipGame.from_mode(mode)
+            game.start_game()
+            self.assert_placed(game)
+
+    def test_crowded_fleets(self):
+        # boards the random placer rarely fills, up to an exact tiling
+        for rows, cols, ship_sizes in ((6, 6, [2] * 18), (8, 8, [3] * 21), (7, 7, [3] * 16),
+                                       (9, 9, [3] * 27), (5, 5, [5] * 5)):
+            started = time.monotonic()
+            game = BattleshipGame(rows, cols, ship_sizes)
+            game.start_game()
+            self.assert_placed(game)
+            self.assertLess(time.monotonic() - started, 2)
+
+    def test_impossible_fleets(self):
+        # each passes the cell count check, but 1x4 ships can't tile these boards
+        for rows, cols, ship_sizes in ((6, 6, [4] * 9), (10, 10, [4] * 25)):
+            started = time.monotonic()
+            with self.assertRaises(ValueError):
+                BattleshipGame(rows, cols, ship_sizes).start_game()
+            self.assertLess(time.monotonic() - started, 2)
+
+    def test_fleet_larger_than_board(self):
+        with self.assertRaises(ValueError):
+            BattleshipGame(5, 5, [6]).start_game()
+        with self.assertRaises(ValueError):
+            BattleshipGame(5, 5, [5] * 6).start_game()
+
+    def test_grid_size_only_for_square_boards(self):
+        square = BattleshipGame(5, 5, [3, 2])
+        wide = BattleshipGame(4, 6, [3, 2])
+        self.assertEqual(square.get_state()["grid_size"], 5)
+        self.assertIsNone(wide.get_state()["grid_size"])
+        self.assertEqual((wide.get_state()["rows"], wide.get_state()["cols"]), (4, 6))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            BattleshipGame.from_mode("huge")
+
+
+def free_cells(game: BattleshipGame, player_id: int):
+    """Cells player_id hasn't fired at yet, first the opponent's ship cells."""
+    board = game.p2_board if player_id == 1 else game.p1_board
+    cells = [divmod(i, game.cols) for i in range(game.rows * game.cols)
+             if not (board.hits | board.misses) >> i & 1]
+    return sorted(cells, key=lambda cell: not board.ships & board.bit(*cell))
+
+
+def apply_shots(state: dict, delta: dict) -> dict:
+    """Applies a get_state_since() delta to a full state, like the browser client does."""
+    state = {key: [list(row) for row in value] if key.endswith(("_grid", "_tracking"))
+             else value for key, value in state.items()}
+    for shot in delta["shots"]:
+        mark = "X" if shot["result"] == "hit" else "O"
+        target = "p2_grid" if shot["player"] == 1 else "p1_grid"
+        state[target][shot["row"]][shot["col"]] = mark
+        state[f"p{shot['player']}_tracking"][shot["row"]][shot["col"]] = mark
+    for key in ("seq", "current_player", "winner", "game_canceled"):
+        state[key] = delta[key]
+    return state
+
+
+class StateSinceTest(unittest.TestCase):
+    def setUp(self):
+        self.game = BattleshipGame.from_mode("standard")
+        self.game.start_game()
+
+    def fire(self, player_id: int) -> dict:
+        return self.game.fire(player_id, *free_cells(self.game, player_id)[0])
+
+    def test_not_modified(self):
+        seq = self.game.get_state()["seq"]
+        self.assertEqual(self.game.get_state_since(seq), {"seq": seq, "not_modified": True})
+
+    def test_shots_since_seq(self):
+        first = self.game.get_state()
+        self.fire(1)
+        middle = self.game.seq
+        self.fire(2)
+        self.assertEqual(self.game.seq, first["seq"] + 2)
+        delta = self.game.get_state_since(first["seq"])
+        self.assertEqual([shot["seq"] for shot in delta["shots"]],
+                         [first["seq"] + 1, first["seq"] + 2])
+        self.assertEqual([shot["player"] for shot in delta["shots"]], [1, 2])
+        self.assertEqual(self.game.get_state_since(middle)["shots"], delta["shots"][1:])
+        self.assertEqual(apply_shots(first, delta), self.game.get_state())
+
+    def test_deltas_add_up_to_the_full_state(self):
+        state = self.game.get_state()
+        player_id = 1
+        while self.game.winner is None:
+            self.fire(player_id)
+            player_id = 1 if player_id == 2 else 2
+            if player_id == 1:
+                state = apply_shots(state, self.game.get_state_since(state["seq"]))
+        state = apply_shots(state, self.game.get_state_since(state["seq"]))
+        self.assertEqual(state, self.game.get_state())
+        self.assertIsNotNone(state["winner"])
+
+    def test_rejected_shots_do_not_change_seq(self):
+        seq = self.game.seq
+        self.assertIn("error", self.game.fire(2, 0, 0))
+        self.assertIn("error", self.game.fire(1, 99, 0))
+        self.assertEqual(self.game.seq, seq)
+        self.assertTrue(self.game.get_state_since(seq)["not_modified"])
+
+    def test_unknown_seq_gets_the_full_state(self):
+        self.fire(1)
+        for seq in (0, self.game.seq + 1, -1):
+            self.assertEqual(self.game.get_state_since(seq), self.game.get_state())
+
+    def test_cancel(self):
+        seq = self.game.seq
+        self.game.cancel_game(1)
+        delta = self.game.get_state_since(seq)
+        self.assertEqual((delta["seq"], delta["shots"], delta["game_canceled"]),
+                         (seq + 1, [], True))
+
+    def test_wait_for_change(self):
+        seq = self.game.seq
+        self.assertTrue(self.game.wait_for_change(seq, 0.05)["not_modified"])
+        timer = threading.Timer(0.05, lambda: self.fire(1))
+        timer.start()
+        delta = self.game.wait_for_change(seq, 3)
+        timer.join()
+        self.assertEqual(delta["seq"], seq + 1)
+        self.assertEqual(len(delta["shots"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
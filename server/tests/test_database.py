@@ -0,0 +1,197 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import database as DB
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs every test on a new database, set up like a server sets up its own."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        DB.set_database_path(os.path.join(self.directory.name, "statistics.db"))
+        DB.prepare_database()
+
+    def tearDown(self):
+        DB.close_connections()
+        self.directory.cleanup()
+
+
+class LeaderboardTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # wins and losses with plenty of ties in every ordering
+        DB.upsert_stats([{"player_name": f"p{i}", "games_won": i % 7, "games_lost": i % 5}
+                         for i in range(53)])
+
+    def expected(self, order_by: str) -> list[str]:
+        expression = DB.LEADERBOARD_ORDERS[order_by]
+        with DB.connection() as con:
+            return [row[0] for row in con.execute(
+                f"SELECT player_name FROM statistics "
+                f"ORDER BY {expression} DESC, player_id DESC")]
+
+    def read_pages(self, order_by: str, limit: int) -> list[list[str]]:
+        pages = []
+        cursor = ""
+        while True:
+            page = DB.get_leaderboard(order_by, limit, cursor)
+            pages.append([row["player_name"] for row in page["rows"]])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return pages
+
+    def test_pages_follow_each_other(self):
+        for order_by in DB.LEADERBOARD_ORDERS:
+            for limit in (1, 5, 20, 53, 100):
+                pages = self.read_pages(order_by, limit)
+                self.assertEqual(sum(pages, []), self.expected(order_by), (order_by, limit))
+                # no empty page after a full one
+                self.assertTrue(all(pages), (order_by, limit))
+                self.assertEqual(len(pages), -(-53 // limit))
+
+    def test_last_full_page_has_no_cursor(self):
+        page = DB.get_leaderboard("wins", 53)
+        self.assertEqual(len(page["rows"]), 53)
+        self.assertEqual(page["next_cursor"], "")
+        self.assertNotEqual(DB.get_leaderboard("wins", 52)["next_cursor"], "")
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            DB.get_leaderboard("losses")
+        with self.assertRaises(ValueError):
+            DB.get_player_rank("p1", "losses")
+
+    def test_player_rank_is_the_leaderboard_position(self):
+        for order_by in DB.LEADERBOARD_ORDERS:
+            for position, player_name in enumerate(self.expected(order_by), 1):
+                self.assertEqual(DB.get_player_rank(player_name, order_by), position)
+        self.assertIsNone(DB.get_player_rank("nobody"))
+
+
+class RecordMatchTest(DatabaseTestCase):
+    def test_creates_missing_players(self):
+        updated = DB.record_match("alice", "bob")
+        self.assertEqual([(s["player_name"], s["games_won"], s["games_lost"]) for s in updated],
+                         [("alice", 1, 0), ("bob", 0, 1)])
+        self.assertEqual(DB.get_player_stats("alice"), updated[0])
+        self.assertEqual(DB.get_player_stats("bob"), updated[1])
+
+    def test_adds_to_existing_players(self):
+        alice_id = DB.create_database_entry("alice")
+        DB.record_match("alice", "bob")
+        updated = DB.record_match("bob", "alice")
+        # RETURNING gives the rows after the update, with their existing ids
+        self.assertEqual(updated, [DB.get_player_stats("bob"), DB.get_player_stats("alice")])
+        self.assertEqual(updated[1]["player_id"], alice_id)
+        self.assertEqual((updated[0]["games_won"], updated[0]["games_lost"]), (1, 1))
+        self.assertEqual((updated[1]["games_won"], updated[1]["games_lost"]), (1, 1))
+        self.assertEqual(len(DB.get_all_stats()), 2)
+
+    def test_empty_names_are_skipped(self):
+        updated = DB.record_match("alice", "")
+        self.assertEqual([s["player_name"] for s in updated], ["alice"])
+        self.assertIsNone(DB.get_player_stats(""))
+
+    def test_rolls_back_both_players(self):
+        # a value that can't be bound fails the second upsert after the first one ran
+        with self.assertRaises(sqlite3.Error):
+            DB.record_match("alice", object())
+        self.assertIsNone(DB.get_player_stats("alice"))
+
+    def test_every_update_is_in_the_change_log(self):
+        DB.record_match("alice", "bob")
+        DB.record_match("alice", "bob")
+        changes = DB.get_changes_since(0)["changes"]
+        self.assertEqual([(c["player_name"], c["games_won"], c["games_lost"]) for c in changes],
+                         [("alice", 1, 0), ("bob", 0, 1), ("alice", 2, 0), ("bob", 0, 2)])
+
+
+class ChangeLogTest(DatabaseTestCase):
+    def play(self, matches: int) -> None:
+        for i in range(matches):
+            DB.record_match(f"p{i % 4}", f"p{(i + 1) % 4}")
+
+    def read_changes(self, version: int, limit: int) -> tuple[list[dict], int]:
+        """Reads the change log in pages like a replica catching up does."""
+        changes = []
+        while True:
+            reply = DB.get_changes_since(version, limit)
+            self.assertFalse(reply["full"])
+            if not reply["changes"]:
+                return changes, version
+            changes += reply["changes"]
+            version = reply["changes"][-1]["version"]
+
+    def test_changes_are_paged_in_order(self):
+        self.play(12)
+        changes, version = self.read_changes(0, 5)
+        self.assertEqual(len(changes), 24)
+        self.assertEqual([c["version"] for c in changes], list(range(1, 25)))
+        self.assertEqual(version, DB.get_changes_since(0)["version"])
+        # the last change of each player is its current row
+        latest = {c["player_name"]: (c["games_won"], c["games_lost"]) for c in changes}
+        self.assertEqual(latest, {s["player_name"]: (s["games_won"], s["games_lost"])
+                                  for s in DB.get_all_stats()})
+
+    def test_rows_written_with_the_same_values_are_not_logged(self):
+        self.play(2)
+        version = DB.get_changes_since(0)["version"]
+        DB.upsert_stats(DB.get_all_stats())
+        self.assertEqual(DB.get_changes_since(version)["changes"], [])
+
+    def test_catch_up_after_pruning(self):
+        self.play(10)
+        DB.prune_changes(keep=5)
+        reply = DB.get_changes_since(0)
+        self.assertTrue(reply["full"])
+        self.assertEqual(reply["version"], 20)
+        # a replica that is at most keep changes behind still gets just the changes
+        changes, version = self.read_changes(15, 100)
+        self.assertEqual([c["version"] for c in changes], [16, 17, 18, 19, 20])
+        self.assertEqual(version, 20)
+
+    def test_version_survives_pruning_every_change(self):
+        self.play(3)
+        DB.prune_changes(keep=0)
+        reply = DB.get_changes_since(6)
+        self.assertEqual((reply["version"], reply["full"], reply["changes"]), (6, False, []))
+        self.assertTrue(DB.get_changes_since(0)["full"])
+        self.play(1)
+        self.assertEqual([c["version"] for c in DB.get_changes_since(6)["changes"]], [7, 8])
+
+    def test_replica_catches_up_from_main(self):
+        main = os.path.join(self.directory.name, "main.db")
+        replica = os.path.join(self.directory.name, "replica.db")
+        for path in (main, replica):
+            DB.set_database_path(path)
+            DB.prepare_database()
+        version = 0
+        for matches in (7, 0, 3):
+            DB.set_database_path(main)
+            self.play(matches)
+            changes, version = self.read_changes(version, 4)
+            expected = DB.get_all_stats()
+            DB.set_database_path(replica)
+            DB.upsert_stats(changes)
+            self.assertEqual(DB.get_all_stats(), expected)
+
+    def test_every_database_has_its_own_log_id(self):
+        first = DB.get_changes_since(0)["log_id"]
+        DB.set_database_path(os.path.join(self.directory.name, "other.db"))
+        DB.prepare_database()
+        self.assertNotEqual(DB.get_changes_since(0)["log_id"], first)
+        DB.prepare_database()
+        self.assertEqual(DB.get_replication_state("log_id"), DB.get_changes_since(0)["log_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error,consider-using-with
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from battleship_game import BattleshipGame
+from game_store import GameStore
+from journal import GameJournal
+
+
+def first_ship_cell(game: BattleshipGame, player_id: int) -> tuple[int, int]:
+    """Returns a cell of one of the opponent's ships, so firing at it hits."""
+    board = game.p2_board if player_id == 1 else game.p1_board
+    cell = (board.ships & -board.ships).bit_length() - 1
+    return divmod(cell, game.cols)
+
+
+class GameJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal = GameJournal(self.directory.name)
+        self.store = GameStore(on_remove=self.journal.record_drop)
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def new_game(self, game_id: str) -> BattleshipGame:
+        game = BattleshipGame.from_mode("standard")
+        game.start_game()
+        names = {1: f"{game_id}-a", 2: f"{game_id}-b"}
+        self.store.add(game_id, game, names)
+        self.journal.record_new(game_id, game, names)
+        return game
+
+    def fire(self, game_id: str, game: BattleshipGame, player_id: int, row: int, col: int):
+        result = game.fire(player_id, row, col)
+        if "error" not in result:
+            self.journal.record_fire(game_id, player_id, row, col)
+        return result
+
+    def recover(self) -> dict:
+        # a crash: whatever was flushed is on disk, the open file is never closed
+        self.journal.flush()
+        journal = GameJournal(self.directory.name)
+        try:
+            return journal.recover()
+        finally:
+            journal.close()
+
+    def test_replays_games_and_shots_after_a_crash(self):
+        game = self.new_game("g1")
+        self.fire("g1", game, 1, *first_ship_cell(game, 1))
+        self.fire("g1", game, 2, 0, 0)
+        recovered = self.recover()
+        self.assertEqual(set(recovered), {"g1"})
+        restored, names = recovered["g1"]
+        self.assertEqual(restored.get_state(), game.get_state())
+        self.assertEqual(names, {1: "g1-a", 2: "g1-b"})
+
+    def test_snapshot_and_the_segment_after_it(self):
+        game = self.new_game("g1")
+        self.fire("g1", game, 1, *first_ship_cell(game, 1))
+        self.assertEqual(self.journal.snapshot(self.store.items), 1)
+        self.fire("g1", game, 2, 0, 0)
+        self.new_game("g2")
+        recovered = self.recover()
+        self.assertEqual(set(recovered), {"g1", "g2"})
+        self.assertEqual(recovered["g1"][0].get_state(), game.get_state())
+
+    def test_game_recorded_before_the_snapshot_rotates(self):
+        # the "new" record is still buffered when the snapshot starts a new segment and
+        # deletes the old one, so the game has to come from the snapshot itself
+        game = self.new_game("g1")
+        self.journal.snapshot(self.store.items)
+        self.fire("g1", game, 1, *first_ship_cell(game, 1))
+        recovered = self.recover()
+        self.assertEqual(recovered["g1"][0].get_state(), game.get_state())
+
+    def test_dropped_games_stay_dropped(self):
+        self.new_game("g1")
+        self.new_game("g2")
+        self.store.remove("g1")
+        self.assertEqual(set(self.recover()), {"g2"})
+
+    def test_line_cut_short_by_a_crash_ends_the_segment(self):
+        game = self.new_game("g1")
+        self.journal.flush()
+        self.journal.file.write('{"t":"fire","id":"g1","p":1,')
+        self.journal.file.flush()
+        restored = self.recover()["g1"][0]
+        self.assertEqual(restored.get_state(), game.get_state())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import os
+import sys
+import threading
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from matchmaking import Lobby
+
+
+def join_concurrently(lobby: Lobby, threads: int, joins: int, on_match=None) -> list:
+    """Joins threads * joins players from threads threads started at the same time."""
+    results = []
+    start = threading.Barrier(threads)
+
+    def join_many(thread: int):
+        start.wait()
+        for i in range(joins):
+            results.append(lobby.join(f"player{thread}-{i}", on_match=on_match))
+
+    workers = [threading.Thread(target=join_many, args=(thread,)) for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+class LobbyTest(unittest.TestCase):
+    def assert_paired(self, lobby: Lobby, results: list) -> None:
+        roles = Counter((game_id, player_id) for player_id, game_id, _ in results)
+        first = {game_id for game_id, player_id in roles if player_id == 1}
+        second = {game_id for game_id, player_id in roles if player_id == 2}
+        # every game has one player 1 and at most one player 2
+        self.assertTrue(all(count == 1 for count in roles.values()))
+        self.assertLessEqual(second, first)
+        # and everyone but at most one player found an opponent
+        self.assertEqual(len(first - second), lobby.depth())
+        self.assertLessEqual(lobby.depth(), 1)
+
+    def test_sequential_joins(self):
+        lobby = Lobby()
+        player_id, game_id, opponent = lobby.join("alice")
+        self.assertEqual((player_id, opponent), (1, None))
+        self.assertTrue(lobby.is_waiting(game_id))
+        self.assertEqual(lobby.join("bob"), (2, game_id, "alice"))
+        self.assertFalse(lobby.is_waiting(game_id))
+
+    def test_concurrent_joins(self):
+        for players in (2, 3, 1000, 1001):
+            lobby = Lobby()
+            results = join_concurrently(lobby, 8 if players > 8 else players,
+                                        max(players // 8, 1))
+            self.assert_paired(lobby, results)
+
+    def test_concurrent_joins_with_skill_matching(self):
+        lobby = Lobby(skill_matching=True)
+        self.assert_paired(lobby, join_concurrently(lobby, 8, 125))
+
+    def test_on_match_runs_before_the_player_leaves_the_lobby(self):
+        lobby = Lobby()
+        still_waiting = []
+
+        def on_match(game_id):
+            # the lobby lock is held here, so look at the queues directly
+            still_waiting.append(any(waiting.game_id == game_id
+                                     for queue in lobby.queues for waiting in queue))
+
+        results = join_concurrently(lobby, 8, 125, on_match)
+        self.assertEqual(len(still_waiting), sum(player_id == 2 for player_id, _, _ in results))
+        self.assertTrue(all(still_waiting))
+
+    def test_cancel(self):
+        lobby = Lobby()
+        _, game_id, _ = lobby.join("alice")
+        self.assertTrue(lobby.cancel(game_id))
+        self.assertFalse(lobby.cancel(game_id))
+        self.assertEqual(lobby.join("bob")[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def test_unknown_methods_are_counted_as_other(self):
+        metrics = Metrics(methods={"fire", "get_state"})
+        for i in range(200):
+            metrics.observe_rpc(f"made_up_{i}", 0.001)
+        metrics.observe_rpc("fire", 0.001)
+        rpcs = metrics.snapshot()["rpcs"]
+        self.assertEqual(set(rpcs), {"fire", "other"})
+        self.assertEqual(rpcs["other"]["count"], 200)
+        self.assertEqual(rpcs["fire"]["count"], 1)
+
+    def test_label_values_are_escaped(self):
+        metrics = Metrics()
+        metrics.observe_rpc('a"b\\c\nd', 0.001, error=True)
+        metrics.gauge("reports", lambda: {'http://x"\n': 1}, "A gauge.", label="server")
+        text = metrics.render()
+        self.assertIn('battleship_rpc_errors_total{method="a\\"b\\\\c\\nd"} 1', text)
+        self.assertIn('battleship_reports{server="http://x\\"\\n"} 1', text)
+        # every sample stays on one line
+        for line in text.splitlines():
+            self.assertTrue(line.startswith(("#", "battleship_")), line)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from replication import ReplicationDispatcher
+from scheduler import Scheduler
+
+
+class FlakyPeer:
+    """Stands in for a peer's proxy. Fails the first sends, then records what it receives."""
+
+    def __init__(self, failures: int, gate: threading.Event | None = None):
+        self.failures = failures
+        # if given, every send waits until it is set
+        self.gate = gate
+        self.sending = threading.Event()
+        self.attempts = 0
+        self.received = []
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def new_proxy(self, address: str, timeout: float):
+        return self
+
+    def receive_statistics_update(self, stats_list: list[dict]) -> None:
+        self.sending.set()
+        if self.gate:
+            self.gate.wait(3)
+        with self.lock:
+            self.attempts += 1
+            if self.attempts <= self.failures:
+                raise ConnectionError("peer is down")
+            self.received.extend(stats_list)
+            self.batches.append(stats_list)
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class ReplicationDispatcherTest(unittest.TestCase):
+    def test_updates_queued_during_a_send_are_merged(self):
+        gate = threading.Event()
+        peer = FlakyPeer(failures=0, gate=gate)
+        dispatcher = ReplicationDispatcher(peer.new_proxy)
+        dispatcher.send_statistics(["peer"], [{"player_name": "alice", "games_won": 1}])
+        self.assertTrue(peer.sending.wait(3))
+        # the first send is in flight, these pile up behind it
+        dispatcher.send_statistics(["peer"], [{"player_name": "alice", "games_won": 2}])
+        dispatcher.send_statistics(["peer"], [{"player_name": "bob", "games_won": 1}])
+        dispatcher.send_statistics(["peer"], [{"player_name": "alice", "games_won": 3}])
+        self.assertEqual(dispatcher.queue_length(), 2)
+        gate.set()
+        self.assertTrue(wait_until(lambda: len(peer.batches) == 2, 3))
+        self.assertEqual(peer.batches, [
+            [{"player_name": "alice", "games_won": 1}],
+            [{"player_name": "alice", "games_won": 3}, {"player_name": "bob", "games_won": 1}],
+        ])
+        dispatcher.shutdown()
+
+    def test_failed_send_is_retried_without_new_messages(self):
+        peer = FlakyPeer(failures=1)
+        dispatcher = ReplicationDispatcher(peer.new_proxy, retry_delay=0.2)
+        dispatcher.send_statistics(["peer"], [{"player_name": "alice", "games_won": 1}])
+        # the queue is also empty while a send is in flight, so wait for the peer
+        self.assertTrue(wait_until(lambda: peer.received, 3))
+        self.assertEqual(dispatcher.queue_length(), 0)
+        self.assertEqual(peer.attempts, 2)
+        self.assertEqual(peer.received, [{"player_name": "alice", "games_won": 1}])
+        dispatcher.shutdown()
+
+    def test_retries_run_on_the_scheduler(self):
+        peer = FlakyPeer(failures=2)
+        scheduler = Scheduler()
+        dispatcher = ReplicationDispatcher(peer.new_proxy, retry_delay=0.1,
+                                           call_later=scheduler.call_later)
+        dispatcher.send_statistics(["peer"], [{"player_name": "alice", "games_won": 1}])
+        dispatcher.send_statistics(["peer"], [{"player_name": "alice", "games_won": 2}])
+        self.assertTrue(wait_until(lambda: peer.received, 3))
+        self.assertEqual(dispatcher.queue_length(), 0)
+        self.assertEqual(peer.received, [{"player_name": "alice", "games_won": 2}])
+        dispatcher.shutdown()
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import os
+import sys
+import threading
+import unittest
+import xmlrpc.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import wire
+from rpc_pool import ProxyPool
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers like the server's mode says: "json" (the codec), "xml" (a server that only
+    knows XML-RPC) or "bad_gateway" (an HTML error page from a proxy in front of it)."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(self.headers["Content-Type"])
+        if self.server.mode == "json":
+            method, _ = wire.decode_request(body)
+            self.reply(200, wire.CONTENT_TYPE, wire.encode_response([method, "json"]))
+        elif self.server.mode == "xml":
+            # a JSON body is not XML, so a plain XML-RPC server answers with a fault
+            if self.headers["Content-Type"] == wire.CONTENT_TYPE:
+                reply = xmlrpc.client.dumps(xmlrpc.client.Fault(1, "not XML"))
+            else:
+                method = xmlrpc.client.loads(body)[1]
+                reply = xmlrpc.client.dumps(([method, "xml"],), methodresponse=True)
+            self.reply(200, "text/xml", reply.encode())
+        else:
+            self.reply(502, "text/html", b"<html>502 Bad Gateway</html>")
+
+    def reply(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ProxyPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.mode = "json"
+        self.server.requests = []
+        self.address = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pool = ProxyPool()
+
+    def tearDown(self):
+        for address in self.pool.idle:
+            self.pool.discard(address)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_json(self):
+        self.assertEqual(self.pool.proxy(self.address).ping(), ["ping", "json"])
+        self.assertEqual(self.server.requests, [wire.CONTENT_TYPE])
+
+    def test_falls_back_to_xml_rpc_for_servers_that_only_know_it(self):
+        self.server.mode = "xml"
+        self.assertEqual(self.pool.proxy(self.address).ping(), ["ping", "xml"])
+        self.assertIn(self.address, self.pool.xml_only)
+        self.assertEqual(self.pool.proxy(self.address).ping(), ["ping", "xml"])
+        self.assertEqual(self.server.requests, [wire.CONTENT_TYPE, "text/xml", "text/xml"])
+
+    def test_error_pages_do_not_switch_to_xml_rpc(self):
+        self.server.mode = "bad_gateway"
+        with self.assertRaises(xmlrpc.client.ProtocolError) as raised:
+            self.pool.proxy(self.address).ping()
+        self.assertEqual(raised.exception.errcode, 502)
+        self.assertNotIn(self.address, self.pool.xml_only)
+        # once the proxy is back, the server is called with the codec again
+        self.server.mode = "json"
+        self.assertEqual(self.pool.proxy(self.address).ping(), ["ping", "json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,import-error
+import json
+import os
+import sys
+import unittest
+import xmlrpc.client
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import wire
+from battleship_game import BattleshipGame
+
+
+def round_trip(result):
+    return wire.decode_response(wire.encode_response(result))
+
+
+class WireCodecTest(unittest.TestCase):
+    def test_grids_are_packed_and_unpacked(self):
+        grid = [["~", "S"], ["X", "O"]]
+        encoded = wire.encode_response({"p1_grid": grid})
+        self.assertEqual(json.loads(encoded), {"result": {"p1_grid": {"$grid": ["~S", "XO"]}}})
+        self.assertEqual(round_trip({"p1_grid": grid}), {"p1_grid": grid})
+
+    def test_game_state_round_trip(self):
+        game = BattleshipGame.from_mode("standard")
+        game.start_game()
+        game.fire(1, 0, 0)
+        state = game.get_state()
+        self.assertEqual(round_trip(state), state)
+        self.assertEqual(round_trip(game.get_state_since(0)), game.get_state_since(0))
+
+    def test_lists_that_are_not_grids_stay_lists(self):
+        for value in ([["ab", "c"]], [["a", 1]], [["a"], "b"], [[], []], [[["a"]]],
+                      [["a", None]], [], [1, 2], ["a", "b"], [["a"], ["b", "c"]]):
+            self.assertEqual(round_trip(value), value, value)
+
+    def test_tuples_come_back_as_lists(self):
+        self.assertEqual(round_trip((1, "a", None)), [1, "a", None])
+
+    def test_requests(self):
+        data = wire.encode_request("fire", ("9f2a", 1, 2, 3))
+        self.assertEqual(wire.decode_request(data), ("fire", ["9f2a", 1, 2, 3]))
+
+    def test_faults(self):
+        with self.assertRaises(xmlrpc.client.Fault) as raised:
+            wire.decode_response(wire.encode_fault(1, "boom"))
+        self.assertEqual((raised.exception.faultCode, raised.exception.faultString), (1, "boom"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import json
+import xmlrpc.client
+
+# requests with this Content-Type are answered in JSON, everything else is XML-RPC
+CONTENT_TYPE = "application/x-battleship-json"
+
+# Request:  {"method": "fire", "params": ["9f2a0d11", 1, 2, 3]}
+# Reply:    {"result": ...} or {"fault": {"faultCode": 1, "faultString": "..."}}
+#
+# Grids (lists of rows of one-character cells, like the ones in get_state) are packed
+# into one string per row: [["~", "S"], ["X", "O"]] is sent as {"$grid": ["~S", "XO"]}.
+
+
+def _pack_grid(value) -> dict | None:
+    """Returns the packed form of value if it is a grid, otherwise None."""
+    if not (value and isinstance(value[0], list) and value[0] and isinstance(value[0][0], str)):
+        return None
+    try:
+        rows = ["".join(row) for row in value]
+    except TypeError:
+        return None
+    # every cell has to be one character for the rows to be split back into cells
+    if all(isinstance(row, list) and len(packed) == len(row) for row, packed in zip(value, rows)):
+        return {"$grid": rows}
+    return None
+
+
+def _pack(value):
+    if isinstance(value, dict):
+        return {key: _pack(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        grid = _pack_grid(value)
+        if grid is not None:
+            return grid
+        return [_pack(item) for item in value]
+    return value
+
+
+def _unpack(obj: dict):
+    if len(obj) == 1 and "$grid" in obj:
+        return [list(row) for row in obj["$grid"]]
+    return obj
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(_pack(value), separators=(",", ":")).encode()
+
+
+def _loads(data: bytes):
+    return json.loads(data, object_hook=_unpack)
+
+
+def encode_request(method: str, params) -> bytes:
+    return _dumps({"method": method, "params": list(params)})
+
+
+def decode_request(data: bytes) -> tuple[str, list]:
+    request = _loads(data)
+    return request["method"], request["params"]
+
+
+def encode_response(result) -> bytes:
+    return _dumps({"result": result})
+
+
+def encode_fault(code: int, message: str) -> bytes:
+    return _dumps({"fault": {"faultCode": code, "faultString": message}})
+
+
+def decode_response(data: bytes):
+    """Returns the result, or raises xmlrpc.client.Fault like an XML-RPC call would."""
+    response = _loads(data)
+    if "fault" in response:
+        raise xmlrpc.client.Fault(response["fault"]["faultCode"],
+                                  response["fault"]["faultString"])
+    return response["result"]
@@ -0,0 +1,187 @@
+# pylint: disable=broad-except,unused-argument,missing-module-docstring,fixme,missing-docstring
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-many-instance-attributes
+# pylint: disable=protected-access,too-few-public-methods
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import zlib
+from multiprocessing.connection import wait
+from typing import Callable
+
+from logs import get_logger
+
+log = get_logger("workers")
+
+# RPCs whose first parameter is a game_id, handled by the worker process that owns the game
+GAME_METHODS = {
+    "get_state", "get_state_since", "wait_for_change", "fire", "fire_and_get_state_since",
+    "quit", "host_game", "new_game",
+}
+
+# RPCs every worker answers itself, they only read the shared statistics database
+# or the worker's own metrics. Everything else (the lobby, the cluster membership,
+# replication) is handled by worker 0.
+SHARED_METHODS = {"get_statistics", "get_leaderboard", "get_player_rank",
+                  "get_statistics_changes", "get_metrics"}
+
+
+class WorkerGroup:
+    """One worker process's view of the worker processes of a server.
+
+    Every worker accepts client connections on its own public socket, all bound to the
+    server's port with SO_REUSEPORT so the kernel spreads the connections over the
+    workers, and calls from the other workers on a private socket on 127.0.0.1.
+    A game is owned by the worker its game_id hashes to, calls for it that arrive at
+    another worker are forwarded to the owner's private socket. Worker 0 (the primary)
+    also runs the lobby, takes part in the cluster and replicates the statistics of all
+    workers, which share one database file.
+
+    If every worker also has a port of its own (direct_addresses are their public
+    addresses), replies for a game carry the address of the worker that owns it,
+    so clients send their next calls for the game straight there."""
+
+    def __init__(self, index: int, public_sockets: list[socket.socket],
+                 private_sockets: list[socket.socket], loads,
+                 direct_addresses: list[str] | None = None):
+        self.index = index
+        # the server's port, and the worker's own port if it has one
+        self.public_sockets = public_sockets
+        self.private_socket = private_sockets[index]
+        self.addresses = [f"http://127.0.0.1:{sock.getsockname()[1]}"
+                          for sock in private_sockets]
+        self.direct_addresses = direct_addresses or []
+        # [games, rpc_rate] of every worker in shared memory, see share_load()
+        self.loads = loads
+        # created in the parent process before the worker is forked
+        self.parent_pid = os.getpid()
+
+    @property
+    def is_primary(self) -> bool:
+        return self.index == 0
+
+    @property
+    def address(self) -> str:
+        return self.addresses[self.index]
+
+    @property
+    def primary(self) -> str:
+        return self.addresses[0]
+
+    def others(self) -> list[str]:
+        return [address for address in self.addresses if address != self.address]
+
+    def owner_of(self, game_id) -> str:
+        """Returns the private address of the worker that owns game_id."""
+        return self.addresses[self._owner_index(game_id)]
+
+    def direct_address_of(self, game_id) -> str | None:
+        """Returns the public address of the worker that owns game_id,
+        or None if the workers don't have ports of their own."""
+        if not self.direct_addresses:
+            return None
+        return self.direct_addresses[self._owner_index(game_id)]
+
+    def _owner_index(self, game_id) -> int:
+        return zlib.crc32(str(game_id).encode()) % len(self.addresses)
+
+    def route(self, method: str, params, internal: bool, hosted: Callable) -> str | None:
+        """Returns the private address of the worker that has to handle the call, or None
+        if this one does. internal is True for calls from other workers, which are never
+        sent on to a third worker except to the primary. hosted(game_id) tells whether
+        this worker knows where the game is."""
+        if method in GAME_METHODS:
+            if not params or params[0] is None or hosted(params[0]):
+                return None
+            owner = self.owner_of(params[0])
+            if not internal and owner != self.address:
+                return owner
+            if method == "host_game":
+                return None
+            # games their owner doesn't have are waiting in the lobby or were placed
+            # on another server, which only the primary knows about
+            return None if self.is_primary else self.primary
+        if internal or self.is_primary or method in SHARED_METHODS:
+            return None
+        return self.primary
+
+    def tag_owner(self, method: str, params, result):
+        """Adds the public address of the worker that owns the game to replies of game
+        RPCs, like replies for games hosted on another server carry that server's address."""
+        if (self.direct_addresses and method in GAME_METHODS and params
+                and isinstance(result, dict) and "owner" not in result):
+            return {**result, "owner": self.direct_address_of(params[0])}
+        return result
+
+    def share_load(self, load: dict) -> dict:
+        """Publishes this worker's load and returns the load of the whole server."""
+        self.loads[2 * self.index] = load["games"]
+        self.loads[2 * self.index + 1] = load["rpc_rate"]
+        return {"games": int(sum(self.loads[0::2])), "rpc_rate": sum(self.loads[1::2])}
+
+    def check_parent(self) -> None:
+        """Shuts this worker down like Ctrl+C would if the parent process has exited."""
+        if os.getppid() != self.parent_pid:
+            os.kill(os.getpid(), signal.SIGINT)
+
+
+class InternalCalls:
+    """Registered on a worker's private socket, so calls from the other workers reach
+    GameServer._dispatch marked as internal."""
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def _dispatch(self, method: str, params):
+        return self.instance._dispatch(method, params, internal=True)
+
+
+def run_workers(address: tuple[str, int], count: int, serve: Callable,
+                direct_ports: list[int] | None = None,
+                direct_addresses: list[str] | None = None) -> None:
+    """Binds the sockets of count workers, forks a process for each that calls
+    serve(WorkerGroup) and restarts workers that exit, until interrupted.
+    With direct_ports, worker i also listens on direct_ports[i], which clients reach
+    at direct_addresses[i] (by default http://localhost:<port>)."""
+    context = multiprocessing.get_context("fork")
+    public_sockets = [[socket.create_server(address, backlog=4096, reuse_port=True)]
+                      for _ in range(count)]
+    if direct_ports:
+        if len(direct_ports) != count:
+            raise ValueError(f"{count} workers need {count} ports, got {direct_ports}")
+        for sockets, port in zip(public_sockets, direct_ports):
+            sockets.append(socket.create_server((address[0], port), backlog=4096))
+        direct_addresses = direct_addresses or [f"http://localhost:{port}"
+                                                for port in direct_ports]
+    private_sockets = [socket.create_server(("127.0.0.1", 0), backlog=4096)
+                       for _ in range(count)]
+    loads = context.RawArray("d", 2 * count)
+
+    def start(index: int):
+        group = WorkerGroup(index, public_sockets[index], private_sockets, loads,
+                            direct_addresses if direct_ports else None)
+        process = context.Process(target=serve, args=(group,), name=f"worker-{index}")
+        process.start()
+        return process
+
+    processes = [start(index) for index in range(count)]
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            wait([process.sentinel for process in processes])
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    log.warning("Worker %d exited with code %s, restarting it...",
+                                index, process.exitcode)
+                    # the listening sockets stay open, so connections wait in the backlog
+                    time.sleep(1)
+                    processes[index] = start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()